@@ -1,7 +1,9 @@
 import requests
-import time
+import threading
 import os
 from dotenv import load_dotenv
+from http_client import HttpClient
+from awx_events import JobStatusWatcher
 
 # Load environment variables from .env file
 load_dotenv()
@@ -12,40 +14,83 @@ AWX_TOKEN = os.getenv("AWX_TOKEN").strip()
 PROJECT_ID = int(os.getenv("PROJECT_ID"))
 INVENTORY_ID = int(os.getenv("INVENTORY_ID"))
 
+# Shared job template that runs any playbook passed as an extra variable
+RUNNER_TEMPLATE_NAME = os.getenv("AWX_RUNNER_TEMPLATE") or "Wrangler Playbook Runner"
+RUNNER_PLAYBOOK = os.getenv("AWX_RUNNER_PLAYBOOK") or "wrangler_run.yml"
+RUNNER_LAUNCH_PROMPTS = {
+    "ask_variables_on_launch": True,
+    "ask_credential_on_launch": True,
+    "ask_limit_on_launch": True,
+}
+
 # Headers for authentication
 headers = {
     "Authorization": f"Bearer {AWX_TOKEN}",
     "Content-Type": "application/json"
 }
 
+# Pooled, retrying session shared by every AWX call
+client = HttpClient("awx", AWX_URL, headers=headers)
+
+# Shared tracker for job and project update completion, started on first use
+_watcher = None
+_watcher_lock = threading.Lock()
+
+def get_job_watcher():
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = JobStatusWatcher(client, AWX_URL).start()
+    return _watcher
+
+# Local cache of template name -> id and template id -> associated credential ids.
+# Entries are filled lazily and dropped when AWX answers 404 or 409 for them.
+_template_ids = {}
+_template_credentials = {}
+_template_lock = threading.Lock()
+
+def invalidate_job_template(job_template_id):
+    with _template_lock:
+        _template_credentials.pop(job_template_id, None)
+        for name, cached_id in list(_template_ids.items()):
+            if cached_id == job_template_id:
+                del _template_ids[name]
+
+def _is_stale(response):
+    return response.status_code in (404, 409)
+
+def _cache_credentials(job_template_id, credentials):
+    with _template_lock:
+        _template_credentials[job_template_id] = {cred['id'] for cred in credentials}
+
 def trigger_project_update(project_id):
     print(f"\nTriggering project update for Project ID: {project_id}")
-    response = requests.post(f"{AWX_URL}/projects/{project_id}/update/", headers=headers)
+    response = client.post(f"/projects/{project_id}/update/")
     response.raise_for_status()
     update_id = response.json()['id']
     # Wait for the project update to complete
-    while True:
-        update_response = requests.get(f"{AWX_URL}/project_updates/{update_id}/", headers=headers)
-        update_response.raise_for_status()
-        status = update_response.json()['status']
-        if status in ['successful', 'failed', 'error', 'canceled']:
-            print(f"Project update completed with status: {status}")
-            if status != 'successful':
-                raise Exception(f"Project update failed with status: {status}")
-            break
-        print(f"Project update status: {status}...")
-        time.sleep(5)  # poll every 5 seconds
+    status = get_job_watcher().wait("project_update", update_id)
+    print(f"Project update completed with status: {status}")
+    if status != 'successful':
+        raise Exception(f"Project update failed with status: {status}")
 
-def get_job_template_id_by_name(name):
+def _find_job_template(name):
     params = {'name': name}
-    response = requests.get(f"{AWX_URL}/job_templates/", headers=headers, params=params)
-    print(response.json())
+    response = client.get("/job_templates/", params=params)
     response.raise_for_status()
     results = response.json()['results']
-    if results:
-        return results[0]['id']
-    else:
+    return results[0] if results else None
+
+def get_job_template_id_by_name(name):
+    with _template_lock:
+        if name in _template_ids:
+            return _template_ids[name]
+    template = _find_job_template(name)
+    if template is None:
         return None
+    with _template_lock:
+        _template_ids[name] = template['id']
+    return template['id']
 
 def create_job_template(playbook_name, ssh_credential_id):
     """
@@ -69,9 +114,11 @@ def create_job_template(playbook_name, ssh_credential_id):
     print(f"Request Payload: {job_template_data}")
 
     try:
-        response = requests.post(f"{AWX_URL}/job_templates/", headers=headers, json=job_template_data)
+        response = client.post("/job_templates/", json=job_template_data)
         response.raise_for_status()
         job_template_id = response.json()['id']
+        with _template_lock:
+            _template_ids[job_template_name] = job_template_id
         associate_credentials_with_template(job_template_id, ssh_credential_id)
         return job_template_id
     except requests.exceptions.HTTPError as e:
@@ -92,39 +139,86 @@ def launch_job(job_template_id, ssh_credential_id, limit=None):
 
     print(f"Payload for job launch: {payload}")
 
-    response = requests.post(
-        f"{AWX_URL}/job_templates/{job_template_id}/launch/",
-        headers=headers,
-        json=payload
-    )
+    response = client.post(f"/job_templates/{job_template_id}/launch/", json=payload)
     response.raise_for_status()
     return response.json()['job']
 
+def get_runner_job_template():
+    """
+    Returns the ID of the shared runner job template, creating it (or enabling its
+    launch-time prompts) on first use.
+    """
+    with _template_lock:
+        if RUNNER_TEMPLATE_NAME in _template_ids:
+            return _template_ids[RUNNER_TEMPLATE_NAME]
+
+    template = _find_job_template(RUNNER_TEMPLATE_NAME)
+    if template is None:
+        job_template_data = {
+            "name": RUNNER_TEMPLATE_NAME,
+            "job_type": "run",
+            "inventory": INVENTORY_ID,
+            "project": PROJECT_ID,
+            "playbook": RUNNER_PLAYBOOK,
+            **RUNNER_LAUNCH_PROMPTS,
+        }
+        print(f"\nCreating runner job template: {job_template_data}")
+        response = client.post("/job_templates/", json=job_template_data)
+        response.raise_for_status()
+        template = response.json()
+    elif any(template.get(prompt) != value for prompt, value in RUNNER_LAUNCH_PROMPTS.items()):
+        print(f"\nEnabling launch-time prompts on job template ID: {template['id']}")
+        response = client.patch(f"/job_templates/{template['id']}/", json=RUNNER_LAUNCH_PROMPTS)
+        response.raise_for_status()
+
+    with _template_lock:
+        _template_ids[RUNNER_TEMPLATE_NAME] = template['id']
+    return template['id']
+
+def launch_playbook(playbook_name, ssh_credential_id, limit=None):
+    """
+    Launches `playbook_name` (relative to the project root) through the shared runner
+    job template. Once the template ID is cached this is a single launch call.
+    """
+    payload = {
+        "credentials": [ssh_credential_id],
+        "extra_vars": {"wrangler_playbook": playbook_name},
+    }
+    if limit:
+        payload["limit"] = limit
+
+    for attempt in range(2):
+        job_template_id = get_runner_job_template()
+        print(f"\nLaunching {playbook_name} using Job Template ID: {job_template_id}")
+        response = client.post(f"/job_templates/{job_template_id}/launch/", json=payload)
+        if _is_stale(response) and attempt == 0:
+            print(f"Job template ID {job_template_id} is stale. Looking it up again...")
+            invalidate_job_template(job_template_id)
+            continue
+        response.raise_for_status()
+        return response.json()['job']
+
 def track_job(job_id):
     """
     Tracks the job status until completion.
     """
     print(f"\nTracking Job ID: {job_id}")
-    while True:
-        response = requests.get(f"{AWX_URL}/jobs/{job_id}/", headers=headers)
-        response.raise_for_status()
-        status = response.json()['status']
-        if status in ['successful', 'failed', 'error', 'canceled']:
-            return status
-        print(f"Job status: {status}...")
-        time.sleep(5)  # poll every 5 seconds
+    return get_job_watcher().wait("job", job_id)
 
 def associate_credentials_with_template(job_template_id, ssh_credential_id):
     """
     Associates an SSH credential with the given job template ID.
     If a machine credential already exists, it skips or replaces it.
     """
+    with _template_lock:
+        if ssh_credential_id in _template_credentials.get(job_template_id, ()):
+            return
+
     # Get existing credentials for the job template
     print(f"Fetching existing credentials for Job Template ID: {job_template_id}")
-    response = requests.get(
-        f"{AWX_URL}/job_templates/{job_template_id}/credentials/",
-        headers=headers
-    )
+    response = client.get(f"/job_templates/{job_template_id}/credentials/")
+    if _is_stale(response):
+        invalidate_job_template(job_template_id)
     response.raise_for_status()
     existing_credentials = response.json()
 
@@ -138,15 +232,14 @@ def associate_credentials_with_template(job_template_id, ssh_credential_id):
         existing_cred_id = machine_credentials[0]['id']
         if existing_cred_id == ssh_credential_id:
             print(f"SSH credential (ID: {ssh_credential_id}) is already associated with Job Template ID: {job_template_id}. Skipping...")
+            _cache_credentials(job_template_id, existing_credentials['results'])
             return
         else:
             print(f"Removing existing SSH credential (ID: {existing_cred_id})...")
             disassociate_payload = {"disassociate": True, "id": existing_cred_id}
-            response = requests.post(
-                f"{AWX_URL}/job_templates/{job_template_id}/credentials/",
-                headers=headers,
-                json=disassociate_payload
-            )
+            response = client.post(f"/job_templates/{job_template_id}/credentials/", json=disassociate_payload)
+            if _is_stale(response):
+                invalidate_job_template(job_template_id)
             if response.status_code != 204:
                 print(f"Failed to disassociate credentials. Status: {response.status_code}")
                 print(f"Response: {response.text}")
@@ -156,14 +249,14 @@ def associate_credentials_with_template(job_template_id, ssh_credential_id):
     # Associate the new SSH credential
     print(f"Associating SSH credential (ID: {ssh_credential_id}) with Job Template ID: {job_template_id}...")
     associate_payload = {"associate": True, "id": ssh_credential_id}
-    response = requests.post(
-        f"{AWX_URL}/job_templates/{job_template_id}/credentials/",
-        headers=headers,
-        json=associate_payload
-    )
+    response = client.post(f"/job_templates/{job_template_id}/credentials/", json=associate_payload)
     if response.status_code in [200, 204]:
         print(f"Successfully associated SSH credential (ID: {ssh_credential_id}) with Job Template (ID: {job_template_id}).")
+        with _template_lock:
+            _template_credentials[job_template_id] = {ssh_credential_id}
     else:
+        if _is_stale(response):
+            invalidate_job_template(job_template_id)
         print(f"Failed to associate credentials. Status: {response.status_code}")
         print(f"Response: {response.text}")
         raise Exception("Error associating credentials with job template.")
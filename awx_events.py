@@ -0,0 +1,304 @@
+"""
+Event-driven completion tracking for AWX jobs and project updates.
+
+A single `JobStatusWatcher` tracks every outstanding job and project update
+and resolves a future for each as soon as it reaches a final status. Status
+changes arrive from up to three sources:
+
+- AWX's websocket (`/websocket/`, "jobs" group `status_changed` events),
+  when the optional `websocket-client` package is installed and
+  AWX_USERNAME / AWX_PASSWORD are set. AWX's websocket consumer only accepts
+  session logins, so the watcher logs in through `/api/login/` like the UI,
+  connects with the session cookies and subscribes with the CSRF token as
+  its `xrftoken`. The channel only counts as connected once AWX acknowledges
+  the subscription. One connection serves all outstanding jobs.
+- A local HTTP listener for AWX webhook notifications (AWX_WEBHOOK_PORT).
+  Point a webhook notification template at `http://<host>:<port>/`, send
+  AWX_WEBHOOK_TOKEN in its X-Wrangler-Token header and attach it to the job
+  templates and the project. The listener refuses to start without a token,
+  since any notification it accepts can close an incident.
+- Polling of the `/jobs/?id__in=` and `/project_updates/?id__in=` list
+  endpoints, one request for all outstanding ids. Polling backs off from
+  AWX_POLL_MIN to AWX_POLL_MAX seconds while nothing finishes and stays at
+  AWX_POLL_MAX as a safety net while the websocket is connected. It also
+  waits out any rate-limit window AWX reports.
+"""
+
+import hmac
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import requests
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+AWX_POLL_MIN = float(os.getenv("AWX_POLL_MIN", "1"))                  # Seconds between polls right after a change
+AWX_POLL_MAX = float(os.getenv("AWX_POLL_MAX", "15"))                 # Upper bound on the polling interval
+AWX_POLL_BACKOFF = 1.5                                                # Interval growth per poll without a change
+AWX_POLL_IDS_PER_REQUEST = 100                                        # Ids per id__in query (URL length)
+AWX_WEBSOCKET = os.getenv("AWX_WEBSOCKET", "true").lower() == "true"  # Subscribe to AWX's websocket if available
+AWX_WEBSOCKET_URL = os.getenv("AWX_WEBSOCKET_URL")                    # Defaults to <AWX host>/websocket/
+AWX_USERNAME = os.getenv("AWX_USERNAME")                              # Session login for the websocket
+AWX_PASSWORD = os.getenv("AWX_PASSWORD")
+AWX_LOGIN_TIMEOUT = 10                                                # Seconds per login request
+AWX_WEBHOOK_HOST = os.getenv("AWX_WEBHOOK_HOST", "0.0.0.0")           # Interface the webhook listener binds to
+AWX_WEBHOOK_PORT = os.getenv("AWX_WEBHOOK_PORT")                      # Port of the webhook listener (disabled if unset)
+AWX_WEBHOOK_TOKEN = os.getenv("AWX_WEBHOOK_TOKEN")                    # Required X-Wrangler-Token header value
+
+TERMINAL_STATUSES = {'successful', 'failed', 'error', 'canceled'}
+LIST_ENDPOINTS = {"job": "/jobs/", "project_update": "/project_updates/"}
+JOB_EVENTS_GROUP = "jobs-status_changed"
+
+
+def awx_host_url(awx_url):
+    parsed = urlparse(awx_url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+def default_websocket_url(awx_url):
+    """
+    Derive the websocket URL from the API URL (e.g. http://awx/api/v2 -> ws://awx/websocket/).
+    """
+    parsed = urlparse(awx_url)
+    scheme = "wss" if parsed.scheme == "https" else "ws"
+    return f"{scheme}://{parsed.netloc}/websocket/"
+
+
+class JobStatusWatcher:
+    """
+    Track many AWX jobs and project updates over shared event and polling channels.
+    """
+
+    def __init__(self, client, awx_url, use_websocket=AWX_WEBSOCKET, websocket_url=AWX_WEBSOCKET_URL,
+                 username=AWX_USERNAME, password=AWX_PASSWORD, webhook_host=AWX_WEBHOOK_HOST,
+                 webhook_port=AWX_WEBHOOK_PORT, webhook_token=AWX_WEBHOOK_TOKEN, poll_min=AWX_POLL_MIN,
+                 poll_max=AWX_POLL_MAX):
+        self.client = client
+        self.awx_url = awx_url
+        self.username = username
+        self.password = password
+        self.use_websocket = use_websocket and websocket is not None and bool(username and password)
+        self.websocket_url = websocket_url or default_websocket_url(awx_url)
+        self.webhook_host = webhook_host
+        self.webhook_port = int(webhook_port) if webhook_port not in (None, "") else None
+        self.webhook_token = webhook_token
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+        self.websocket_connected = False
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._websocket_app = None
+        self._xrftoken = None
+        self._webhook_server = None
+        self._threads = []
+
+    def start(self):
+        self._spawn(self._poll_loop, "awx-poll")
+        if self.use_websocket:
+            self._spawn(self._websocket_loop, "awx-websocket")
+        elif websocket is None:
+            print("websocket-client is not installed. Tracking AWX jobs by polling only.")
+        elif not (self.username and self.password):
+            print("AWX_USERNAME and AWX_PASSWORD are not set. Tracking AWX jobs by polling only.")
+        if self.webhook_port is not None and not self.webhook_token:
+            print("AWX_WEBHOOK_PORT is set without AWX_WEBHOOK_TOKEN. Not starting the AWX webhook listener.")
+        elif self.webhook_port is not None:
+            self._start_webhook_listener()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._websocket_app is not None:
+            self._websocket_app.close()
+        if self._webhook_server is not None:
+            self._webhook_server.shutdown()
+
+    def _spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def watch(self, kind, job_id):
+        """
+        Return a future resolved with the final status of job `job_id`.
+
+        Args:
+            kind (str): "job" or "project_update".
+            job_id (int): AWX id of the job or project update.
+        """
+        key = (kind, int(job_id))
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = Future()
+        # Poll right away in case the job finished before we subscribed.
+        self._wake.set()
+        return future
+
+    def wait(self, kind, job_id, timeout=None):
+        return self.watch(kind, job_id).result(timeout)
+
+    def _resolve(self, kind, job_id, status, source):
+        if status not in TERMINAL_STATUSES:
+            return False
+        with self._lock:
+            future = self._pending.pop((kind, int(job_id)), None)
+        if future is None:
+            return False
+        print(f"AWX {kind} {job_id} finished with status '{status}' (via {source}).")
+        future.set_result(status)
+        return True
+
+    def _resolve_unified(self, job_id, status, source):
+        """
+        Resolve whichever watched job or project update has `job_id`. Unified
+        job ids are unique across kinds, and notification bodies only carry
+        the kind in a UI URL (#/jobs/playbook/<id>, #/jobs/project/<id>).
+        """
+        with self._lock:
+            kinds = [kind for kind, pending_id in self._pending if pending_id == int(job_id)]
+        return any([self._resolve(kind, job_id, status, source) for kind in kinds])
+
+    def _poll_loop(self):
+        interval = self.poll_min
+        while not self._stop.is_set():
+            woken = self._wake.wait(interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            if woken:
+                interval = self.poll_min
+            try:
+                changed = self._poll_once()
+            except Exception as e:
+                print(f"Error polling AWX job status: {e}")
+                changed = False
+            if self.websocket_connected:
+                interval = self.poll_max
+            elif changed:
+                interval = self.poll_min
+            else:
+                interval = min(interval * AWX_POLL_BACKOFF, self.poll_max)
+            interval = max(interval, self.client.rate_limit_delay())
+
+    def _poll_once(self):
+        with self._lock:
+            pending = list(self._pending)
+        changed = False
+        for kind, endpoint in LIST_ENDPOINTS.items():
+            ids = sorted(job_id for pending_kind, job_id in pending if pending_kind == kind)
+            for start in range(0, len(ids), AWX_POLL_IDS_PER_REQUEST):
+                chunk = ids[start:start + AWX_POLL_IDS_PER_REQUEST]
+                response = self.client.get(endpoint, params={
+                    "id__in": ",".join(str(job_id) for job_id in chunk),
+                    "page_size": len(chunk),
+                })
+                response.raise_for_status()
+                for result in response.json()['results']:
+                    changed |= self._resolve(kind, result['id'], result['status'], "polling")
+        return changed
+
+    def _login(self):
+        """
+        Log in through /api/login/ the way the AWX UI does and return the
+        session cookies.
+        """
+        login_url = f"{awx_host_url(self.awx_url)}/api/login/"
+        with requests.Session() as session:
+            session.get(login_url, timeout=AWX_LOGIN_TIMEOUT).raise_for_status()
+            response = session.post(
+                login_url,
+                data={"username": self.username, "password": self.password, "next": "/api/"},
+                headers={"X-CSRFToken": session.cookies.get("csrftoken", ""), "Referer": login_url},
+                allow_redirects=False,
+                timeout=AWX_LOGIN_TIMEOUT,
+            )
+            cookies = session.cookies.get_dict()
+        if "sessionid" not in cookies or "csrftoken" not in cookies:
+            raise ValueError(f"login as '{self.username}' was rejected (HTTP {response.status_code})")
+        return cookies
+
+    def _websocket_loop(self):
+        delay = self.poll_min
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                cookies = self._login()
+                # Django rotates the CSRF token on login; the consumer compares against the new one
+                self._xrftoken = cookies["csrftoken"]
+                self._websocket_app = websocket.WebSocketApp(
+                    self.websocket_url,
+                    cookie="; ".join(f"{name}={value}" for name, value in cookies.items()),
+                    on_message=self._on_websocket_message,
+                )
+                self._websocket_app.run_forever(ping_interval=30, ping_timeout=10)
+            except Exception as e:
+                print(f"AWX websocket error: {e}")
+            if self.websocket_connected:
+                print("AWX websocket disconnected. Falling back to polling.")
+            self.websocket_connected = False
+            self._wake.set()
+            delay = self.poll_min if time.monotonic() - started > self.poll_max else min(delay * 2, 60)
+            self._stop.wait(delay)
+
+    def _on_websocket_message(self, app, message):
+        try:
+            event = json.loads(message)
+        except ValueError:
+            return
+        if event.get("accept"):
+            app.send(json.dumps({"xrftoken": self._xrftoken, "groups": {"jobs": ["status_changed"]}}))
+            return
+        if "groups_current" in event:
+            self.websocket_connected = JOB_EVENTS_GROUP in event["groups_current"]
+            if self.websocket_connected:
+                print(f"Subscribed to AWX job events at {self.websocket_url}")
+                # Catch anything that finished while we were disconnected.
+                self._wake.set()
+            return
+        if event.get("close") or "error" in event:
+            print(f"AWX websocket refused the connection: {event.get('error', 'not authenticated')}")
+            app.close()
+            return
+        if event.get("group_name") != "jobs" or "unified_job_id" not in event:
+            return
+        kind = event.get("type")
+        if kind in LIST_ENDPOINTS:
+            self._resolve(kind, event["unified_job_id"], event.get("status"), "websocket")
+
+    def _start_webhook_listener(self):
+        watcher = self
+
+        class WebhookHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                token = self.headers.get("X-Wrangler-Token", "").encode('utf-8')
+                if not hmac.compare_digest(token, watcher.webhook_token.encode('utf-8')):
+                    self.send_response(403)
+                    self.end_headers()
+                    return
+                try:
+                    body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    watcher._resolve_unified(body["id"], body.get("status"), "webhook")
+                except (ValueError, KeyError, TypeError) as e:
+                    print(f"Ignoring malformed AWX notification: {e}")
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._webhook_server = ThreadingHTTPServer((self.webhook_host, self.webhook_port), WebhookHandler)
+        self.webhook_port = self._webhook_server.server_address[1]
+        self._spawn(self._webhook_server.serve_forever, "awx-webhook")
+        print(f"Listening for AWX notifications on {self.webhook_host}:{self.webhook_port}")
@@ -0,0 +1,369 @@
+"""
+Retrieval benchmark and latency regression check.
+
+Builds indexes of increasing synthetic size from the playbooks in
+existing_playbooks/ and wrangler_out/, and measures for each size:
+
+- index build time and the size of the index artifacts,
+- resident memory added by loading the retrieval system,
+- p50/p95/p99 latency and throughput of single and batched queries,
+- recall@k against a labelled query set.
+
+Synthetic corpora are made of "families": each seed playbook plus variants
+with shuffled task order and renamed host groups. Queries come from
+benchmarks/incident_queries.jsonl. They are paraphrased incident descriptions
+labelled with the seed playbooks that resolve them, so they share intent
+rather than exact wording with the indexed chunk text. A query counts as
+answered when any member of a relevant family is retrieved, and is skipped
+at corpus sizes that contain none of them. More labelled queries can be
+added with --queries (JSON lines of {"query": ..., "relevant": [file names]}).
+
+Results are written as JSON. Pass --baseline with the output of an earlier
+commit to print the differences, and --max-regression to fail on them.
+
+Usage:
+    python benchmarks/retrieval_benchmark.py --sizes 100,500,2000 --index-type auto
+    python benchmarks/retrieval_benchmark.py --baseline benchmarks/results/retrieval-<sha>.json
+"""
+
+import argparse
+import contextlib
+import copy
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+# Access parent directory
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(parent_dir))
+
+import llama_interface
+from playbook_chunker import TASK_SECTIONS, load_yaml
+from playbook_ingest import parse_playbook
+from query_cache import QueryCache
+
+SEED_DIRS = ('existing_playbooks', 'wrangler_out')
+RESULTS_DIR = parent_dir / 'benchmarks' / 'results'
+RECALL_KS = (1, 3, 10)
+INCIDENT_QUERIES_PATH = parent_dir / 'benchmarks' / 'incident_queries.jsonl'  # Default labelled query set
+WARMUP_QUERIES = 5
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=parent_dir, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=parent_dir,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def _rss_bytes():
+    """
+    Return the resident set size of this process (Linux only), or None.
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _content_key(content):
+    return hashlib.sha256(content.strip().encode('utf-8')).hexdigest()
+
+
+def load_seeds():
+    """
+    Return [(family name, source dir, content, plays)] for every valid seed playbook.
+    """
+    seeds = []
+    for source in SEED_DIRS:
+        directory = parent_dir / source
+        if not directory.is_dir():
+            continue
+        for filename in sorted(os.listdir(directory)):
+            try:
+                content = (directory / filename).read_text(encoding='utf-8')
+            except (OSError, UnicodeDecodeError):
+                continue
+            if parse_playbook(content)["error"]:
+                continue
+            seeds.append((f"{source}_{filename}", source, content, load_yaml(content)))
+    return seeds
+
+
+def make_variant(plays, variant):
+    """
+    Return a distinct but similar copy of a playbook: shuffled tasks and renamed host groups.
+    """
+    rng = random.Random(variant)
+    plays = copy.deepcopy(plays)
+    for play in plays:
+        if isinstance(play.get('hosts'), str):
+            play['hosts'] = f"{play['hosts']}_{variant}"
+        for section in TASK_SECTIONS:
+            if isinstance(play.get(section), list):
+                rng.shuffle(play[section])
+    return "---\n" + yaml.safe_dump(plays, sort_keys=False, default_flow_style=False)
+
+
+def write_corpus(seeds, size, playbooks_dir):
+    """
+    Write `size` playbooks made of seed families into playbooks_dir.
+
+    Returns:
+        dict: Content key -> set of family names, to label retrieved documents.
+    """
+    os.makedirs(playbooks_dir, exist_ok=True)
+    families = {}
+    for n in range(size):
+        family, _, content, plays = seeds[n % len(seeds)]
+        variant = n // len(seeds)
+        if variant:
+            content = make_variant(plays, variant)
+        filename = f"v{variant:04d}_{family}"
+        if not filename.endswith(('.yml', '.yaml')):
+            filename += ".yml"
+        with open(os.path.join(playbooks_dir, filename), 'w', encoding='utf-8') as f:
+            f.write(content)
+        families.setdefault(_content_key(content), set()).add(family)
+    return families
+
+
+def _read_queries(path, source):
+    queries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                labelled = json.loads(line)
+                relevant = {f"{seed_dir}_{name}" for name in labelled["relevant"] for seed_dir in SEED_DIRS}
+                queries.append({"query": labelled["query"], "relevant": relevant, "source": source})
+    return queries
+
+
+def build_queries(seeds, size, queries_file=None):
+    """
+    Return [{"query", "relevant": set of family names, "source"}] for the
+    labelled queries with a relevant seed present at this size.
+    """
+    queries = _read_queries(INCIDENT_QUERIES_PATH, "incident")
+    if queries_file:
+        queries.extend(_read_queries(queries_file, "labelled"))
+    present = {family for family, _, _, _ in seeds[:size]}
+    return [query for query in queries if query["relevant"] & present]
+
+
+def _percentiles(samples):
+    samples = np.asarray(samples) * 1000.0
+    return {
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "mean_ms": float(samples.mean()),
+    }
+
+
+def measure_queries(queries, families, top_k, batch_size):
+    """
+    Time single and batched retrieval and compute recall@k.
+    """
+    texts = [query["query"] for query in queries]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        llama_interface.retrieve_playbooks_batch(texts[:WARMUP_QUERIES], top_k=top_k, use_gpu=False)
+
+        latencies = []
+        retrieved = []
+        for text in texts:
+            llama_interface.query_cache = QueryCache(max_entries=0)
+            started = time.perf_counter()
+            retrieved.append(llama_interface.retrieve_playbooks(text, top_k=top_k, use_gpu=False))
+            latencies.append(time.perf_counter() - started)
+
+        batch_latencies = []
+        llama_interface.query_cache = QueryCache(max_entries=0)
+        batched_started = time.perf_counter()
+        for start in range(0, len(texts), batch_size):
+            started = time.perf_counter()
+            llama_interface.retrieve_playbooks_batch(texts[start:start + batch_size], top_k=top_k, use_gpu=False)
+            batch_latencies.append(time.perf_counter() - started)
+        batched_seconds = time.perf_counter() - batched_started
+
+    hits = {k: [] for k in RECALL_KS}
+    by_source = {}
+    for query, documents in zip(queries, retrieved):
+        found = [families.get(_content_key(document), set()) for document in documents]
+        for k in RECALL_KS:
+            hit = any(query["relevant"] & labels for labels in found[:k])
+            hits[k].append(hit)
+            by_source.setdefault(query["source"], {}).setdefault(k, []).append(hit)
+
+    return {
+        "queries": len(texts),
+        "single": dict(_percentiles(latencies), throughput_qps=len(texts) / sum(latencies)),
+        "batched": dict(_percentiles(batch_latencies), batch_size=batch_size,
+                        throughput_qps=len(texts) / batched_seconds),
+        "recall": {f"@{k}": float(np.mean(hits[k])) for k in RECALL_KS},
+        "recall_by_source": {source: {f"@{k}": float(np.mean(values)) for k, values in ks.items()}
+                             for source, ks in by_source.items()},
+    }
+
+
+def run_size(seeds, size, work_dir, args):
+    """
+    Build and measure the index of one synthetic corpus size in its own directory.
+    """
+    size_dir = os.path.join(work_dir, f"size_{size}")
+    families = write_corpus(seeds, size, os.path.join(size_dir, llama_interface.PLAYBOOKS_DIR))
+    queries = build_queries(seeds, size, args.queries)
+    if not queries:
+        print(f"No labelled query has a relevant playbook in a corpus of {size}. Use a larger size.")
+        sys.exit(1)
+    cwd = os.getcwd()
+    os.chdir(size_dir)
+    try:
+        print(f"Building index for {size} playbooks...")
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stderr):
+            llama_interface.create_faiss_index(use_gpu=False, full_rebuild=True, workers=args.workers,
+                                               index_type=args.index_type)
+        build_seconds = time.perf_counter() - started
+
+        rss_before = _rss_bytes()
+        with contextlib.redirect_stdout(sys.stderr):
+            llama_interface.load_retrieval_system(use_gpu=False)
+        rss_after = _rss_bytes()
+        artifacts = {
+            path: os.path.getsize(path)
+            for path in (llama_interface.FAISS_INDEX_PATH, llama_interface.CHUNK_MAP_PATH,
+                         llama_interface.LEXICAL_INDEX_PATH, llama_interface.DOCUMENTS_PATH,
+                         llama_interface.DOCUMENTS_INDEX_PATH)
+            if os.path.exists(path)
+        }
+        print(f"Running {len(queries)} queries...")
+        result = {
+            "size": size,
+            "index_type": llama_interface.index_meta.get("index_type"),
+            "vectors": int(llama_interface.index_cpu.ntotal),
+            "build_seconds": build_seconds,
+            "index_bytes": artifacts.get(llama_interface.FAISS_INDEX_PATH),
+            "artifact_bytes": artifacts,
+            "load_rss_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+        }
+        result.update(measure_queries(queries, families, max(RECALL_KS), args.batch_size))
+        return result
+    finally:
+        os.chdir(cwd)
+
+
+def compare(results, baseline, max_regression):
+    """
+    Print the changes against a baseline run. Returns False if any exceeds max_regression.
+    """
+    previous = {entry["size"]: entry for entry in baseline["results"]}
+    ok = True
+    print(f"Compared with {baseline.get('commit') or 'baseline'}:")
+    for entry in results["results"]:
+        before = previous.get(entry["size"])
+        if before is None:
+            continue
+        checks = [
+            ("single p95 latency", before["single"]["p95_ms"], entry["single"]["p95_ms"], True),
+            ("batched throughput", before["batched"]["throughput_qps"], entry["batched"]["throughput_qps"], False),
+            ("build time", before["build_seconds"], entry["build_seconds"], True),
+        ]
+        for name, old, new, lower_is_better in checks:
+            change = (new - old) / old if old else 0.0
+            regressed = max_regression is not None and (change > max_regression if lower_is_better
+                                                        else change < -max_regression)
+            ok &= not regressed
+            print(f"  size {entry['size']}: {name} {old:.2f} -> {new:.2f} ({change:+.1%}){' REGRESSION' if regressed else ''}")
+        for k, new in entry["recall"].items():
+            old = before["recall"].get(k)
+            if old is None:
+                continue
+            regressed = max_regression is not None and new < old - 0.01
+            ok &= not regressed
+            print(f"  size {entry['size']}: recall{k} {old:.3f} -> {new:.3f}{' REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark playbook retrieval over synthetic corpora.")
+    parser.add_argument("--sizes", default="100,500,2000", help="comma-separated corpus sizes (playbooks)")
+    parser.add_argument("--index-type", default=None, choices=["auto", "flat", "ivf", "hnsw", "ivfpq"])
+    parser.add_argument("--workers", type=int, default=None, help="embedding processes for index builds")
+    parser.add_argument("--batch-size", type=int, default=16, help="queries per batched retrieval call")
+    parser.add_argument("--queries", default=None, help="extra labelled queries (JSON lines)")
+    parser.add_argument("--output", default=None, help="result file (defaults to benchmarks/results/)")
+    parser.add_argument("--work-dir", default=None, help="where to build the corpora (defaults to a temp dir)")
+    parser.add_argument("--baseline", default=None, help="earlier result file to compare against")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="fail if latency, throughput or build time regress by more than this fraction")
+    args = parser.parse_args()
+
+    seeds = load_seeds()
+    if not seeds:
+        print(f"No valid seed playbooks found in {', '.join(SEED_DIRS)}.")
+        sys.exit(1)
+    print(f"Loaded {len(seeds)} seed playbooks.")
+
+    commit, dirty = _git_commit()
+    results = {
+        "benchmark": "retrieval",
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "platform": {"python": platform.python_version(), "machine": platform.machine(),
+                     "cpus": os.cpu_count(), "faiss": getattr(llama_interface.faiss, "__version__", None)},
+        "config": {"index_type": args.index_type or llama_interface.INDEX_TYPE, "batch_size": args.batch_size,
+                   "lexical_weight": llama_interface.LEXICAL_WEIGHT, "seeds": len(seeds)},
+        "results": [],
+    }
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="wrangler-bench-")
+    try:
+        for size in (int(value) for value in args.sizes.split(",")):
+            results["results"].append(run_size(seeds, size, work_dir, args))
+            entry = results["results"][-1]
+            print(f"size {size}: build {entry['build_seconds']:.1f}s, "
+                  f"single p50/p95/p99 {entry['single']['p50_ms']:.1f}/{entry['single']['p95_ms']:.1f}/"
+                  f"{entry['single']['p99_ms']:.1f} ms, batched {entry['batched']['throughput_qps']:.1f} q/s, "
+                  f"recall {entry['recall']}")
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output
+    if output is None:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        output = RESULTS_DIR / f"retrieval-{(commit or 'unknown')[:12]}{'-dirty' if dirty else ''}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
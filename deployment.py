@@ -0,0 +1,69 @@
+import os
+import threading
+from pathlib import Path
+from dotenv import load_dotenv
+from awx import launch_playbook, track_job, trigger_project_update
+from publisher import PlaybookPublisher
+
+# Load environment variables from .env file
+load_dotenv()
+
+# AWX deployment details
+ssh_credential_id = int(os.getenv("CREDENTIAL_ID"))
+server_limit = os.getenv("SERVER_LIMIT")
+
+# GitHub details
+branch = os.getenv("BRANCH") or "rag_cloud"
+out_directory = os.getenv("OUT_DIRECTORY") or "wrangler_out"
+
+# Shared publisher that batches commits, pushes and AWX project updates
+_publisher = None
+_publisher_lock = threading.Lock()
+
+def get_publisher():
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            project_id = int(os.getenv("PROJECT_ID"))
+            _publisher = PlaybookPublisher(Path.cwd(), branch, lambda: trigger_project_update(project_id))
+    return _publisher
+
+def execute_playbook_on_awx(incident_number, playbook):
+    playbook_filename = f"playbook_{incident_number}.yml"
+    repo_path = Path.cwd()
+    saved_directory = repo_path / out_directory
+    saved_directory.mkdir(parents=True, exist_ok=True)
+    playbook_path = saved_directory / playbook_filename
+
+    try:
+        with playbook_path.open("w", encoding="utf-8") as file:
+            file.write(playbook)
+        print(f"Playbook saved to {playbook_path}")
+    except Exception as e:
+        print(f"Error saving playbook: {e}")
+        return "failed"
+
+    try:
+        print(f"Publishing playbook {playbook_filename} to Git and AWX...")
+        get_publisher().publish(playbook_path, incident_number)
+    except Exception as e:
+        print(f"Error publishing playbook: {e}")
+        return "failed"
+
+    awx_playbook_path = f"{out_directory}/{playbook_filename}"
+    try:
+        print(f"Launching AWX job for playbook: {awx_playbook_path}")
+        job_id = launch_playbook(awx_playbook_path, ssh_credential_id, limit=server_limit)
+        print(f"AWX job launched with ID: {job_id}")
+    except Exception as e:
+        print(f"Error launching AWX job: {e}")
+        return "failed"
+
+    try:
+        print(f"Tracking job ID: {job_id} on AWX...")
+        job_status = track_job(job_id)
+        print(f"AWX job completed with status: {job_status}")
+        return job_status
+    except Exception as e:
+        print(f"Error tracking AWX job: {e}")
+        return "failed"
@@ -0,0 +1,204 @@
+"""
+Memory-mapped document store for indexed playbooks.
+
+Playbook contents live in a single UTF-8 blob file and are located through a
+small (N, 2) int64 array of (offset, length) rows, where the row number is the
+FAISS id of the document. Lookups slice the memory map directly, so only the
+requested playbooks are ever decoded onto the Python heap.
+
+Incremental updates append new contents to the blob and mark removed ids with a
+negative length; `compact_document_store` reclaims the dead bytes.
+"""
+
+import mmap
+import os
+
+import numpy as np
+
+LEGACY_SEPARATOR = "\n---END---\n"
+DELETED = -1                                 # Length marking a removed document
+COMPACT_DEAD_RATIO = 0.5                     # Compact once half of the blob is dead bytes
+
+
+def write_document_store(documents, blob_path, index_path):
+    """
+    Write documents to a blob file plus an offset/length index.
+
+    Args:
+        documents (iterable of str): Document contents in FAISS id order.
+        blob_path (str): Path of the content blob.
+        index_path (str): Path of the offset/length index (.npy).
+
+    Returns:
+        int: Number of documents written.
+    """
+    rows = []
+    offset = 0
+    tmp_blob = f"{blob_path}.tmp"
+    with open(tmp_blob, 'wb') as blob:
+        for doc in documents:
+            data = doc.encode('utf-8')
+            blob.write(data)
+            rows.append((offset, len(data)))
+            offset += len(data)
+
+    os.replace(tmp_blob, blob_path)
+    _save_offsets(np.array(rows, dtype=np.int64).reshape(-1, 2), index_path)
+    return len(rows)
+
+
+def _load_offsets(index_path):
+    if os.path.exists(index_path):
+        return np.load(index_path).reshape(-1, 2)
+    return np.empty((0, 2), dtype=np.int64)
+
+
+def _save_offsets(offsets, index_path):
+    tmp_index = f"{index_path}.tmp.npy"
+    np.save(tmp_index, offsets)
+    os.replace(tmp_index, index_path)
+
+
+class DocumentStoreWriter:
+    """
+    Append-only writer for incremental document store updates.
+
+    New contents are appended to the blob as they arrive and existing rows are
+    left in place, so ids that were not touched keep pointing at the same bytes.
+    The offset index is written once, on `close`.
+    """
+
+    def __init__(self, blob_path, index_path, reset=False):
+        self.blob_path = blob_path
+        self.index_path = index_path
+        # A reset writes a fresh blob next to the old one so readers that still
+        # have the old file mapped never see it truncated underneath them.
+        self._reset = reset
+        if reset:
+            self._offsets = np.empty((0, 2), dtype=np.int64)
+            self._blob = open(f"{blob_path}.tmp", 'wb')
+        else:
+            self._offsets = _load_offsets(index_path)
+            self._blob = open(blob_path, 'ab')
+        self._size = self._offsets.shape[0]
+        self._end = self._blob.tell()
+
+    def _reserve(self, doc_id):
+        if doc_id < self._size:
+            return
+        capacity = self._offsets.shape[0]
+        if doc_id >= capacity:
+            grown = max(doc_id + 1, capacity * 2, 1024)
+            padding = np.full((grown - capacity, 2), DELETED, dtype=np.int64)
+            self._offsets = np.vstack([self._offsets, padding])
+        self._size = doc_id + 1
+
+    def add(self, doc_id, content):
+        data = content.encode('utf-8')
+        self._reserve(doc_id)
+        self._blob.write(data)
+        self._offsets[doc_id] = (self._end, len(data))
+        self._end += len(data)
+
+    def remove(self, doc_ids):
+        for doc_id in doc_ids:
+            if 0 <= doc_id < self._size:
+                self._offsets[doc_id] = (DELETED, DELETED)
+
+    def abort(self):
+        """
+        Stop writing without publishing a new index. Appended bytes stay unreferenced.
+        """
+        self._blob.close()
+        if self._reset:
+            os.remove(f"{self.blob_path}.tmp")
+
+    def close(self):
+        """
+        Flush the blob, write the index and compact if too many bytes are dead.
+
+        Returns:
+            int: Number of live documents.
+        """
+        self._blob.close()
+        if self._reset:
+            os.replace(f"{self.blob_path}.tmp", self.blob_path)
+        offsets = self._offsets[:self._size]
+        _save_offsets(offsets, self.index_path)
+
+        live = offsets[:, 1] >= 0
+        live_bytes = int(offsets[live, 1].sum())
+        if self._end > 0 and (self._end - live_bytes) / self._end > COMPACT_DEAD_RATIO:
+            compact_document_store(self.blob_path, self.index_path)
+        return int(live.sum())
+
+
+def compact_document_store(blob_path, index_path):
+    """
+    Rewrite the blob without dead bytes. Document ids are preserved.
+    """
+    print(f"Compacting document store '{blob_path}'...")
+    offsets = _load_offsets(index_path)
+    compacted = np.full_like(offsets, DELETED)
+    tmp_blob = f"{blob_path}.tmp"
+    with open(blob_path, 'rb') as src, open(tmp_blob, 'wb') as dst:
+        new_offset = 0
+        for doc_id, (offset, length) in enumerate(offsets):
+            if length < 0:
+                continue
+            src.seek(offset)
+            dst.write(src.read(length))
+            compacted[doc_id] = (new_offset, length)
+            new_offset += length
+    os.replace(tmp_blob, blob_path)
+    _save_offsets(compacted, index_path)
+
+
+def convert_legacy_documents(documents_txt, blob_path, index_path):
+    """
+    Build a document store from a legacy `documents.txt` file whose entries are
+    separated by `---END---` lines.
+    """
+    with open(documents_txt, 'r', encoding='utf-8') as f:
+        entries = f.read().split(LEGACY_SEPARATOR)
+    if entries and not entries[-1].strip():
+        entries.pop()
+    return write_document_store((entry.strip() for entry in entries), blob_path, index_path)
+
+
+class DocumentStore:
+    """
+    Read-only view over a document blob and its offset/length index.
+    """
+
+    def __init__(self, blob_path, index_path):
+        self.blob_path = blob_path
+        self.index_path = index_path
+        self._offsets = np.load(index_path, mmap_mode='r')
+        self._file = open(blob_path, 'rb')
+        if os.fstat(self._file.fileno()).st_size > 0:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap)
+        else:
+            self._mmap = None
+            self._view = memoryview(b'')
+
+    def __len__(self):
+        return self._offsets.shape[0]
+
+    def get(self, doc_id):
+        """
+        Return the document stored under `doc_id`, or None if there is none.
+        """
+        if not 0 <= doc_id < len(self):
+            return None
+        offset, length = self._offsets[doc_id]
+        if length < 0:
+            return None
+        return str(self._view[offset:offset + length], 'utf-8')
+
+    def close(self):
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
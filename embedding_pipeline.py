@@ -0,0 +1,142 @@
+"""
+Streaming, multi-process embedding pipeline for corpus indexing.
+
+Playbooks arrive in batches from a generator (normally
+`playbook_ingest.iter_ingested_batches`), are split into play/task chunks
+unless ingestion already did so, and are encoded on a pool of worker processes
+(each holding its own copy of the embedding model). Each batch is handed back
+to the caller as soon as it finishes. At most `max_pending` batches are in flight at once, so memory stays
+bounded regardless of corpus size.
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import embedding_service
+from playbook_chunker import chunk_playbook
+
+PROGRESS_INTERVAL = 5.0                      # Seconds between progress reports
+
+
+def default_worker_count():
+    """
+    Pick a worker count that leaves each process a few cores for BLAS.
+    """
+    cpus = os.cpu_count() or 1
+    return max(1, min(4, cpus // 2))
+
+
+def _init_worker(threads):
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    embedding_service.get_embedding_model()
+
+
+def _encode_playbooks(items, encode_batch_size):
+    """
+    Chunk and encode a batch of playbooks.
+
+    Args:
+        items (list): Playbook contents, or lists of chunk texts for playbooks
+            that were already chunked during ingestion.
+
+    Returns:
+        tuple: (chunk counts per playbook, embeddings of all chunks in order).
+    """
+    counts = []
+    texts = []
+    for item in items:
+        chunks = item if isinstance(item, list) else chunk_playbook(item)
+        counts.append(len(chunks))
+        texts.extend(chunks)
+    return counts, embedding_service.encode(texts, batch_size=encode_batch_size)
+
+
+class ProgressReporter:
+    """
+    Print playbooks embedded so far and throughput in playbooks/sec.
+    """
+
+    def __init__(self, total=None, interval=PROGRESS_INTERVAL):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    def update(self, count):
+        self.done += count
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report()
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def report(self, final=False):
+        of_total = f"/{self.total}" if self.total is not None else ""
+        prefix = "Embedded" if final else "Embedding progress:"
+        print(f"{prefix} {self.done}{of_total} playbooks ({self.rate():.1f} playbooks/sec)")
+
+
+def embed_playbook_batches(batches, workers=1, encode_batch_size=32, max_pending=None, total=None):
+    """
+    Encode playbook batches and yield them as they complete.
+
+    Args:
+        batches (iterable): Batches of (name, content, chunks) triples, where
+            chunks are the texts from `playbook_ingest`, or None to chunk the
+            content here.
+        workers (int): Number of encoder processes. With 1 the batches are
+            encoded in the current process using the shared model.
+        encode_batch_size (int): Batch size passed to the model's encode call.
+        max_pending (int): Maximum number of batches in flight.
+        total (int): Total playbook count, used only for progress output.
+
+    Yields:
+        tuple: (batch, chunk_counts, embeddings) where chunk_counts[i] rows of
+        embeddings, in order, belong to the i-th playbook of the batch.
+    """
+    progress = ProgressReporter(total=total)
+
+    def items(batch):
+        return [content if chunks is None else chunks for _, content, chunks in batch]
+
+    if workers <= 1:
+        for batch in batches:
+            counts, embeddings = _encode_playbooks(items(batch), encode_batch_size)
+            progress.update(len(batch))
+            yield batch, counts, embeddings
+        progress.report(final=True)
+        return
+
+    max_pending = max_pending or workers * 2
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    context = multiprocessing.get_context('spawn')
+    print(f"Starting {workers} embedding workers ({threads} threads each)...")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(threads,)) as pool:
+        pending = {}
+        batch_iter = iter(batches)
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_pending:
+                batch = next(batch_iter, None)
+                if batch is None:
+                    exhausted = True
+                    break
+                pending[pool.submit(_encode_playbooks, items(batch), encode_batch_size)] = batch
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = pending.pop(future)
+                counts, embeddings = future.result()
+                progress.update(len(batch))
+                yield batch, counts, embeddings
+    progress.report(final=True)
@@ -0,0 +1,103 @@
+"""
+Process-wide embedding model service.
+
+The SentenceTransformer model is loaded lazily the first time it is needed and
+then shared by every caller in the process (indexing and retrieval alike).
+`warm_up_embedding_model` starts the load on a background thread so the first
+incident search does not pay for it.
+"""
+
+import threading
+import time
+
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'    # Sentence embedding model used for playbooks and queries
+
+_embedding_model = None
+_model_lock = threading.Lock()
+_warmup_thread = None
+_stats = {
+    "load_seconds": None,
+    "encode_calls": 0,
+    "encoded_texts": 0,
+    "encode_seconds_total": 0.0,
+    "last_encode_seconds": None,
+}
+_stats_lock = threading.Lock()
+
+
+def get_embedding_model():
+    """
+    Return the shared SentenceTransformer instance, loading it on first use.
+    """
+    global _embedding_model
+
+    if _embedding_model is not None:
+        return _embedding_model
+
+    with _model_lock:
+        if _embedding_model is None:
+            from sentence_transformers import SentenceTransformer
+
+            print(f"Loading embedding model '{EMBEDDING_MODEL_NAME}'...")
+            start = time.perf_counter()
+            model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+            elapsed = time.perf_counter() - start
+            with _stats_lock:
+                _stats["load_seconds"] = elapsed
+            _embedding_model = model
+            print(f"Embedding model loaded in {elapsed:.2f}s.")
+    return _embedding_model
+
+
+def warm_up_embedding_model():
+    """
+    Start loading the embedding model on a daemon thread and return immediately.
+    """
+    global _warmup_thread
+
+    if _embedding_model is not None:
+        return None
+    if _warmup_thread is not None and _warmup_thread.is_alive():
+        return _warmup_thread
+
+    def _load():
+        try:
+            get_embedding_model()
+        except Exception as e:
+            print(f"Error warming up embedding model: {e}")
+
+    _warmup_thread = threading.Thread(target=_load, name="embedding-warmup", daemon=True)
+    _warmup_thread.start()
+    return _warmup_thread
+
+
+def encode(texts, **kwargs):
+    """
+    Encode a list of texts with the shared model and record the latency.
+
+    Returns:
+        numpy.ndarray: float32 embeddings, one row per text.
+    """
+    model = get_embedding_model()
+    start = time.perf_counter()
+    embeddings = model.encode(texts, convert_to_numpy=True, **kwargs).astype('float32')
+    elapsed = time.perf_counter() - start
+    with _stats_lock:
+        _stats["encode_calls"] += 1
+        _stats["encoded_texts"] += len(texts)
+        _stats["encode_seconds_total"] += elapsed
+        _stats["last_encode_seconds"] = elapsed
+    print(f"Encoded {len(texts)} text(s) in {elapsed * 1000:.1f} ms.")
+    return embeddings
+
+
+def embedding_stats():
+    """
+    Return a snapshot of model load time and encode latency counters.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    calls = stats["encode_calls"]
+    stats["mean_encode_seconds"] = stats["encode_seconds_total"] / calls if calls else None
+    stats["loaded"] = _embedding_model is not None
+    return stats
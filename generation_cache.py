@@ -0,0 +1,154 @@
+"""
+Persistent cache of LLM playbook generations.
+
+Generations are stored in SQLite, keyed by a hash of (model, prompt, sampling
+options). Each key can hold several distinct candidates so that a repeated
+"Generate" request can be answered with a different playbook than the ones the
+user has already seen. The database is kept under a byte budget by evicting
+the least recently used candidates.
+
+Concurrent requests for the same key are collapsed into a single in-flight
+generation (single-flight); the other callers wait for and share its result.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+
+def make_key(model, prompt, options=None):
+    """
+    Return the cache key for a generation request.
+    """
+    payload = json.dumps({"model": model, "prompt": prompt, "options": options or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class GenerationCache:
+    """
+    SQLite-backed store of generated playbook candidates with single-flight
+    de-duplication of concurrent identical requests.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, max_candidates=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_candidates = max_candidates
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS generations ("
+                " key TEXT NOT NULL,"
+                " content_hash TEXT NOT NULL,"
+                " content TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " PRIMARY KEY (key, content_hash))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS generations_last_used ON generations (last_used)")
+
+    def candidates(self, key):
+        """
+        Return the cached candidates for `key`, oldest first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT content FROM generations WHERE key = ? ORDER BY created", (key,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _touch(self, key, content):
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE generations SET last_used = ? WHERE key = ? AND content_hash = ?",
+                (time.time(), key, content_hash),
+            )
+
+    def add(self, key, content):
+        """
+        Store a candidate for `key`. Duplicate candidates are ignored.
+        """
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        size = len(content.encode('utf-8'))
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO generations (key, content_hash, content, size, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, content_hash, content, size, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM generations WHERE key = ? AND content_hash NOT IN ("
+                " SELECT content_hash FROM generations WHERE key = ? ORDER BY created DESC LIMIT ?)",
+                (key, key, self.max_candidates),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM generations").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, content_hash, size in self._conn.execute(
+                "SELECT key, content_hash, size FROM generations ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM generations WHERE key = ? AND content_hash = ?", (key, content_hash))
+            total -= size
+            evicted += 1
+        self._conn.execute("PRAGMA incremental_vacuum")
+        print(f"Evicted {evicted} cached generations to stay under {self.max_bytes} bytes.")
+
+    def get_or_generate(self, key, generate, exclude=(), cacheable=lambda content: True):
+        """
+        Return a cached candidate for `key` that is not in `exclude`, or
+        generate a new one.
+
+        Args:
+            key (str): Cache key from `make_key`.
+            generate (callable): Produces a new candidate (or None on failure).
+            exclude (iterable of str): Candidates the caller has already seen.
+            cacheable (callable): Whether a generated candidate may be stored.
+
+        Returns:
+            str or None: The candidate.
+        """
+        exclude = set(exclude)
+        for content in self.candidates(key):
+            if content not in exclude:
+                print("Generation cache hit.")
+                self._touch(key, content)
+                return content
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not owner:
+            print("Waiting for an identical in-flight generation...")
+            content = future.result()
+            if content is None or content not in exclude:
+                return content
+            return self.get_or_generate(key, generate, exclude, cacheable)
+
+        content = None
+        try:
+            content = generate()
+            if content is not None and cacheable(content):
+                self.add(key, content)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_result(content)
+        return content
@@ -0,0 +1,234 @@
+"""
+Shared HTTP client layer for the ServiceNow and AWX APIs.
+
+Each `HttpClient` wraps one pooled keep-alive `requests` session per service,
+so repeated calls reuse connections instead of paying a TCP and TLS handshake
+every time. Requests get connect/read timeouts and are retried with
+exponential backoff and full jitter on connection errors, 429 and 5xx
+responses, honouring Retry-After. Requests that are not idempotent (POST,
+PATCH) are only retried when the server cannot have acted on them: connect
+timeouts, 429 and 503. Latencies are recorded in a histogram per endpoint.
+
+Rate-limit signals (Retry-After on 429/503, or X-RateLimit-Remaining: 0 with
+X-RateLimit-Reset, as sent by ServiceNow) are remembered so that pollers can
+hold off until the window reopens (`rate_limit_delay`).
+"""
+
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))      # Seconds to establish a connection
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))           # Seconds to wait for a response
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "4"))                # Retries after the first attempt
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))          # Seconds before the first retry (upper bound)
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "30"))             # Cap on a single backoff delay
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))                   # Keep-alive connections per host
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+UNPROCESSED_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_ID_SEGMENT = re.compile(r'/(\d+|[0-9a-f]{32})(?=/|$)')
+
+_clients = []
+_clients_lock = threading.Lock()
+
+
+def endpoint_label(method, path):
+    """
+    Return the histogram label for a request, with numeric and sys_id path
+    segments replaced so that e.g. every `/jobs/<id>/` call shares one entry.
+    """
+    return f"{method} {_ID_SEGMENT.sub('/{id}', path.split('?', 1)[0])}"
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram (seconds).
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+
+    def observe(self, seconds, error=False):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+
+    def quantile(self, q):
+        """
+        Return the upper bound of the bucket containing the q-quantile.
+        """
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class HttpClient:
+    """
+    Pooled, retrying HTTP client for one service.
+    """
+
+    def __init__(self, name, base_url, headers=None, auth=None, connect_timeout=HTTP_CONNECT_TIMEOUT,
+                 read_timeout=HTTP_READ_TIMEOUT, max_retries=HTTP_MAX_RETRIES, backoff_base=HTTP_BACKOFF_BASE,
+                 backoff_max=HTTP_BACKOFF_MAX, pool_size=HTTP_POOL_SIZE):
+        self.name = name
+        self.base_url = (base_url or "").rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if headers:
+            self.session.headers.update(headers)
+        # Set once here so the credentials are not rebuilt for every call
+        self.session.auth = auth
+        self.histograms = {}
+        self._stats_lock = threading.Lock()
+        self._rate_limited_until = 0.0
+        with _clients_lock:
+            _clients.append(self)
+
+    def _record(self, label, seconds, error):
+        with self._stats_lock:
+            histogram = self.histograms.get(label)
+            if histogram is None:
+                histogram = self.histograms[label] = LatencyHistogram()
+            histogram.observe(seconds, error)
+
+    def _note_rate_limit(self, response):
+        until = None
+        retry_after = response.headers.get("Retry-After")
+        if response.status_code in UNPROCESSED_STATUSES and retry_after and retry_after.isdigit():
+            until = time.time() + float(retry_after)
+        elif response.headers.get("X-RateLimit-Remaining") == "0":
+            reset = response.headers.get("X-RateLimit-Reset", "")
+            if reset.isdigit():
+                until = float(reset)
+        if until is not None:
+            with self._stats_lock:
+                self._rate_limited_until = max(self._rate_limited_until, until)
+
+    def rate_limit_delay(self):
+        """
+        Return the seconds until the server's last reported rate-limit window reopens.
+        """
+        with self._stats_lock:
+            return max(0.0, self._rate_limited_until - time.time())
+
+    def _backoff(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _should_retry(self, method, response=None, error=None):
+        idempotent = method in IDEMPOTENT_METHODS
+        if error is not None:
+            # A connect timeout means the request never reached the server
+            return idempotent or isinstance(error, requests.exceptions.ConnectTimeout)
+        return response.status_code in (RETRY_STATUSES if idempotent else UNPROCESSED_STATUSES)
+
+    def request(self, method, path, label=None, **kwargs):
+        """
+        Send a request to `base_url + path`, retrying transient failures.
+
+        Args:
+            method (str): HTTP method.
+            path (str): Path relative to the client's base URL (or a full URL).
+            label (str): Latency histogram label, for paths `endpoint_label`
+                cannot collapse (defaults to `endpoint_label(method, path)`).
+            **kwargs: Passed to `requests.Session.request`.
+
+        Returns:
+            requests.Response: The final response; callers still check its status.
+
+        Raises:
+            requests.RequestException: If the last attempt fails without a response.
+        """
+        method = method.upper()
+        if path.startswith(('http://', 'https://')):
+            url = path
+            path = path[len(self.base_url):] if path.startswith(self.base_url) else path
+        else:
+            url = f"{self.base_url}{path}"
+        label = label or endpoint_label(method, path)
+        kwargs.setdefault("timeout", self.timeout)
+
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                self._record(label, time.monotonic() - started, True)
+                if attempt >= self.max_retries or not self._should_retry(method, error=e):
+                    raise
+                delay = self._backoff(attempt)
+                print(f"{self.name}: {label} failed ({e.__class__.__name__}). Retrying in {delay:.1f}s...")
+            else:
+                self._record(label, time.monotonic() - started, response.status_code >= 400)
+                self._note_rate_limit(response)
+                if attempt >= self.max_retries or not self._should_retry(method, response=response):
+                    return response
+                delay = self._backoff(attempt, response)
+                print(f"{self.name}: {label} returned {response.status_code}. Retrying in {delay:.1f}s...")
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request("PATCH", path, **kwargs)
+
+    def latency_stats(self):
+        with self._stats_lock:
+            return {label: histogram.summary() for label, histogram in sorted(self.histograms.items())}
+
+
+def latency_stats():
+    """
+    Return {client name: {endpoint: latency summary}} for every client created.
+    """
+    with _clients_lock:
+        clients = list(_clients)
+    return {client.name: client.latency_stats() for client in clients}
@@ -0,0 +1,504 @@
+"""
+Asyncio engine that drives every tracked ServiceNow incident concurrently.
+
+Each incident gets its own session task running a small state machine:
+
+    waiting --"search"--> choose_or_generate --<number>--> deploying --(success)--> resolved
+                              ^    |"generate"                 |
+                              |    +---------------------------+ (on failure)
+
+A session whose handler fails (say, on a ServiceNow or Ollama error) keeps
+its state and restarts after a backoff of SESSION_RETRY_MIN doubling up to
+SESSION_RETRY_MAX seconds, retrying the comment it was handling. Sessions
+are only dropped once their incident is closed.
+
+A single poller task fetches the incidents changed since the last cycle (with
+a periodic full reconciliation), then fetches the new comments of every
+tracked incident with one batched journal query and hands them to the
+sessions. The ServiceNow, retrieval, LLM and AWX clients are blocking, so
+calls to them run in worker pools behind per-kind semaphores; a long AWX
+deployment for one incident no longer holds up any other incident.
+
+Session state and the journal position are kept in a `SessionStore`, flushed
+once per poll cycle, so a restarted engine resumes its conversations. With
+SHARD_COUNT > 1, each engine process only handles the incidents of its own
+SHARD_INDEX.
+
+With LEASES=true, any number of engine processes sharing SESSION_DB_PATH
+split the incidents dynamically instead: each cycle a worker claims up to
+LEASE_BATCH unowned incidents, and a separate task renews the leases it
+holds every LEASE_TTL / 3 seconds, so a slow ServiceNow poll cannot let them
+lapse. When a worker dies its leases expire after LEASE_TTL seconds and
+another worker resumes its sessions from the store. An incident whose
+playbook is deploying is leased for DEPLOY_LEASE_TTL seconds instead, so it
+is not handed over while the AWX job may still be running.
+"""
+
+import asyncio
+import json
+import os
+import random
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from deployment import execute_playbook_on_awx
+from llama_interface import generate_ansible_playbook, retrieve_playbooks_batch
+import servicenow
+from servicenow import IncidentPoller, JournalPoller, fetch_latest_comment, update_incident
+from poll_scheduler import PollScheduler
+from session_store import SessionStore
+
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "1"))                   # Simultaneous LLM generations
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "2"))               # Simultaneous playbook searches
+AWX_CONCURRENCY = int(os.getenv("AWX_CONCURRENCY", "4"))                   # Simultaneous AWX deployments
+SERVICENOW_CONCURRENCY = int(os.getenv("SERVICENOW_CONCURRENCY", "8"))     # Simultaneous ServiceNow requests
+SEARCH_BATCH_WINDOW = float(os.getenv("SEARCH_BATCH_WINDOW", "0.05"))      # Seconds to gather searches into one batch
+SEARCH_BATCH_MAX = int(os.getenv("SEARCH_BATCH_MAX", "64"))                # Searches per batched retrieval
+SEARCH_TOP_K = 3
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")               # Durable session state
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))                           # Engine processes splitting the incidents
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))                           # This process's shard
+LEASES = os.getenv("LEASES", "false").lower() == "true"                    # Claim incidents through leases
+LEASE_TTL = float(os.getenv("LEASE_TTL", "60"))                            # Seconds before a dead worker's leases expire
+LEASE_BATCH = int(os.getenv("LEASE_BATCH", "10"))                          # New incidents claimed per cycle
+DEPLOY_LEASE_TTL = float(os.getenv("DEPLOY_LEASE_TTL", "3600"))            # Lease held while a playbook deploys
+SESSION_RETRY_MIN = float(os.getenv("SESSION_RETRY_MIN", "5"))             # First delay before restarting a failed session
+SESSION_RETRY_MAX = float(os.getenv("SESSION_RETRY_MAX", "300"))           # Upper bound on that delay
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+WELCOME_MESSAGE = "Hello! Please respond with 'Search' to search for an existing playbook for this incident."
+CHOOSE_PROMPT = "Please respond with the number of the playbook you want to accept or 'Generate' to create a new playbook using AI."
+DEPLOY_UNCONFIRMED_MESSAGE = "The playbook deployment could not be confirmed. Please check AWX before deploying again."
+
+
+def format_playbook_list(playbooks):
+    return "\n\n".join([f"Playbook {idx}:\n{pb}" for idx, pb in enumerate(playbooks, 1)])
+
+
+class SearchBatcher:
+    """
+    Gather playbook searches issued close together and serve them with one
+    `retrieve_playbooks_batch` call, i.e. one encoder pass and one index search.
+    """
+
+    def __init__(self, call, use_gpu=True, window=SEARCH_BATCH_WINDOW, max_batch=SEARCH_BATCH_MAX):
+        self._call = call
+        self.use_gpu = use_gpu
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    async def search(self, query):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        print(f"Searching playbooks for {len(batch)} incident(s) in one batch...")
+        try:
+            results = await self._call("embed", retrieve_playbooks_batch, [query for query, _ in batch],
+                                       top_k=SEARCH_TOP_K, use_gpu=self.use_gpu)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), playbooks in zip(batch, results):
+            if not future.done():
+                future.set_result(playbooks)
+
+
+class IncidentSession:
+    """
+    Conversation state for one incident plus a one-slot mailbox holding the
+    most recent unhandled comment.
+    """
+
+    def __init__(self, sys_id, number, short_description, state="new", last_comment_id=None, playbooks=()):
+        self.sys_id = sys_id
+        self.number = number
+        self.short_description = short_description
+        self.state = state
+        self.last_comment_id = last_comment_id
+        self.playbooks = list(playbooks)
+        self.last_activity = time.monotonic()
+        self.task = None
+        self.failures = 0
+        self.notice = None
+        self._comment = None
+        self._comment_ready = asyncio.Event()
+
+    def deliver(self, comment):
+        # Like the original polling loop, only the latest comment matters.
+        self._comment = comment
+        self._comment_ready.set()
+        self.last_activity = time.monotonic()
+
+    def redeliver(self, comment):
+        # Retry a comment whose handling failed, unless the user has written since.
+        if self._comment is None:
+            self.deliver(comment)
+
+    async def next_comment(self):
+        await self._comment_ready.wait()
+        self._comment_ready.clear()
+        comment, self._comment = self._comment, None
+        return comment
+
+
+class IncidentEngine:
+    """
+    Poll ServiceNow and run one session task per unresolved incident.
+    """
+
+    def __init__(self, use_gpu=True, scheduler=None, llm_concurrency=LLM_CONCURRENCY,
+                 embed_concurrency=EMBED_CONCURRENCY, awx_concurrency=AWX_CONCURRENCY,
+                 servicenow_concurrency=SERVICENOW_CONCURRENCY, store=None, shard_index=SHARD_INDEX,
+                 shard_count=SHARD_COUNT, leases=LEASES, worker_id=WORKER_ID, lease_ttl=LEASE_TTL,
+                 lease_batch=LEASE_BATCH, deploy_lease_ttl=DEPLOY_LEASE_TTL):
+        self.use_gpu = use_gpu
+        self.scheduler = scheduler if scheduler is not None else PollScheduler(clients=[servicenow.client])
+        self._wake = None
+        self.sessions = {}
+        self.incident_poller = IncidentPoller()
+        self.journal = JournalPoller()
+        self.store = store if store is not None else SessionStore(SESSION_DB_PATH, shard_count)
+        self.shard_index = shard_index
+        self.leases = leases
+        self.worker_id = worker_id
+        self.lease_ttl = lease_ttl
+        self.lease_batch = lease_batch
+        self.deploy_lease_ttl = deploy_lease_ttl
+        self._limits = {
+            "llm": llm_concurrency,
+            "embed": embed_concurrency,
+            "awx": awx_concurrency,
+            "servicenow": servicenow_concurrency,
+            "store": 1,
+        }
+        self._semaphores = {}
+        self.searches = SearchBatcher(self._call, use_gpu)
+        # Separate pools so that e.g. a backlog of LLM generations cannot starve ServiceNow calls
+        self._executors = {kind: ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"wrangler-{kind}")
+                           for kind, limit in self._limits.items()}
+
+    async def _call(self, kind, func, *args, **kwargs):
+        """
+        Run a blocking call in the `kind` worker pool under the `kind` limit.
+        """
+        async with self._semaphores[kind]:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executors[kind], lambda: func(*args, **kwargs))
+
+    def _persist(self, session):
+        self.store.save(session.sys_id, session.number, session.short_description, session.state,
+                        session.last_comment_id, session.playbooks)
+
+    def _forget(self, session):
+        self.sessions.pop(session.sys_id, None)
+        self.store.delete(session.sys_id)
+        if self.leases:
+            self.store.release(session.sys_id, self.worker_id)
+
+    def _start_session(self, session):
+        self.sessions[session.sys_id] = session
+        session.task = asyncio.create_task(self._run_session(session))
+
+    def _session_from_record(self, record):
+        if record["state"] == "deploying":
+            # The deployment was interrupted (with leases, its worker has been
+            # gone for DEPLOY_LEASE_TTL seconds); let the user pick again.
+            record["state"] = "choose_or_generate"
+        return IncidentSession(**record)
+
+    def _restore(self):
+        if self.leases:
+            # Sessions are picked up as their leases are claimed.
+            print(f"Worker {self.worker_id} claiming incidents through leases.")
+            return
+        checkpoint = self.store.get_meta(f"journal:{self.shard_index}")
+        if checkpoint:
+            self.journal.restore(json.loads(checkpoint))
+        for record in self.store.load_sessions(self.shard_index):
+            self._start_session(self._session_from_record(record))
+        if self.sessions:
+            print(f"Restored {len(self.sessions)} incident sessions from '{self.store.path}'.")
+
+    async def _flush(self):
+        checkpoint = self.journal.checkpoint()
+        if checkpoint is not None and not self.leases:
+            self.store.set_meta(f"journal:{self.shard_index}", json.dumps(checkpoint))
+        await self._call("store", self.store.flush)
+
+    async def run(self):
+        self._semaphores = {kind: asyncio.Semaphore(limit) for kind, limit in self._limits.items()}
+        self._wake = asyncio.Event()
+        print("Starting Wrangler...")
+        self._restore()
+        renewer = asyncio.create_task(self._keep_leases()) if self.leases else None
+        try:
+            while True:
+                activity = False
+                try:
+                    activity = await self.poll_once()
+                except Exception as e:
+                    print(f"Error polling ServiceNow: {e}")
+                try:
+                    await self._flush()
+                except Exception as e:
+                    print(f"Error saving incident sessions: {e}")
+                delay = self.scheduler.next_delay(self.sessions.values(), activity)
+                if self.leases:
+                    delay = min(delay, self.lease_ttl / 3)
+                print(f"Sleeping for {delay:.1f} seconds...")
+                self._wake.clear()
+                try:
+                    # A session that just replied to its user cuts the sleep short
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if renewer is not None:
+                renewer.cancel()
+            for session in self.sessions.values():
+                session.task.cancel()
+            for executor in self._executors.values():
+                executor.shutdown(wait=False)
+            # Sessions are written before the leases go, so a worker taking
+            # them over never loads an older state.
+            self.store.flush()
+            if self.leases:
+                self.store.release_all(self.worker_id)
+            self.store.close()
+
+    async def _keep_leases(self):
+        """
+        Renew the held leases every third of their TTL, whatever ServiceNow is doing.
+        """
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                await self._claim_leases()
+            except Exception as e:
+                print(f"Error renewing incident leases: {e}")
+
+    async def _claim_leases(self, new_ids=()):
+        """
+        Renew the leases on the current sessions and try to claim `new_ids`.
+        Sessions whose lease another worker has taken over are stopped.
+
+        Returns:
+            set: The sys_ids this worker now holds.
+        """
+        current = list(self.sessions)
+        ttls = {sys_id: self.deploy_lease_ttl for sys_id in current if self.sessions[sys_id].state == "deploying"}
+        held = await self._call("store", self.store.claim, current + list(new_ids), self.worker_id,
+                                self.lease_ttl, ttls)
+        for sys_id in current:
+            session = self.sessions.get(sys_id)
+            if session is not None and sys_id not in held:
+                print(f"Lost the lease on Incident {session.number}. Another worker has taken it over.")
+                self.sessions.pop(sys_id)
+                session.task.cancel()
+        return held
+
+    async def poll_once(self):
+        """
+        Run one poll cycle. Returns True if it found new incidents or comments.
+        """
+        print("Fetching unresolved incidents...")
+        unresolved_incidents = await self._call("servicenow", self.incident_poller.poll)
+
+        unresolved = {incident["sys_id"]: incident for incident in unresolved_incidents
+                      if self.leases or self.store.owns(incident["sys_id"], self.shard_index)}
+        unresolved_ids = set(unresolved)
+        new_ids = [sys_id for sys_id in unresolved if sys_id not in self.sessions]
+
+        if self.leases:
+            random.shuffle(new_ids)
+            new_ids = new_ids[:self.lease_batch]
+            held = await self._claim_leases(new_ids)
+            new_ids = [sys_id for sys_id in new_ids if sys_id in held]
+
+        for sys_id in new_ids:
+            record = await self._call("store", self.store.load_session, sys_id) if self.leases else None
+            if record is not None:
+                print(f"Taking over Incident {record['number']} in state '{record['state']}'.")
+                self._start_session(self._session_from_record(record))
+            else:
+                incident = unresolved[sys_id]
+                self._start_session(IncidentSession(sys_id, incident["number"],
+                                                    incident.get("short_description", "No description provided.")))
+
+        for sys_id in list(self.sessions):
+            session = self.sessions[sys_id]
+            if sys_id not in unresolved_ids and session.state != "deploying":
+                print(f"Incident {session.number} is no longer open. Dropping its session.")
+                session.task.cancel()
+                self._forget(session)
+
+        new_comments = await self._poll_comments()
+        return bool(new_ids or new_comments)
+
+    async def _poll_comments(self):
+        new_comments = await self._call("servicenow", self.journal.poll, list(self.sessions))
+        for sys_id, comments in new_comments.items():
+            session = self.sessions.get(sys_id)
+            if session is None:
+                continue
+            for comment, comment_id in comments:
+                session.last_comment_id = comment_id
+                print(f"New comment for Incident {session.number}: {comment}")
+                session.deliver(comment)
+            self._persist(session)
+        return new_comments
+
+    async def _update(self, session, payload):
+        await self._call("servicenow", update_incident, session.sys_id, payload)
+        # The user is likely to answer soon; poll quickly again.
+        session.last_activity = time.monotonic()
+        self._wake.set()
+
+    async def _run_session(self, session):
+        comment = None
+        try:
+            if session.state == "new":
+                print(f"Sending welcome message for Incident {session.number}")
+                await self._update(session, {"comments": WELCOME_MESSAGE})
+                session.state = "waiting"
+                self._persist(session)
+            elif session.state == "resolved":
+                # The deployment succeeded but the incident could not be updated yet
+                await self._resolve(session)
+                return
+            elif self.leases:
+                await self._catch_up(session)
+            if session.notice:
+                await self._update(session, {"comments": session.notice})
+                session.notice = None
+            while True:
+                comment = await session.next_comment()
+                if await self._handle_comment(session, comment):
+                    break
+                comment = None
+                session.failures = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            session.failures += 1
+            delay = min(SESSION_RETRY_MAX, SESSION_RETRY_MIN * 2 ** (session.failures - 1))
+            print(f"Error handling Incident {session.number}: {e}. Restarting its session in {delay:.0f}s.")
+            if session.state == "deploying":
+                # The AWX job may have run; never repeat a deployment unasked.
+                session.state = "choose_or_generate"
+                session.notice = f"{DEPLOY_UNCONFIRMED_MESSAGE}\n\n{CHOOSE_PROMPT}"
+                self._persist(session)
+            elif comment is not None:
+                session.redeliver(comment)
+            session.task = asyncio.create_task(self._restart_session(session, delay))
+
+    async def _restart_session(self, session, delay):
+        await asyncio.sleep(delay)
+        await self._run_session(session)
+
+    async def _catch_up(self, session):
+        """
+        Deliver a comment the previous owner of a taken-over session may have missed.
+        """
+        latest_comment, last_comment_id = await self._call(
+            "servicenow", fetch_latest_comment, session.sys_id, session.last_comment_id)
+        if latest_comment is not None:
+            session.last_comment_id = last_comment_id
+            print(f"New comment for Incident {session.number}: {latest_comment}")
+            session.deliver(latest_comment)
+            self._persist(session)
+
+    async def _resolve(self, session):
+        await self._update(session, {
+            "state": 6,
+            "close_code": "Solution provided",
+            "close_notes": "Incident has been successfully resolved.",
+            "comments": "The playbook has been successfully deployed. The incident is now resolved."
+        })
+        self._forget(session)
+
+    async def _handle_comment(self, session, comment):
+        """
+        Advance the session state machine. Returns True once the incident is resolved.
+        """
+        if comment == "search" and session.state == "waiting":
+            print(f"User requested playbook search for Incident {session.number}")
+            playbooks = await self.searches.search(session.short_description)
+            if playbooks:
+                print("Retrieved Playbooks:")
+                for idx, pb in enumerate(playbooks, 1):
+                    print(f"Playbook {idx}:\n{pb}\n")
+            else:
+                print("No relevant playbooks found. Generating a new playbook.")
+                playbooks = [await self._call("llm", generate_ansible_playbook, session.short_description,
+                                              regenerate_with_ai=True, use_gpu=self.use_gpu)]
+            session.playbooks = playbooks
+            playbook_list = format_playbook_list(session.playbooks)
+            await self._update(session, {
+                "comments": f"The following playbooks have been retrieved:\n\n{playbook_list}\n\n{CHOOSE_PROMPT}",
+                "state": 2
+            })
+            session.state = "choose_or_generate"
+            self._persist(session)
+
+        elif comment == "generate" and session.state == "choose_or_generate":
+            print(f"User requested playbook regeneration for Incident {session.number}")
+            new_playbook = await self._call("llm", generate_ansible_playbook, session.short_description,
+                                            regenerate_with_ai=True, use_gpu=self.use_gpu,
+                                            exclude=list(session.playbooks))
+            session.playbooks.append(new_playbook)
+            self._persist(session)
+            playbook_list = format_playbook_list(session.playbooks)
+            await self._update(session, {
+                "comments": f"The following playbooks have been retrieved/generated:\n\n{playbook_list}\n\n{CHOOSE_PROMPT}"
+            })
+
+        elif comment.isdigit() and session.state == "choose_or_generate":
+            playbook_index = int(comment) - 1
+            if 0 <= playbook_index < len(session.playbooks):
+                print(f"User selected Playbook {comment} for Incident {session.number}. Deploying...")
+                session.state = "deploying"
+                self._persist(session)
+                if self.leases:
+                    # Hold the incident for the whole deployment
+                    await self._claim_leases()
+                job_status = await self._call("awx", execute_playbook_on_awx, session.number,
+                                              session.playbooks[playbook_index])
+                if job_status == "successful":
+                    print(f"AWX deployment successful for Incident {session.number}")
+                    session.state = "resolved"
+                    self._persist(session)
+                    await self._resolve(session)
+                    return True
+                print(f"AWX deployment failed for Incident {session.number}")
+                session.state = "choose_or_generate"
+                self._persist(session)
+                playbook_list = format_playbook_list(session.playbooks)
+                await self._update(session, {
+                    "comments": f"Playbook deployment failed. The following playbooks are available:\n\n{playbook_list}\n\n"
+                                "Respond with 'Generate' for a new playbook or select one of the above options."
+                })
+        return False
@@ -0,0 +1,111 @@
+"""
+Manifest of indexed playbooks used for incremental FAISS updates.
+
+The manifest maps each playbook file name to the hash of the content that was
+embedded, the document-store id it was stored under and the contiguous range of
+FAISS chunk ids holding its play/task vectors:
+
+    {
+        "version": 2,
+        "next_id": 42,
+        "next_chunk_id": 913,
+        "files": {
+            "site.yml": {"hash": "<sha256>", "id": 7, "chunk_start": 120, "chunk_count": 14},
+            ...
+        }
+    }
+"""
+
+import hashlib
+import json
+import os
+
+MANIFEST_VERSION = 2
+
+
+def hash_content(content):
+    """
+    Return the SHA-256 hex digest of a playbook's text.
+    """
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def empty_manifest():
+    return {"version": MANIFEST_VERSION, "next_id": 0, "next_chunk_id": 0, "files": {}}
+
+
+def load_manifest(path):
+    """
+    Load the manifest at `path`, or return an empty one if it is missing or
+    was written by an incompatible version.
+    """
+    if not os.path.exists(path):
+        return empty_manifest()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading index manifest '{path}': {e}")
+        return empty_manifest()
+    if manifest.get("version") != MANIFEST_VERSION:
+        print(f"Index manifest '{path}' has an unsupported version. Ignoring it.")
+        return empty_manifest()
+    return manifest
+
+
+def save_manifest(manifest, path):
+    """
+    Atomically write the manifest to `path`.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def diff_manifest(manifest, current_hashes):
+    """
+    Compare the manifest against the hashes of the files currently on disk.
+
+    Args:
+        manifest (dict): Manifest of the last indexing run.
+        current_hashes (dict): File name -> content hash for the files on disk.
+
+    Returns:
+        tuple: (added, changed, removed) lists of file names.
+    """
+    indexed = manifest["files"]
+    added = [name for name in current_hashes if name not in indexed]
+    changed = [name for name in current_hashes
+               if name in indexed and indexed[name]["hash"] != current_hashes[name]]
+    removed = [name for name in indexed if name not in current_hashes]
+    return sorted(added), sorted(changed), sorted(removed)
+
+
+def allocate_id(manifest):
+    """
+    Reserve and return the next unused document id.
+    """
+    new_id = manifest["next_id"]
+    manifest["next_id"] = new_id + 1
+    return new_id
+
+
+def allocate_chunk_ids(manifest, count):
+    """
+    Reserve `count` consecutive chunk (vector) ids and return the first one.
+    """
+    start = manifest["next_chunk_id"]
+    manifest["next_chunk_id"] = start + count
+    return start
+
+
+def chunk_ids(entry):
+    """
+    Return the chunk ids of a manifest file entry.
+    """
+    return range(entry["chunk_start"], entry["chunk_start"] + entry["chunk_count"])
+
+
+def chunk_total(manifest):
+    return sum(entry["chunk_count"] for entry in manifest["files"].values())
@@ -0,0 +1,164 @@
+"""
+BM25 inverted index over the exact identifiers in playbooks.
+
+Sentence embeddings of flattened YAML blur short exact cues such as `ufw`,
+`galera`, `k3s` or `wireguard`. Those cues appear both in incident text and in
+a playbook's module names, role names, and the package and service names its
+tasks manage. This index scores those tokens with BM25 so that retrieval can
+fuse them with the FAISS ranking.
+
+The index is stored as compressed sparse rows in one .npz file:
+
+    vocab     sorted term strings                   (V,)
+    indptr    posting list offsets per term         (V + 1,)  int64
+    doc_ids   document id of each posting           (P,)      int64
+    weights   precomputed BM25 weight per posting   (P,)      float32
+
+A query reads the posting lists of its terms and sums their weights per
+document. It allocates nothing proportional to the corpus size.
+"""
+
+import os
+import re
+
+import numpy as np
+
+from playbook_chunker import TASK_SECTIONS, iter_tasks, task_module
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Modules whose `name`/`pkg` argument names a package, service or role
+NAMED_ARGUMENT_MODULES = {
+    'apt', 'yum', 'dnf', 'package', 'pip', 'apk', 'pacman', 'zypper', 'snap', 'gem', 'npm', 'homebrew',
+    'win_chocolatey', 'service', 'systemd', 'systemd_service', 'sysvinit', 'include_role', 'import_role',
+}
+
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+_TEMPLATE_PATTERN = re.compile(r'{{.*?}}|{%.*?%}')
+
+
+def tokenize(text):
+    """
+    Split text into lowercase alphanumeric tokens, ignoring Jinja expressions.
+    """
+    text = _TEMPLATE_PATTERN.sub(' ', str(text).lower())
+    return [token for token in _TOKEN_PATTERN.findall(text) if len(token) > 1]
+
+
+def _argument_names(args, task):
+    names = []
+    if isinstance(args, dict):
+        for key in ('name', 'pkg', 'role'):
+            if key in args:
+                names.append(args[key])
+    elif isinstance(args, str):
+        names.append(args.split('=', 1)[-1] if args.startswith(('name=', 'pkg=')) else args)
+    loop = task.get('loop') or next((value for key, value in task.items() if key.startswith('with_')), None)
+    if isinstance(loop, list):
+        names.extend(item for item in loop if isinstance(item, str))
+    flattened = []
+    for name in names:
+        flattened.extend(name if isinstance(name, list) else [name])
+    return flattened
+
+
+def playbook_terms(plays):
+    """
+    Return the lexical terms of a parsed playbook, with repetitions: module
+    names (without collection prefix), role names, and the packages, services
+    and roles named by package, service and role tasks.
+    """
+    terms = []
+    for play in plays:
+        if not isinstance(play, dict):
+            continue
+        roles = play.get('roles')
+        if isinstance(roles, list):
+            for role in roles:
+                terms.extend(tokenize(role.get('role') or role.get('name', '') if isinstance(role, dict) else role))
+        for section in TASK_SECTIONS:
+            for task in iter_tasks(play.get(section)):
+                module, args = task_module(task)
+                if not module:
+                    continue
+                short_name = module.rsplit('.', 1)[-1]
+                terms.extend(tokenize(short_name))
+                if short_name in NAMED_ARGUMENT_MODULES:
+                    for name in _argument_names(args, task):
+                        terms.extend(tokenize(name))
+    return terms
+
+
+def build_lexical_index(doc_terms, path):
+    """
+    Build the BM25 index and atomically write it to `path`.
+
+    Args:
+        doc_terms (dict): Document id -> list of terms (see `playbook_terms`).
+        path (str): Output .npz file.
+    """
+    doc_ids = sorted(doc_terms)
+    lengths = {doc_id: len(doc_terms[doc_id]) for doc_id in doc_ids}
+    avg_length = (sum(lengths.values()) / len(doc_ids)) if doc_ids else 0.0
+    postings = {}
+    for doc_id in doc_ids:
+        counts = {}
+        for term in doc_terms[doc_id]:
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            postings.setdefault(term, []).append((doc_id, count))
+
+    vocab = sorted(postings)
+    indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    posting_docs = []
+    weights = []
+    for row, term in enumerate(vocab):
+        entries = postings[term]
+        idf = np.log(1.0 + (len(doc_ids) - len(entries) + 0.5) / (len(entries) + 0.5))
+        for doc_id, count in entries:
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths[doc_id] / max(avg_length, 1e-9))
+            posting_docs.append(doc_id)
+            weights.append(idf * count * (BM25_K1 + 1.0) / (count + norm))
+        indptr[row + 1] = len(posting_docs)
+
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, vocab=np.array(vocab, dtype=str), indptr=indptr,
+             doc_ids=np.array(posting_docs, dtype=np.int64), weights=np.array(weights, dtype=np.float32))
+    os.replace(tmp_path, path)
+    print(f"Lexical index saved to '{path}' ({len(vocab)} terms, {len(posting_docs)} postings).")
+
+
+class LexicalIndex:
+    """
+    Read-only BM25 index loaded from the file written by `build_lexical_index`.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            vocab = data["vocab"]
+            self.indptr = data["indptr"]
+            self.doc_ids = data["doc_ids"]
+            self.weights = data["weights"]
+        self.rows = {term: row for row, term in enumerate(vocab.tolist())}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def search(self, query, top_k):
+        """
+        Return up to top_k (document id, BM25 score) pairs for a query, best first.
+        """
+        rows = {self.rows[token] for token in tokenize(query) if token in self.rows}
+        if not rows:
+            return []
+        slices = [slice(self.indptr[row], self.indptr[row + 1]) for row in rows]
+        doc_ids = np.concatenate([self.doc_ids[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices])
+        unique_ids, inverse = np.unique(doc_ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k)[:top_k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best])]
+        return [(int(unique_ids[i]), float(scores[i])) for i in best]
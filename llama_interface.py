@@ -16,11 +16,39 @@ Usage:
 
 import os
 import re
-import subprocess
 import sys
+import threading
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from document_store import DocumentStore, DocumentStoreWriter, convert_legacy_documents
+from embedding_pipeline import default_worker_count, embed_playbook_batches
+from embedding_service import encode, get_embedding_model
+from generation_cache import GenerationCache, make_key
+from lexical_index import LexicalIndex, build_lexical_index
+import ollama_client
+from playbook_ingest import ingest_directory, iter_ingested_batches
+from query_cache import QueryCache
+from index_manifest import (
+    allocate_chunk_ids,
+    allocate_id,
+    chunk_ids,
+    chunk_total,
+    diff_manifest,
+    empty_manifest,
+    load_manifest,
+    save_manifest
+)
+from vector_index import (
+    INDEX_TYPES,
+    VectorIndexBuilder,
+    apply_search_params,
+    choose_index_type,
+    gpu_compatible,
+    meta_path_for,
+    read_index_meta,
+    supports_removal,
+    write_index_meta
+)
 
 # ----------------------------
 # Configuration Constants
@@ -28,125 +56,368 @@ from sentence_transformers import SentenceTransformer
 
 PLAYBOOKS_DIR = 'existing_playbooks/'        # Directory containing existing playbooks
 FAISS_INDEX_PATH = 'faiss.index'             # Path to save/load the FAISS index
-DOCUMENTS_PATH = 'documents.txt'             # Path to save/load playbook contents
+DOCUMENTS_PATH = 'documents.bin'             # Memory-mapped blob of playbook contents
+DOCUMENTS_INDEX_PATH = 'documents.idx.npy'   # (offset, length) rows keyed by FAISS id
+LEGACY_DOCUMENTS_PATH = 'documents.txt'      # Older `---END---` separated playbook dump
+INDEX_MANIFEST_PATH = 'index_manifest.json'  # File name -> content hash -> document and chunk ids
+CHUNK_MAP_PATH = 'chunk_parents.npy'         # Chunk (vector) id -> parent playbook document id
+LEXICAL_INDEX_PATH = 'lexical_index.npz'     # BM25 index over module, role and package names
 MODEL_NAME = 'qwen2.5-coder:32b'             # Ollama model name
+LLM_OPTIONS = {}                             # Sampling options passed to the model (part of the cache key)
 TOP_K = 3                                    # Number of top playbooks to retrieve
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))  # Playbooks per encode batch when indexing
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "0"))         # Encoder processes when indexing (0 = auto)
+INDEX_TYPE = os.getenv("INDEX_TYPE", "auto")                  # auto, flat, ivf, hnsw or ivfpq
+INDEX_PREFERENCE = os.getenv("INDEX_PREFERENCE", "balanced")  # recall, balanced, latency or memory (for auto)
+CHUNK_OVERSAMPLE = 10                        # Chunks searched per requested playbook
+CHUNK_HIT_WEIGHT = 0.1                       # Weight of a playbook's additional matching chunks
+LEXICAL_WEIGHT = float(os.getenv("LEXICAL_WEIGHT", "0.2"))  # Weight of the BM25 match in fused scores (0 disables)
+LEXICAL_SATURATION = 10.0                    # BM25 score that counts as half a full lexical match
+FUSION_DEPTH = 20                            # Candidates taken from each ranking before fusion
+ESTIMATED_CHUNKS_PER_PLAYBOOK = 8            # Used to size a new index before chunking
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))   # Cached incident queries
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "86400"))  # Seconds a cached query stays valid
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "query_cache.json")  # Empty to keep the cache in memory only
+GENERATION_CACHE_PATH = os.getenv("GENERATION_CACHE_PATH", "generation_cache.db")  # SQLite cache of LLM playbooks
+GENERATION_CACHE_MAX_BYTES = int(os.getenv("GENERATION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+GENERATION_CACHE_CANDIDATES = int(os.getenv("GENERATION_CACHE_CANDIDATES", "5"))  # Distinct playbooks kept per prompt
+
+CODE_BLOCK_PATTERN = re.compile(r'```([\s\S]+?)```')
+PLAYBOOK_PATTERN = re.compile(r'---[\s\S]+?(?:\n\.\.\.|$)')
 
 index_gpu = None
 index_cpu = None
-documents = []
+index_meta = {}
+documents = None
+chunk_parents = None
+lexical_index = None
+_search_lock = threading.Lock()
+query_cache = QueryCache(max_entries=QUERY_CACHE_SIZE, ttl_seconds=QUERY_CACHE_TTL, path=QUERY_CACHE_PATH or None)
+generation_cache = GenerationCache(GENERATION_CACHE_PATH, max_bytes=GENERATION_CACHE_MAX_BYTES,
+                                   max_candidates=GENERATION_CACHE_CANDIDATES)
 
 # ----------------------------
 # Utility Functions
 # ----------------------------
 
-def create_faiss_index(use_gpu=True):
+def _load_incremental_state(full_rebuild):
     """
-    Create a FAISS index from existing Ansible playbooks, ensuring consistency between playbooks and embeddings.
+    Load the manifest, index and build metadata of the previous run, or return
+    an empty state when a full rebuild is requested or the saved state is
+    inconsistent.
     """
-    print("Initializing embedding model...")
+    manifest = empty_manifest()
+    if full_rebuild:
+        return manifest, None, None
+
+    if not (os.path.exists(INDEX_MANIFEST_PATH) and os.path.exists(FAISS_INDEX_PATH)
+            and os.path.exists(DOCUMENTS_PATH) and os.path.exists(DOCUMENTS_INDEX_PATH)
+            and os.path.exists(CHUNK_MAP_PATH)):
+        print("No incremental index state found. Performing a full rebuild.")
+        return manifest, None, None
+
+    manifest = load_manifest(INDEX_MANIFEST_PATH)
     try:
-        embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        print("Embedding model initialized successfully.")
+        index = faiss.read_index(FAISS_INDEX_PATH)
+        meta = read_index_meta(FAISS_INDEX_PATH)
     except Exception as e:
-        print(f"Error initializing embedding model: {e}")
-        return
+        print(f"Error loading existing FAISS index: {e}. Performing a full rebuild.")
+        return empty_manifest(), None, None
+
+    if ("built_for" not in meta or index.ntotal != chunk_total(manifest)
+            or np.load(CHUNK_MAP_PATH, mmap_mode='r').shape[0] != manifest["next_chunk_id"]):
+        print("Existing FAISS index does not match the manifest. Performing a full rebuild.")
+        return empty_manifest(), None, None
+    return manifest, index, meta
+
+def _resolve_index_type(requested, n_vectors):
+    if requested == 'auto':
+        return choose_index_type(n_vectors, INDEX_PREFERENCE)
+    if requested not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{requested}'. Expected 'auto' or one of {INDEX_TYPES}.")
+    return requested
+
+def _needs_rebuild(meta, requested, index_type, n_vectors, has_removals):
+    """
+    Decide whether an existing index can be updated in place.
+    """
+    existing_type = meta["index_type"]
+    built_for = max(meta["built_for"], 1)
+    if requested != 'auto' and existing_type != requested:
+        return f"index type changed from '{existing_type}' to '{requested}'"
+    if requested == 'auto' and existing_type != index_type and (n_vectors >= 2 * built_for or 2 * n_vectors <= built_for):
+        return f"corpus size changed from {built_for} to {n_vectors}, switching to '{index_type}'"
+    if existing_type in ('ivf', 'ivfpq') and n_vectors >= 4 * built_for:
+        return f"corpus grew from {built_for} to {n_vectors} since the index was trained"
+    if has_removals and not supports_removal(existing_type):
+        return f"'{existing_type}' indexes do not support removing playbooks"
+    return None
+
+def _load_chunk_parents(fresh_build):
+    if fresh_build or not os.path.exists(CHUNK_MAP_PATH):
+        return np.empty(0, dtype=np.int64)
+    return np.load(CHUNK_MAP_PATH)
+
+def _stage_index_files(index, parents, index_type, params, built_for, manifest):
+    """
+    Write the FAISS index, chunk map, build metadata and manifest next to their
+    final paths.
+
+    Returns:
+        dict: Final path -> staged path, to be renamed once the document store is committed.
+    """
+    staged = {
+        FAISS_INDEX_PATH: f"{FAISS_INDEX_PATH}.new",
+        meta_path_for(FAISS_INDEX_PATH): meta_path_for(f"{FAISS_INDEX_PATH}.new"),
+        CHUNK_MAP_PATH: f"{CHUNK_MAP_PATH}.new.npy",
+        INDEX_MANIFEST_PATH: f"{INDEX_MANIFEST_PATH}.new",
+    }
+    try:
+        faiss.write_index(index, staged[FAISS_INDEX_PATH])
+        write_index_meta(staged[FAISS_INDEX_PATH], index_type, params, index.d, index.ntotal, built_for)
+        np.save(staged[CHUNK_MAP_PATH], parents)
+        save_manifest(manifest, staged[INDEX_MANIFEST_PATH])
+    except Exception:
+        _discard_staged(staged)
+        raise
+    return staged
+
+def _discard_staged(staged):
+    for staged_path in staged.values():
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+
+def _save_lexical_index(manifest, ingested):
+    """
+    Rebuild the BM25 index over the indexed playbooks, keyed by document id.
+    """
+    try:
+        build_lexical_index({entry["id"]: ingested[name]["terms"] for name, entry in manifest["files"].items()
+                             if name in ingested}, LEXICAL_INDEX_PATH)
+    except Exception as e:
+        print(f"Error saving lexical index: {e}")
+
+def _embedding_batches(names, batch_size, ingested):
+    """
+    Stream the named playbooks from the ingestion stage as embedding batches.
+
+    Each playbook's hash and terms in `ingested` are replaced by those of the
+    content actually read here, so the manifest, vectors, document store and
+    lexical index agree even if a file was edited after `ingest_directory`.
+    """
+    for batch in iter_ingested_batches(PLAYBOOKS_DIR, names, batch_size):
+        for name, _, playbook in batch:
+            ingested[name] = {"hash": playbook["hash"], "terms": playbook["terms"]}
+        yield [(name, content, playbook["chunks"]) for name, content, playbook in batch]
+
+def _estimate_vectors(manifest, n_playbooks):
+    """
+    Estimate the number of chunk vectors for n_playbooks before chunking them.
+    """
+    if manifest["files"]:
+        return int(n_playbooks * chunk_total(manifest) / len(manifest["files"]))
+    return n_playbooks * ESTIMATED_CHUNKS_PER_PLAYBOOK
+
+def create_faiss_index(use_gpu=True, full_rebuild=False, workers=None, batch_size=None, index_type=None):
+    """
+    Create or incrementally update the FAISS index from existing Ansible playbooks.
+
+    Files are read through `playbook_ingest`, which rejects anything that is not
+    a playbook and caches parse results by content hash. Only playbooks that
+    were added or changed since the last run are embedded; playbooks that
+    disappeared from PLAYBOOKS_DIR (or are now rejected) are removed from the
+    index and the document store. Pass full_rebuild=True to re-embed everything.
+
+    Each play and task of a playbook is embedded as its own chunk; the chunk ->
+    playbook map is saved to CHUNK_MAP_PATH. A BM25 index over the playbooks'
+    module, role and package names is rebuilt next to it (LEXICAL_INDEX_PATH).
+    The playbooks to embed are streamed through the ingestion stage in batches
+    of `batch_size` and encoded on `workers` processes, and vectors are added
+    to the index as batches finish.
+
+    `index_type` is 'auto' or one of vector_index.INDEX_TYPES (defaults to the
+    INDEX_TYPE setting). Build metadata is saved next to the index so the
+    retrieval side reopens it with the right search parameters.
+    """
+    workers = workers or EMBED_WORKERS or default_worker_count()
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    requested_type = index_type or INDEX_TYPE
 
     if not os.path.exists(PLAYBOOKS_DIR):
         print(f"Playbooks directory '{PLAYBOOKS_DIR}' does not exist. Please create it and add playbook files.")
         return
 
-    playbook_contents = []
-    formatted_playbooks = []
+    manifest, index, meta = _load_incremental_state(full_rebuild)
     print(f"Reading playbooks from directory: {PLAYBOOKS_DIR}")
-    for filename in os.listdir(PLAYBOOKS_DIR):
-        if filename.endswith(('.yml', '.yaml')):
-            filepath = os.path.join(PLAYBOOKS_DIR, filename)
-            try:
-                with open(filepath, 'r', encoding='utf-8') as file:
-                    content = file.read()
-                    playbook_contents.append(content.replace("\n", " "))
-                    formatted_playbooks.append(content.strip())
-                    print(f"Successfully read playbook: {filename}")
-            except Exception as e:
-                print(f"Error reading playbook '{filename}': {e}")
-
-    if not playbook_contents:
-        print(f"No playbooks found in '{PLAYBOOKS_DIR}'. Please add `.yml` or `.yaml` files.")
+    try:
+        ingested, rejected = ingest_directory(PLAYBOOKS_DIR)
+    except Exception as e:
+        print(f"Error reading playbooks: {e}")
         return
+    for filename, reason in rejected.items():
+        print(f"Skipping '{filename}': {reason}")
+    current_hashes = {name: playbook["hash"] for name, playbook in ingested.items()}
 
-    print(f"Total playbooks read: {len(playbook_contents)}")
+    if not current_hashes:
+        print(f"No playbooks found in '{PLAYBOOKS_DIR}'. Please add `.yml` or `.yaml` files.")
+        return
 
+    estimated_vectors = _estimate_vectors(manifest, len(current_hashes))
     try:
-        print("Generating embeddings for playbooks...")
-        embeddings = embedding_model.encode(playbook_contents, convert_to_numpy=True).astype('float32')
-        print(f"Embeddings generated successfully. Total embeddings: {embeddings.shape[0]}")
-    except Exception as e:
-        print(f"Error generating embeddings: {e}")
+        index_type = _resolve_index_type(requested_type, estimated_vectors)
+    except ValueError as e:
+        print(f"Error: {e}")
         return
 
-    if len(playbook_contents) != embeddings.shape[0]:
-        print("Error: Mismatch between playbook contents and generated embeddings.")
+    added, changed, removed = diff_manifest(manifest, current_hashes)
+    if index is not None:
+        reason = _needs_rebuild(meta, requested_type, index_type, estimated_vectors, bool(changed or removed))
+        if reason:
+            print(f"Performing a full rebuild: {reason}.")
+            manifest, index, meta = empty_manifest(), None, None
+            added, changed, removed = diff_manifest(manifest, current_hashes)
+        else:
+            index_type = meta["index_type"]
+    fresh_build = index is None
+
+    print(f"Total playbooks read: {len(current_hashes)} "
+          f"(added: {len(added)}, changed: {len(changed)}, removed: {len(removed)})")
+    if not fresh_build and not (added or changed or removed):
+        print("FAISS index is already up to date.")
+        if not os.path.exists(LEXICAL_INDEX_PATH):
+            _save_lexical_index(manifest, ingested)
         return
 
-    dimension = embeddings.shape[1]
-    print(f"Embedding dimension: {dimension}")
+    if workers <= 1:
+        print("Initializing embedding model...")
+        try:
+            get_embedding_model()
+            print("Embedding model initialized successfully.")
+        except Exception as e:
+            print(f"Error initializing embedding model: {e}")
+            return
+
+    stale_entries = [manifest["files"].pop(name) for name in changed + removed]
+    stale_ids = [entry["id"] for entry in stale_entries]
+    stale_chunks = [chunk_id for entry in stale_entries for chunk_id in chunk_ids(entry)]
+    to_embed = added + changed
+    if fresh_build:
+        print(f"Creating '{index_type}' FAISS index for {len(to_embed)} playbooks...")
+        builder = VectorIndexBuilder(index_type, expected_total=estimated_vectors)
+    else:
+        builder = VectorIndexBuilder(index_type, index=index, params=meta["params"])
+    parents = _load_chunk_parents(fresh_build)
+    new_parents = []
+    writer = DocumentStoreWriter(DOCUMENTS_PATH, DOCUMENTS_INDEX_PATH, reset=fresh_build)
     try:
-        print("Creating FAISS index...")
-        index = faiss.IndexFlatL2(dimension)
-        index.add(embeddings)
-        print("FAISS index created and embeddings added successfully.")
+        builder.remove(stale_chunks)
+        parents[stale_chunks] = -1
+        writer.remove(stale_ids)
+
+        print(f"Generating embeddings for {len(to_embed)} playbooks "
+              f"(batch size {batch_size}, {workers} worker(s))...")
+        batches = _embedding_batches(to_embed, batch_size, ingested)
+        for batch, counts, embeddings in embed_playbook_batches(batches, workers=workers, total=len(to_embed)):
+            if sum(counts) != embeddings.shape[0]:
+                raise ValueError("Mismatch between playbook chunks and generated embeddings.")
+
+            ids = []
+            for (name, content, _), count in zip(batch, counts):
+                doc_id = allocate_id(manifest)
+                chunk_start = allocate_chunk_ids(manifest, count)
+                ids.extend(range(chunk_start, chunk_start + count))
+                new_parents.extend([doc_id] * count)
+                writer.add(doc_id, content.strip())
+                manifest["files"][name] = {"hash": ingested[name]["hash"], "id": doc_id,
+                                           "chunk_start": chunk_start, "chunk_count": count}
+            builder.add(embeddings, np.array(ids, dtype='int64'))
+        index = builder.finish()
+        parents = np.concatenate([parents, np.array(new_parents, dtype=np.int64)])
     except Exception as e:
+        writer.abort()
         print(f"Error creating or populating FAISS index: {e}")
         return
 
+    if index is None:
+        writer.abort()
+        print("Error: No playbooks could be embedded.")
+        return
+    print(f"FAISS index updated successfully. Total vectors: {index.ntotal} "
+          f"for {len(manifest['files'])} playbooks")
+
+    # The index files are staged first and only renamed into place after the
+    # document store is committed, so a failed write leaves the previous
+    # index, manifest and documents consistent with each other.
     try:
         print(f"Saving FAISS index to '{FAISS_INDEX_PATH}'...")
-        faiss.write_index(index, FAISS_INDEX_PATH)
-        print("FAISS index saved successfully.")
+        built_for = index.ntotal if fresh_build else meta["built_for"]
+        staged = _stage_index_files(index, parents, builder.index_type, builder.params, built_for, manifest)
     except Exception as e:
+        writer.abort()
         print(f"Error saving FAISS index: {e}")
         return
 
     try:
         print(f"Saving formatted playbooks to '{DOCUMENTS_PATH}'...")
-        with open(DOCUMENTS_PATH, 'w', encoding='utf-8') as f:
-            for doc in formatted_playbooks:
-                f.write(f"{doc}\n---END---\n")
-        print("Formatted playbooks saved successfully.")
+        writer.close()
+        for path, staged_path in staged.items():
+            os.replace(staged_path, path)
+        print("FAISS index and formatted playbooks saved successfully.")
     except Exception as e:
-        print(f"Error saving formatted playbooks: {e}")
+        _discard_staged(staged)
+        print(f"Error saving FAISS index and formatted playbooks: {e}")
         return
 
+    _save_lexical_index(manifest, ingested)
+
     print("Indexing completed successfully.")
 
 def load_retrieval_system(use_gpu=True):
     """
     Load the FAISS index and playbook documents.
+
+    The index type and its default search parameters come from the build
+    metadata saved next to the index. Index types without GPU support stay on
+    the CPU.
     """
-    global index_gpu, index_cpu, documents
+    global index_gpu, index_cpu, index_meta, documents, chunk_parents, lexical_index
 
     if not os.path.exists(FAISS_INDEX_PATH):
         print(f"FAISS index file '{FAISS_INDEX_PATH}' not found. Please run the indexing step first.")
         sys.exit(1)
 
-    if not os.path.exists(DOCUMENTS_PATH):
-        print(f"Documents file '{DOCUMENTS_PATH}' not found. Please run the indexing step first.")
-        sys.exit(1)
+    if not (os.path.exists(DOCUMENTS_PATH) and os.path.exists(DOCUMENTS_INDEX_PATH)):
+        if not os.path.exists(LEGACY_DOCUMENTS_PATH):
+            print(f"Documents file '{DOCUMENTS_PATH}' not found. Please run the indexing step first.")
+            sys.exit(1)
+        print(f"Converting legacy '{LEGACY_DOCUMENTS_PATH}' into a document store...")
+        try:
+            convert_legacy_documents(LEGACY_DOCUMENTS_PATH, DOCUMENTS_PATH, DOCUMENTS_INDEX_PATH)
+        except Exception as e:
+            print(f"Error converting legacy documents: {e}")
+            sys.exit(1)
 
     print("Loading FAISS index from file...")
     try:
         index_cpu = faiss.read_index(FAISS_INDEX_PATH)
-        print("FAISS index loaded from file successfully.")
+        index_meta = read_index_meta(FAISS_INDEX_PATH)
+        params = index_meta.get("params", {})
+        apply_search_params(index_cpu, index_meta["index_type"], params.get("nprobe"), params.get("ef_search"))
+        query_cache.set_generation(index_meta.get("generation"))
+        print(f"FAISS index loaded from file successfully ({index_meta['index_type']}, {index_cpu.ntotal} vectors).")
     except Exception as e:
         print(f"Error loading FAISS index: {e}")
         sys.exit(1)
 
-    if use_gpu:
+    if use_gpu and not gpu_compatible(index_meta["index_type"]):
+        print(f"'{index_meta['index_type']}' indexes are searched on the CPU.")
+        index_gpu = None
+    elif use_gpu:
         print("Transferring FAISS index to GPU...")
         try:
             gpu_res = faiss.StandardGpuResources()
             index_gpu = faiss.index_cpu_to_gpu(gpu_res, 0, index_cpu)
+            apply_search_params(index_gpu, index_meta["index_type"], index_meta.get("params", {}).get("nprobe"))
             print("FAISS index transferred to GPU successfully.")
         except Exception as e:
             print(f"Error transferring FAISS index to GPU: {e}")
@@ -154,67 +425,213 @@ def load_retrieval_system(use_gpu=True):
     else:
         index_gpu = None
 
-    print(f"Loading playbook contents from '{DOCUMENTS_PATH}'...")
+    print(f"Opening playbook document store '{DOCUMENTS_PATH}'...")
     try:
-        with open(DOCUMENTS_PATH, 'r', encoding='utf-8') as f:
-            documents = [line.strip() for line in f]
-        print("Playbook contents loaded successfully.")
+        if documents is not None:
+            documents.close()
+        documents = DocumentStore(DOCUMENTS_PATH, DOCUMENTS_INDEX_PATH)
+        print(f"Playbook document store opened with {len(documents)} playbooks.")
+        # Indexes built before chunking store one vector per playbook under its document id.
+        chunk_parents = np.load(CHUNK_MAP_PATH, mmap_mode='r') if os.path.exists(CHUNK_MAP_PATH) else None
     except Exception as e:
         print(f"Error loading playbook contents: {e}")
         sys.exit(1)
 
+    lexical_index = None
+    if os.path.exists(LEXICAL_INDEX_PATH):
+        try:
+            lexical_index = LexicalIndex(LEXICAL_INDEX_PATH)
+            print(f"Lexical index loaded with {len(lexical_index)} terms.")
+        except Exception as e:
+            print(f"Error loading lexical index: {e}. Using vector search only.")
+    else:
+        print(f"Lexical index '{LEXICAL_INDEX_PATH}' not found. Using vector search only.")
+
     print("Retrieval system loaded successfully.")
 
-def retrieve_playbooks(query, top_k=TOP_K, use_gpu=True):
+def _search_index(index, query_embeddings, top_k, nprobe=None, ef_search=None):
+    """
+    Search the index, temporarily overriding its query-time parameters if asked.
+
+    Overrides are set on the shared index, so every search of a tunable index
+    holds `_search_lock`. Otherwise a concurrent search could pick up, or have
+    reset mid-search, another caller's parameters.
+    """
+    index_type = index_meta.get("index_type", "flat")
+    if index_type == 'flat':
+        return index.search(query_embeddings, top_k)
+
+    defaults = index_meta.get("params", {})
+    with _search_lock:
+        if nprobe is None and ef_search is None:
+            return index.search(query_embeddings, top_k)
+        apply_search_params(index, index_type, nprobe, ef_search)
+        try:
+            return index.search(query_embeddings, top_k)
+        finally:
+            apply_search_params(index, index_type, defaults.get("nprobe"), defaults.get("ef_search"))
+
+def _distinct_parents(ids):
+    return len({int(chunk_parents[chunk_id]) for chunk_id in ids
+                if chunk_id >= 0 and chunk_parents[chunk_id] >= 0})
+
+def _aggregate_chunk_hits(distances, ids, top_k):
+    """
+    Rank parent playbooks from chunk search hits.
+
+    A playbook scores the similarity of its best matching chunk plus
+    CHUNK_HIT_WEIGHT times the similarity of each further matching chunk.
+
+    Returns:
+        list: (document id, score) pairs, best first, at most top_k long.
+    """
+    scores = {}
+    for distance, chunk_id in zip(distances, ids):
+        if chunk_id < 0:
+            continue
+        doc_id = int(chunk_parents[chunk_id]) if chunk_parents is not None else int(chunk_id)
+        if doc_id < 0:
+            continue
+        similarity = 1.0 / (1.0 + float(distance))
+        if doc_id in scores:
+            scores[doc_id] += CHUNK_HIT_WEIGHT * similarity
+        else:
+            scores[doc_id] = similarity
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return ranked[:top_k]
+
+def _fuse_rankings(vector_ranked, lexical_ranked, top_k):
+    """
+    Combine vector and BM25 rankings of one query.
+
+    A playbook scores its vector similarity plus LEXICAL_WEIGHT times its
+    saturated BM25 score, so a single common term adds little while several
+    rare exact matches add up to LEXICAL_WEIGHT. Playbooks found only by the
+    lexical index are scored as the weakest vector candidate.
+
+    Returns:
+        list: (document id, score) pairs, best first, at most top_k long.
+    """
+    if not lexical_ranked:
+        return vector_ranked[:top_k]
+    vector_scores = dict(vector_ranked)
+    floor = min(vector_scores.values(), default=0.0)
+    scores = dict(vector_scores)
+    for doc_id, bm25 in lexical_ranked:
+        scores[doc_id] = vector_scores.get(doc_id, floor) + LEXICAL_WEIGHT * bm25 / (bm25 + LEXICAL_SATURATION)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return ranked[:top_k]
+
+def retrieve_playbooks(query, top_k=TOP_K, use_gpu=True, nprobe=None, ef_search=None):
     """
     Retrieve the top_k most relevant playbooks based on the query.
+
+    The index holds one vector per play/task chunk, so top_k * CHUNK_OVERSAMPLE
+    chunks are searched and aggregated back to their parent playbooks. The
+    search is widened while those chunks come from fewer than top_k playbooks.
+    When the lexical index is loaded, its BM25 ranking is fused with the vector
+    ranking.
+
+    `nprobe` (IVF indexes) and `ef_search` (HNSW indexes) override the index's
+    default recall/latency trade-off for this query only.
+
+    Query embeddings and ranked ids are served from `query_cache` when the same
+    normalized query was seen recently against the loaded index generation.
     """
-    global index_gpu, index_cpu
+    return retrieve_playbooks_batch([query], top_k, use_gpu, nprobe, ef_search)[0]
 
-    print("Initializing embedding model for retrieval...")
-    try:
-        embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        print("Embedding model initialized successfully.")
-    except Exception as e:
-        print(f"Error initializing embedding model: {e}")
-        return []
+def retrieve_playbooks_batch(queries, top_k=TOP_K, use_gpu=True, nprobe=None, ef_search=None):
+    """
+    Retrieve the top_k most relevant playbooks for each of several queries.
 
-    print("Generating embedding for the query...")
-    try:
-        query_embedding = embedding_model.encode([query]).astype('float32')
-        print("Query embedding generated successfully.")
-    except Exception as e:
-        print(f"Error generating query embedding: {e}")
-        return []
+    Queries missing from `query_cache` are encoded in one model call and
+    searched with one `index.search` over the stacked embeddings, which is much
+    cheaper per query than calling `retrieve_playbooks` in a loop.
 
-    print("Performing similarity search...")
-    try:
-        index = index_gpu if use_gpu else index_cpu
-        if index is None:
-            raise ValueError("FAISS index is not loaded.")
-        distances, indices = index.search(query_embedding, top_k)
-        print(f"Retrieved indices: {indices}")
-        print(f"Distances: {distances}")
-    except Exception as e:
-        print(f"Error during similarity search: {e}")
-        return []
+    Returns:
+        list: One list of playbooks per query, in the order of `queries`.
+    """
+    global index_gpu, index_cpu, documents
 
-    try:
-        with open(DOCUMENTS_PATH, 'r', encoding='utf-8') as f:
-            all_playbooks = f.read().split("\n---END---\n")
-        print(f"Total playbooks loaded: {len(all_playbooks)}")
-    except Exception as e:
-        print(f"Error loading playbooks: {e}")
-        return []
+    search_params = {"nprobe": nprobe, "ef_search": ef_search}
+    unique_queries = list(dict.fromkeys(queries))
+    ranked_by_query = {}
+    embeddings = {}
+    for query in unique_queries:
+        ranked = query_cache.get_results(query, top_k, search_params)
+        if ranked is not None:
+            ranked_by_query[query] = ranked
+            continue
+        embedding = query_cache.get_embedding(query)
+        if embedding is not None:
+            embeddings[query] = embedding
+    if ranked_by_query:
+        print(f"Query cache hit: reusing retrieved playbook ids for {len(ranked_by_query)} query(ies).")
+
+    to_search = [query for query in unique_queries if query not in ranked_by_query]
+    to_encode = [query for query in to_search if query not in embeddings]
+    if to_encode:
+        print(f"Generating embeddings for {len(to_encode)} query(ies)...")
+        try:
+            for query, embedding in zip(to_encode, encode(to_encode)):
+                embedding = embedding.reshape(1, -1)
+                query_cache.put_embedding(query, embedding)
+                embeddings[query] = embedding
+            print("Query embeddings generated successfully.")
+        except Exception as e:
+            print(f"Error generating query embeddings: {e}")
+            to_search = [query for query in to_search if query in embeddings]
 
-    retrieved = []
-    for idx in indices[0]:
-        if 0 <= idx < len(all_playbooks):
-            retrieved.append(all_playbooks[idx].strip())
-        else:
-            print(f"Invalid index retrieved: {idx}")
-    print(f"Retrieved {len(retrieved)} playbooks.")
-    return retrieved
+    if to_search:
+        print(f"Performing similarity search for {len(to_search)} query(ies)...")
+        try:
+            index = index_gpu if use_gpu and index_gpu is not None else index_cpu
+            if index is None:
+                raise ValueError("FAISS index is not loaded.")
+            search_k = top_k if chunk_parents is None else min(top_k * CHUNK_OVERSAMPLE, max(index.ntotal, 1))
+            query_embeddings = np.vstack([embeddings[query] for query in to_search]).astype('float32')
+            distances, indices = _search_index(index, query_embeddings, search_k, nprobe, ef_search)
+            hits = list(zip(distances, indices))
+            # One long playbook can fill the whole window with its own chunks;
+            # widen the search for those queries until top_k playbooks show up.
+            while chunk_parents is not None and search_k < index.ntotal:
+                short = [row for row, (_, ids) in enumerate(hits) if _distinct_parents(ids) < top_k]
+                if not short:
+                    break
+                search_k = min(search_k * 2, index.ntotal)
+                distances, indices = _search_index(index, query_embeddings[short], search_k, nprobe, ef_search)
+                for row, row_distances, row_ids in zip(short, distances, indices):
+                    hits[row] = (row_distances, row_ids)
+            use_lexical = lexical_index is not None and LEXICAL_WEIGHT > 0
+            depth = max(top_k, FUSION_DEPTH) if use_lexical else top_k
+            for row, query in enumerate(to_search):
+                ranked = _aggregate_chunk_hits(*hits[row], depth)
+                if use_lexical:
+                    ranked = _fuse_rankings(ranked, lexical_index.search(query, depth), top_k)
+                query_cache.put_results(query, top_k, ranked, search_params)
+                ranked_by_query[query] = ranked
+        except Exception as e:
+            print(f"Error during similarity search: {e}")
+
+    if documents is None:
+        print("Playbook document store is not loaded.")
+        return [[] for _ in queries]
+
+    results = {}
+    for query in unique_queries:
+        ranked = ranked_by_query.get(query, [])
+        print(f"Retrieved playbook ids: {[doc_id for doc_id, _ in ranked]}")
+        print(f"Scores: {[round(score, 4) for _, score in ranked]}")
+        retrieved = []
+        for idx, _ in ranked:
+            doc = documents.get(idx)
+            if doc is not None:
+                retrieved.append(doc)
+            else:
+                print(f"Invalid index retrieved: {idx}")
+        print(f"Retrieved {len(retrieved)} playbooks.")
+        results[query] = retrieved
+    return [list(results[query]) for query in queries]
 
 def prune_ansible_playbook(response):
     """
@@ -229,36 +646,105 @@ def prune_ansible_playbook(response):
         print(f"Expected a dictionary, but got {type(response)}.")
         return "Invalid response format."
 
-    code_block_match = re.search(r'```([\s\S]+?)```', response_message)
+    code_block_match = CODE_BLOCK_PATTERN.search(response_message)
     if code_block_match:
         code_block = code_block_match.group(1)
-        playbook_match = re.search(r'---[\s\S]+?(?:\n\.\.\.|$)', code_block)
+        playbook_match = PLAYBOOK_PATTERN.search(code_block)
         return playbook_match.group(0) if playbook_match else "No valid playbook found."
     return "No code block found."
 
+class CompletePlaybookCheck:
+    """
+    Stop condition for one streamed generation: true once the text contains a
+    closed code block holding a playbook, i.e. as soon as
+    prune_ansible_playbook would be able to extract one.
+
+    The text grows by one chunk per call, so only the new chunk (plus two
+    characters of overlap for a fence split across chunks) is scanned for
+    fences, and the code block pattern only runs when a fence was added.
+    """
+
+    def __init__(self):
+        self.fences = 0
+        self.complete = False
+        self._scanned = 0
+        self._next_fence = 0
+
+    def __call__(self, text):
+        if self.complete:
+            return True
+        found = False
+        position = text.find('```', max(self._next_fence, self._scanned - 2))
+        while position != -1:
+            self.fences += 1
+            found = True
+            self._next_fence = position + 3
+            position = text.find('```', self._next_fence)
+        self._scanned = len(text)
+        if not found or self.fences < 2:
+            return False
+        code_block_match = CODE_BLOCK_PATTERN.search(text)
+        self.complete = bool(code_block_match and PLAYBOOK_PATTERN.search(code_block_match.group(1)))
+        return self.complete
+
+def warm_up_llama(model_name=MODEL_NAME):
+    """
+    Load the model into Ollama on a background thread so the first generation
+    does not pay for it.
+    """
+    def _preload():
+        try:
+            ollama_client.preload_model(model_name)
+            print(f"LLaMA model '{model_name}' is loaded in Ollama.")
+        except Exception as e:
+            print(f"Error preloading LLaMA model '{model_name}': {e}")
+
+    thread = threading.Thread(target=_preload, name="llama-warmup", daemon=True)
+    thread.start()
+    return thread
+
 def query_llama(prompt, model_name=MODEL_NAME):
     """
-    Query the LLaMA model via Ollama with the given prompt.
+    Query the LLaMA model via the Ollama HTTP API with the given prompt.
+
+    The response is streamed and generation stops as soon as a complete
+    fenced playbook has been produced.
     """
-    command = ['ollama', 'run', model_name, prompt]
     try:
         print(f"Querying LLaMA model '{model_name}'...")
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+        response = ollama_client.generate(model_name, prompt, options=LLM_OPTIONS, stop_when=CompletePlaybookCheck())
         print("Received response from LLaMA.")
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        print(f"Error querying LLaMA: {e.stderr}")
+        return response.strip()
+    except Exception as e:
+        print(f"Error querying LLaMA: {e}")
         return None
 
-def generate_ansible_playbook(task_description, regenerate_with_ai=False, use_gpu=True):
+def _generate_playbook(prompt, exclude=()):
+    """
+    Generate a playbook for `prompt`, reusing cached generations for the same
+    model and prompt that are not in `exclude`.
+    """
+    def generate():
+        response_content = query_llama(prompt)
+        return prune_ansible_playbook({'content': response_content}) if response_content else "Failed to generate playbook."
+
+    key = make_key(MODEL_NAME, prompt, LLM_OPTIONS)
+    return generation_cache.get_or_generate(
+        key, generate, exclude=exclude, cacheable=lambda playbook: playbook.startswith('---')
+    )
+
+def generate_ansible_playbook(task_description, regenerate_with_ai=False, use_gpu=True, exclude=()):
     """
     Generate an Ansible playbook for the given task description.
+
+    Playbooks listed in `exclude` (e.g. the ones already offered for an
+    incident) are not returned from the generation cache, so a repeated
+    request yields a different candidate.
     """
     if regenerate_with_ai:
         print("Strict AI generation requested.")
         prompt = f"Write a single Ansible playbook for the following task: {task_description}. Don't explain anything, just return the playbook."
-        response_content = query_llama(prompt)
-        return prune_ansible_playbook({'content': response_content}) if response_content else "Failed to generate playbook."
+        return _generate_playbook(prompt, exclude)
 
     print("Attempting to retrieve playbooks...")
     retrieved_playbooks = retrieve_playbooks(task_description, use_gpu=use_gpu)
@@ -267,5 +753,4 @@ def generate_ansible_playbook(task_description, regenerate_with_ai=False, use_gp
 
     print("No relevant playbooks found. Generating a new playbook.")
     prompt = f"Write a single Ansible playbook for the following task: {task_description}. Don't explain anything, just return the playbook."
-    response_content = query_llama(prompt)
-    return prune_ansible_playbook({'content': response_content}) if response_content else "Failed to generate playbook."
+    return _generate_playbook(prompt, exclude)
@@ -0,0 +1,593 @@
+"""
+Local stand-ins for ServiceNow, AWX, Ollama and GitHub used by the load
+test and the tests, plus an offline embedding model.
+
+Each fake is a threaded HTTP server that implements just the endpoints the
+engine calls, with a configurable response latency:
+
+- `FakeServiceNow`: the incident and sys_journal_field Table API endpoints,
+  including the encoded queries the pollers send (element_idIN,
+  gs.dateGenerate high-water marks, ORDERBY, paging). PATCHed comments are
+  added to the journal the way ServiceNow does, as written by `api_user`,
+  and every PATCH is reported to an `on_update` callback so simulated users
+  can answer.
+- `FakeAWX`: job template lookup/creation, launches, project updates, and
+  the `id__in` list endpoints the job watcher polls. Jobs finish after
+  `job_duration` seconds and fail with probability `fail_rate`. It also
+  serves the session login of `/api/login/`, and `FakeAWXWebSocket` stands in
+  for a websocket-client `WebSocketApp` talking to its `/websocket/` event
+  consumer.
+- `FakeOllama`: a streaming `/api/generate` that emits a fenced playbook
+  token by token after `first_token_latency`, optionally followed by an
+  `epilogue` of prose, the way models often explain what they wrote.
+- `FakeGitHub`: code search with `per_page` paging and Link headers, and
+  raw file content with ETags that answers conditional requests with 304.
+- `HashingEncoder`: a drop-in for the SentenceTransformer model that hashes
+  words into a small vector, so indexing runs without downloading a model.
+
+Journal and incident sys_ids are increasing counters rather than random
+GUIDs. Comments created within the same second then sort in creation order,
+as the engine expects.
+"""
+
+import bisect
+import hashlib
+import itertools
+import json
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import numpy as np
+
+_ID_SEGMENT = re.compile(r'/(\d+|[0-9a-f]{32})(?=/|$)')
+_SINCE_PATTERN = re.compile(r"^(\w+)>=javascript:gs\.dateGenerate\('([^']+)','([^']+)'\)$")
+
+
+def _raw_response(status, data, headers):
+    def respond(handler):
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+    return respond
+
+
+def _timestamp(seconds=None):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(seconds))
+
+
+class Latency:
+    """
+    Response delay: `mean` seconds plus up to `jitter` seconds of uniform noise.
+    """
+
+    def __init__(self, mean=0.0, jitter=0.0):
+        self.mean = mean
+        self.jitter = jitter
+
+    def sleep(self):
+        delay = self.mean + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class _FakeServer:
+    """
+    Threaded HTTP server dispatching to `handle(method, path, query, body)`.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency=None, host="127.0.0.1", port=0):
+        self.latency = latency or Latency()
+        self.requests = {}
+        self._stats_lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _dispatch(self, method):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get("Content-Length", 0))
+                data = self.rfile.read(length) if length else b""
+                if not data:
+                    body = None
+                elif self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                    body = {name: values[0] for name, values in parse_qs(data.decode('utf-8')).items()}
+                else:
+                    body = json.loads(data)
+                server._count(method, parsed.path)
+                server.latency.sleep()
+                try:
+                    status, payload = server.handle(method, parsed.path, parse_qs(parsed.query), body)
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+                if callable(payload):
+                    payload(self)
+                    return
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_PATCH(self):
+                self._dispatch("PATCH")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://{host}:{self._server.server_address[1]}"
+        self._thread = None
+
+    def _count(self, method, path):
+        label = f"{method} {_ID_SEGMENT.sub('/{id}', path)}"
+        with self._stats_lock:
+            self.requests[label] = self.requests.get(label, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"{self.name}-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, method, path, query, body):
+        raise NotImplementedError
+
+
+def _matches(record, term):
+    """
+    Evaluate one term of a ServiceNow encoded query against a record.
+    """
+    since = _SINCE_PATTERN.match(term)
+    if since:
+        field, date, time_of_day = since.groups()
+        return record.get(field, "") >= f"{date} {time_of_day}"
+    if "IN" in term and "=" not in term.split("IN", 1)[0]:
+        field, values = term.split("IN", 1)
+        return record.get(field) in set(values.split(","))
+    if "!=" in term:
+        field, value = term.split("!=", 1)
+        return str(record.get(field)) != value
+    field, value = term.split("=", 1)
+    return str(record.get(field)) == value
+
+
+def _query_table(records, query, fields, offset, limit):
+    terms = [term for term in query.split("^") if term]
+    order = [term for term in terms if term.startswith("ORDERBY")]
+    filters = [term for term in terms if not term.startswith("ORDERBY")]
+    rows = [record for record in records if all(_matches(record, term) for term in filters)]
+    for term in reversed(order):
+        descending = term.startswith("ORDERBYDESC")
+        field = term[len("ORDERBYDESC"):] if descending else term[len("ORDERBY"):]
+        rows.sort(key=lambda record: record.get(field, ""), reverse=descending)
+    rows = rows[offset:offset + limit]
+    if fields:
+        rows = [{field: record.get(field) for field in fields} for record in rows]
+    return rows
+
+
+class FakeServiceNow(_FakeServer):
+    """
+    In-memory incident and journal tables behind the ServiceNow Table API.
+    """
+
+    name = "servicenow"
+
+    def __init__(self, latency=None, on_update=None, api_user="admin", **kwargs):
+        super().__init__(latency, **kwargs)
+        self.on_update = on_update
+        self.api_user = api_user
+        self.incidents = {}
+        self.journal = []
+        self._journal_times = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._numbers = itertools.count(10001)
+
+    def _sys_id(self):
+        return f"{next(self._ids):032x}"
+
+    def create_incident(self, short_description):
+        """
+        Open a new incident and return its record.
+        """
+        with self._lock:
+            now = _timestamp()
+            incident = {
+                "sys_id": self._sys_id(),
+                "number": f"INC{next(self._numbers):07d}",
+                "short_description": short_description,
+                "state": "1",
+                "active": "true",
+                "sys_updated_on": now,
+            }
+            self.incidents[incident["sys_id"]] = incident
+            return dict(incident)
+
+    def add_comment(self, incident_sys_id, text, author="user", created=None):
+        """
+        Add a comment to an incident's journal, as `author` would in the UI.
+        `created` overrides the creation timestamp, which must not go back in time.
+        """
+        with self._lock:
+            now = created or _timestamp()
+            self.journal.append({
+                "sys_id": self._sys_id(),
+                "name": "incident",
+                "element": "comments",
+                "element_id": incident_sys_id,
+                "value": text,
+                "sys_created_on": now,
+                "sys_created_by": author,
+            })
+            self._journal_times.append(now)
+            self.incidents[incident_sys_id]["sys_updated_on"] = now
+
+    def handle(self, method, path, query, body):
+        parts = [part for part in path.split("/") if part]
+        if parts[:3] != ["api", "now", "table"] or len(parts) < 4:
+            return 404, {"error": "not found"}
+        table = parts[3]
+        if method == "GET" and table in ("incident", "sys_journal_field"):
+            encoded_query = query.get("sysparm_query", [""])[0]
+            with self._lock:
+                if table == "incident":
+                    records = list(self.incidents.values())
+                else:
+                    # The journal is appended in time order, so a high-water mark is a bisect
+                    since = next((match.groups() for match in map(_SINCE_PATTERN.match, encoded_query.split("^"))
+                                  if match and match.group(1) == "sys_created_on"), None)
+                    start = bisect.bisect_left(self._journal_times, f"{since[1]} {since[2]}") if since else 0
+                    records = self.journal[start:]
+                fields = query.get("sysparm_fields", [""])[0]
+                rows = _query_table(records, encoded_query,
+                                    fields.split(",") if fields else None,
+                                    int(query.get("sysparm_offset", ["0"])[0]),
+                                    int(query.get("sysparm_limit", ["10000"])[0]))
+            return 200, {"result": rows}
+        if method == "PATCH" and table == "incident" and len(parts) == 5:
+            sys_id = parts[4]
+            with self._lock:
+                incident = self.incidents.get(sys_id)
+                if incident is None:
+                    return 404, {"error": "no such incident"}
+                for field, value in body.items():
+                    if field != "comments":
+                        incident[field] = str(value)
+                incident["sys_updated_on"] = _timestamp()
+                snapshot = dict(incident)
+            if "comments" in body:
+                self.add_comment(sys_id, body["comments"], author=self.api_user)
+            if self.on_update is not None:
+                self.on_update(snapshot, body)
+            return 200, {"result": snapshot}
+        return 405, {"error": "unsupported"}
+
+
+class FakeAWX(_FakeServer):
+    """
+    Job templates, jobs and project updates of a fake AWX, served under /api/v2.
+    """
+
+    name = "awx"
+
+    def __init__(self, latency=None, job_duration=Latency(5.0), project_update_duration=Latency(2.0),
+                 fail_rate=0.0, username="admin", password="password", **kwargs):
+        super().__init__(latency, **kwargs)
+        self.job_duration = job_duration
+        self.project_update_duration = project_update_duration
+        self.fail_rate = fail_rate
+        self.username = username
+        self.password = password
+        self.sessions = {}
+        self.templates = {}
+        self.units = {"job": {}, "project_update": {}}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    @property
+    def api_url(self):
+        return f"{self.url}/api/v2"
+
+    def _start_unit(self, kind, duration):
+        seconds = duration.mean + random.uniform(0, duration.jitter)
+        status = "failed" if kind == "job" and random.random() < self.fail_rate else "successful"
+        with self._lock:
+            unit_id = next(self._ids)
+            self.units[kind][unit_id] = (time.monotonic() + seconds, status)
+        return unit_id
+
+    def _status(self, kind, unit_id):
+        finishes, status = self.units[kind][unit_id]
+        return status if time.monotonic() >= finishes else "running"
+
+    def finished_units(self):
+        """
+        Return (kind, id, status) of every job and project update that has finished.
+        """
+        with self._lock:
+            return [(kind, unit_id, self._status(kind, unit_id))
+                    for kind, units in self.units.items() for unit_id in units
+                    if self._status(kind, unit_id) != "running"]
+
+    def _login(self, method, body):
+        def respond(handler):
+            cookies = dict(part.strip().split("=", 1) for part in handler.headers.get("Cookie", "").split(";")
+                           if "=" in part)
+            form = b"<form></form>"
+            if method == "GET":
+                _raw_response(200, form, {"Content-Type": "text/html",
+                                          "Set-Cookie": f"csrftoken={secrets.token_hex(16)}; Path=/"})(handler)
+                return
+            if not (cookies.get("csrftoken") and handler.headers.get("X-CSRFToken") == cookies["csrftoken"]
+                    and body and body.get("username") == self.username and body.get("password") == self.password):
+                # Django renders the form again after a failed login
+                _raw_response(200, form, {"Content-Type": "text/html"})(handler)
+                return
+            # Like Django, rotate the CSRF token on login
+            session_id, csrftoken = secrets.token_hex(16), secrets.token_hex(16)
+            with self._lock:
+                self.sessions[session_id] = csrftoken
+            handler.send_response(302)
+            handler.send_header("Set-Cookie", f"sessionid={session_id}; Path=/; HttpOnly")
+            handler.send_header("Set-Cookie", f"csrftoken={csrftoken}; Path=/")
+            handler.send_header("Location", body.get("next", "/api/"))
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+        return respond
+
+    def handle(self, method, path, query, body):
+        if path == "/api/login/" and method in ("GET", "POST"):
+            return 200, self._login(method, body)
+        parts = [part for part in path.split("/") if part]
+        if parts[:2] != ["api", "v2"]:
+            return 404, {"detail": "not found"}
+        parts = parts[2:]
+        if parts == ["job_templates"] and method == "GET":
+            name = query.get("name", [None])[0]
+            with self._lock:
+                results = [t for t in self.templates.values() if name is None or t["name"] == name]
+            return 200, {"count": len(results), "results": results}
+        if parts == ["job_templates"] and method == "POST":
+            with self._lock:
+                template = dict(body, id=next(self._ids))
+                self.templates[template["id"]] = template
+            return 201, template
+        if len(parts) == 2 and parts[0] == "job_templates" and method == "PATCH":
+            with self._lock:
+                template = self.templates.get(int(parts[1]))
+                if template is None:
+                    return 404, {"detail": "not found"}
+                template.update(body)
+            return 200, template
+        if len(parts) == 3 and parts[0] == "job_templates" and parts[2] == "launch" and method == "POST":
+            if int(parts[1]) not in self.templates:
+                return 404, {"detail": "not found"}
+            job_id = self._start_unit("job", self.job_duration)
+            return 201, {"job": job_id, "id": job_id}
+        if len(parts) == 3 and parts[0] == "projects" and parts[2] == "update" and method == "POST":
+            update_id = self._start_unit("project_update", self.project_update_duration)
+            return 202, {"id": update_id, "project_update": update_id}
+        if len(parts) == 1 and parts[0] in ("jobs", "project_updates") and method == "GET":
+            kind = "job" if parts[0] == "jobs" else "project_update"
+            ids = [int(value) for value in query.get("id__in", [""])[0].split(",") if value]
+            with self._lock:
+                results = [{"id": unit_id, "status": self._status(kind, unit_id)}
+                           for unit_id in ids if unit_id in self.units[kind]]
+            return 200, {"count": len(results), "results": results}
+        return 404, {"detail": "not found"}
+
+
+class FakeAWXWebSocket:
+    """
+    Drop-in for websocket-client's `WebSocketApp` that plays AWX's
+    `/websocket/` event consumer for a `FakeAWX`, without a socket.
+
+    Connections without a logged-in session cookie are told to close. Others
+    get `{"accept": true}`, and a group subscription is only acknowledged
+    when its `xrftoken` matches the session's CSRF token. Subscribers of the
+    "jobs" `status_changed` group then get an event for every job and project
+    update as it finishes. Pass `awx` with functools.partial.
+    """
+
+    def __init__(self, awx, url, header=None, cookie=None, on_open=None, on_message=None, **kwargs):
+        self.awx = awx
+        self.url = url
+        self.cookie = cookie or ""
+        self.on_open = on_open
+        self.on_message = on_message
+        self.groups = set()
+        self.received = []
+        self._inbox = queue.Queue()
+        self._closed = threading.Event()
+
+    def send(self, data):
+        message = json.loads(data)
+        self.received.append(message)
+        self._inbox.put(message)
+
+    def close(self):
+        self._closed.set()
+
+    def _deliver(self, event):
+        if self.on_message is not None:
+            self.on_message(self, json.dumps(event))
+
+    def run_forever(self, **kwargs):
+        cookies = dict(part.strip().split("=", 1) for part in self.cookie.split(";") if "=" in part)
+        with self.awx._lock:
+            csrftoken = self.awx.sessions.get(cookies.get("sessionid"))
+        if self.on_open is not None:
+            self.on_open(self)
+        if csrftoken is None:
+            self._deliver({"close": True})
+            return
+        self._deliver({"accept": True, "user": 1})
+        reported = set()
+        while not self._closed.is_set():
+            try:
+                message = self._inbox.get(timeout=0.02)
+            except queue.Empty:
+                message = None
+            if message is not None and "groups" in message:
+                if message.get("xrftoken") != csrftoken:
+                    self._deliver({"error": "access denied to channel"})
+                else:
+                    added = {f"{group}-{name}" for group, names in message["groups"].items() for name in names}
+                    self._deliver({"groups_current": sorted(added), "groups_left": sorted(self.groups - added),
+                                   "groups_added": sorted(added - self.groups)})
+                    self.groups = added
+            if "jobs-status_changed" in self.groups:
+                for kind, unit_id, status in self.awx.finished_units():
+                    if (kind, unit_id) not in reported:
+                        reported.add((kind, unit_id))
+                        self._deliver({"group_name": "jobs", "type": kind, "unified_job_id": unit_id,
+                                       "status": status})
+
+
+class FakeOllama(_FakeServer):
+    """
+    Streaming `/api/generate` returning a small fenced playbook.
+    """
+
+    name = "ollama"
+
+    def __init__(self, latency=None, first_token_latency=Latency(0.5), token_delay=0.01, epilogue="", **kwargs):
+        super().__init__(latency, **kwargs)
+        self.first_token_latency = first_token_latency
+        self.token_delay = token_delay
+        self.epilogue = epilogue
+        self.completed = 0
+        self._generations = itertools.count(1)
+
+    def handle(self, method, path, query, body):
+        if path != "/api/generate" or method != "POST":
+            return 404, {"error": "not found"}
+        if not body.get("prompt"):
+            return 200, {"model": body.get("model"), "done": True}
+        generation = next(self._generations)
+        playbook = ("Here is the playbook:\n```yaml\n---\n- name: Generated fix {n}\n  hosts: all\n  tasks:\n"
+                    "    - name: Apply fix {n}\n      ansible.builtin.debug:\n        msg: fixed\n```\n").format(n=generation)
+        tokens = re.findall(r"\S+\s*", playbook + self.epilogue)
+
+        def stream(handler):
+            handler.send_response(200)
+            handler.send_header("Content-Type", "application/x-ndjson")
+            handler.send_header("Transfer-Encoding", "chunked")
+            handler.end_headers()
+
+            def send(message):
+                data = (json.dumps(message) + "\n").encode('utf-8')
+                handler.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                handler.wfile.flush()
+
+            try:
+                self.first_token_latency.sleep()
+                for token in tokens:
+                    send({"model": body.get("model"), "response": token, "done": False})
+                    time.sleep(self.token_delay)
+                send({"model": body.get("model"), "response": "", "done": True})
+                handler.wfile.write(b"0\r\n\r\n")
+                self.completed += 1
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped reading once it had a complete playbook
+                handler.close_connection = True
+
+        return 200, stream
+
+
+class FakeGitHub(_FakeServer):
+    """
+    Code search over the files added with `add_file`, and their raw content.
+    Serves both the API and the raw-content host; `search_pages` records the
+    search result pages requested, in order.
+    """
+
+    name = "github"
+
+    def __init__(self, latency=None, per_page=None, **kwargs):
+        super().__init__(latency, **kwargs)
+        self.per_page = per_page
+        self.files = {}
+        self.search_pages = []
+        self._lock = threading.Lock()
+
+    def add_file(self, owner, repo, path, content):
+        with self._lock:
+            self.files[f"/{owner}/{repo}/main/{path}"] = content
+
+    def handle(self, method, path, query, body):
+        if method != "GET":
+            return 404, {"message": "Not Found"}
+        if path == "/search/code":
+            per_page = self.per_page or int(query.get("per_page", ["30"])[0])
+            page = int(query.get("page", ["1"])[0])
+            with self._lock:
+                self.search_pages.append(page)
+                paths = list(self.files)
+            items = []
+            for raw in paths[(page - 1) * per_page:page * per_page]:
+                owner, repo, ref, file_path = raw.lstrip("/").split("/", 3)
+                items.append({
+                    "html_url": f"https://github.com/{owner}/{repo}/blob/{ref}/{file_path}",
+                    "repository": {"name": repo},
+                    "path": file_path,
+                })
+            headers = {"Content-Type": "application/json"}
+            if page * per_page < len(paths):
+                params = urlencode({"q": query.get("q", [""])[0], "per_page": per_page, "page": page + 1})
+                headers["Link"] = f'<{self.url}/search/code?{params}>; rel="next"'
+            data = json.dumps({"total_count": len(paths), "items": items}).encode('utf-8')
+            return 200, _raw_response(200, data, headers)
+        with self._lock:
+            content = self.files.get(path)
+        if content is None:
+            return 404, {"message": "Not Found"}
+        etag = f'"{hashlib.sha1(content.encode("utf-8")).hexdigest()}"'
+
+        def respond(handler):
+            if handler.headers.get("If-None-Match") == etag:
+                _raw_response(304, b"", {"ETag": etag})(handler)
+            else:
+                _raw_response(200, content.encode('utf-8'), {"Content-Type": "text/plain", "ETag": etag})(handler)
+
+        return 200, respond
+
+
+class HashingEncoder:
+    """
+    Bag-of-words stand-in for the sentence embedding model.
+    """
+
+    def __init__(self, dimension=64):
+        self.dimension = dimension
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, int(hashlib.md5(word.encode('utf-8')).hexdigest(), 16) % self.dimension] += 1
+        return vectors
@@ -0,0 +1,372 @@
+"""
+End-to-end load test of the incident pipeline against local fakes.
+
+Starts the fake ServiceNow, AWX and Ollama servers from fake_services.py,
+points the engine at them through the usual environment variables, and runs
+`IncidentEngine` in-process. Synthetic incidents are opened at a fixed
+arrival rate. Each one is answered by a simulated user who replies 'Search'
+to the welcome message and then picks playbook 1; a configurable share ask
+for 'Generate' first. Every incident therefore goes through
+search -> choose -> deploy, with playbooks committed to a throwaway Git
+repository and launched on the fake AWX.
+
+The report gives incidents/minute, time to first response and per-stage
+latencies. Each stage is measured from the user's comment to the engine's
+answer, so poll intervals, batching and queueing are included. The engine's
+own per-endpoint HTTP latency histograms are reported as well. Engine output
+(including git's) goes to loadtest.log in the workspace.
+
+Retrieval uses the FAISS index in the repository root when one exists
+(--retrieval auto). Without it, every search falls back to generation on
+the fake Ollama.
+
+Usage:
+    python loadtest/run_loadtest.py --incidents 2000 --arrival-rate 20 --job-duration 5
+"""
+
+import argparse
+import asyncio
+import contextlib
+import heapq
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Access parent directory
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(parent_dir))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_services import FakeAWX, FakeOllama, FakeServiceNow, Latency
+
+INCIDENT_TEMPLATES = [
+    "Nginx returns 502 on {host}",
+    "Disk almost full on {host}, clean up old logs",
+    "Install and enable the ufw firewall on {host}",
+    "MySQL service is down on {host}",
+    "Docker daemon not running on {host}",
+    "Create user account for new developer on {host}",
+    "Rotate expired TLS certificate on {host}",
+    "Apply security updates on {host}",
+    "Set up wireguard VPN between {host} and the gateway",
+    "Redis memory usage too high on {host}",
+]
+DEPLOY_RETRIES = 2                           # Times a simulated user picks again after a failed deployment
+
+
+class Timeline:
+    """
+    Single thread running delayed callbacks in time order.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._counter = 0
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="loadtest-timeline", daemon=True)
+        self._thread.start()
+
+    def call_later(self, delay, callback, *args):
+        with self._condition:
+            self._counter += 1
+            heapq.heappush(self._heap, (time.monotonic() + delay, self._counter, callback, args))
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._condition.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, callback, args = heapq.heappop(self._heap)
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Simulated user error: {e}", file=sys.stderr)
+
+
+class SimulatedUsers:
+    """
+    Answer the engine's comments the way a user would and record when each stage starts and ends.
+    """
+
+    def __init__(self, servicenow, timeline, think_time, generate_ratio, welcome_message, choose_prompt):
+        self.servicenow = servicenow
+        self.timeline = timeline
+        self.think_time = think_time
+        self.generate_ratio = generate_ratio
+        self.welcome_message = welcome_message
+        self.choose_prompt = choose_prompt
+        self.incidents = {}
+        self.stages = {"welcome": [], "search": [], "generate": [], "deploy": [], "end_to_end": []}
+        self.deploy_failures = 0
+        self._lock = threading.Lock()
+
+    def open_incident(self, short_description):
+        incident = self.servicenow.create_incident(short_description)
+        with self._lock:
+            self.incidents[incident["sys_id"]] = {
+                "created": time.monotonic(),
+                "first_response": None,
+                "resolved": None,
+                "pending": None,
+                "wants_generate": random.random() < self.generate_ratio,
+                "retries": 0,
+                "abandoned": False,
+            }
+
+    def resolved_count(self):
+        with self._lock:
+            return sum(1 for state in self.incidents.values() if state["resolved"] is not None)
+
+    def abandoned_count(self):
+        with self._lock:
+            return sum(1 for state in self.incidents.values() if state["abandoned"])
+
+    def _reply(self, sys_id, stage, text):
+        with self._lock:
+            self.incidents[sys_id]["pending"] = (stage, None)
+        self.timeline.call_later(self._think(), self._send, sys_id, stage, text)
+
+    def _think(self):
+        return max(0.0, random.gauss(self.think_time, self.think_time / 4))
+
+    def _send(self, sys_id, stage, text):
+        with self._lock:
+            self.incidents[sys_id]["pending"] = (stage, time.monotonic())
+        self.servicenow.add_comment(sys_id, text)
+
+    def _finish_stage(self, state, now):
+        pending, state["pending"] = state["pending"], None
+        if pending is not None and pending[1] is not None:
+            self.stages[pending[0]].append(now - pending[1])
+
+    def on_update(self, incident, payload):
+        now = time.monotonic()
+        sys_id = incident["sys_id"]
+        comment = payload.get("comments") or ""
+        with self._lock:
+            state = self.incidents.get(sys_id)
+            if state is None or state["resolved"] is not None:
+                return
+            if comment and state["first_response"] is None:
+                state["first_response"] = now
+            if str(payload.get("state")) == "6":
+                self._finish_stage(state, now)
+                state["resolved"] = now
+                self.stages["end_to_end"].append(now - state["created"])
+                return
+        if comment.startswith(self.welcome_message):
+            with self._lock:
+                self.stages["welcome"].append(now - state["created"])
+            self._reply(sys_id, "search", "Search")
+        elif comment.startswith("Playbook deployment failed"):
+            with self._lock:
+                self._finish_stage(state, now)
+                self.deploy_failures += 1
+                state["retries"] += 1
+                retry = state["retries"] <= DEPLOY_RETRIES
+                state["abandoned"] = not retry
+            if retry:
+                self._reply(sys_id, "deploy", "1")
+        elif self.choose_prompt in comment:
+            with self._lock:
+                self._finish_stage(state, now)
+                wants_generate, state["wants_generate"] = state["wants_generate"], False
+            if wants_generate:
+                self._reply(sys_id, "generate", "Generate")
+            else:
+                self._reply(sys_id, "deploy", "1")
+
+
+def _summary(samples):
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples)
+    return {
+        "count": len(samples),
+        "mean_s": float(values.mean()),
+        "p50_s": float(np.percentile(values, 50)),
+        "p95_s": float(np.percentile(values, 95)),
+        "p99_s": float(np.percentile(values, 99)),
+        "max_s": float(values.max()),
+    }
+
+
+def _init_workspace(path):
+    """
+    Create a Git working tree with a local bare remote for the publisher to push to.
+    """
+    def git(*args, cwd=path):
+        subprocess.run(["git", *args], cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    remote = path / "remote.git"
+    git("init", "-q", "--bare", str(remote))
+    git("init", "-q")
+    git("checkout", "-q", "-b", "loadtest")
+    git("config", "user.name", "Wrangler Load Test")
+    git("config", "user.email", "loadtest@localhost")
+    git("remote", "add", "origin", str(remote))
+
+
+async def drive(args, users, engine, console):
+    engine_task = asyncio.create_task(engine.run())
+    started = time.monotonic()
+    deadline = started + args.timeout
+    interval = 1.0 / args.arrival_rate
+    created = 0
+    next_report = started
+    try:
+        while time.monotonic() < deadline:
+            now = time.monotonic()
+            while created < args.incidents and started + created * interval <= now:
+                template = random.choice(INCIDENT_TEMPLATES)
+                users.open_incident(template.format(host=f"srv{random.randint(1, 500):03d}"))
+                created += 1
+            resolved = users.resolved_count()
+            finished = resolved + users.abandoned_count()
+            if now >= next_report:
+                print(f"[{now - started:6.0f}s] opened {created}/{args.incidents}, resolved {resolved}",
+                      file=console)
+                next_report = now + args.report_interval
+            if finished >= args.incidents:
+                break
+            if engine_task.done():
+                engine_task.result()
+                break
+            await asyncio.sleep(min(interval, 0.5))
+    finally:
+        engine_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await engine_task
+    return time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the incident pipeline against local fake services.")
+    parser.add_argument("--incidents", type=int, default=1000)
+    parser.add_argument("--arrival-rate", type=float, default=10.0, help="incidents opened per second")
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean seconds a user takes to reply")
+    parser.add_argument("--generate-ratio", type=float, default=0.1, help="share of users asking for 'Generate'")
+    parser.add_argument("--servicenow-latency", type=float, default=0.05, help="seconds per ServiceNow call")
+    parser.add_argument("--awx-latency", type=float, default=0.05, help="seconds per AWX call")
+    parser.add_argument("--job-duration", type=float, default=5.0, help="seconds an AWX job runs")
+    parser.add_argument("--project-update-duration", type=float, default=2.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of AWX jobs that fail")
+    parser.add_argument("--ollama-latency", type=float, default=0.5, help="seconds to the first generated token")
+    parser.add_argument("--ollama-token-delay", type=float, default=0.01, help="seconds between tokens")
+    parser.add_argument("--retrieval", choices=["auto", "on", "off"], default="auto",
+                        help="load the FAISS index from the repository root")
+    parser.add_argument("--timeout", type=float, default=1800.0, help="give up after this many seconds")
+    parser.add_argument("--report-interval", type=float, default=10.0)
+    parser.add_argument("--output", default=None, help="write the JSON report here as well")
+    parser.add_argument("--keep-workspace", action="store_true")
+    args = parser.parse_args()
+
+    servicenow = FakeServiceNow(Latency(args.servicenow_latency, args.servicenow_latency / 2),
+                                api_user="loadtest").start()
+    awx = FakeAWX(Latency(args.awx_latency, args.awx_latency / 2),
+                  job_duration=Latency(args.job_duration, args.job_duration / 2),
+                  project_update_duration=Latency(args.project_update_duration),
+                  fail_rate=args.fail_rate).start()
+    ollama = FakeOllama(first_token_latency=Latency(args.ollama_latency, args.ollama_latency / 2),
+                        token_delay=args.ollama_token_delay).start()
+
+    workspace = Path(tempfile.mkdtemp(prefix="wrangler-loadtest-"))
+    _init_workspace(workspace)
+    os.environ.update({
+        "INSTANCE": servicenow.url,
+        "USERNAME": "loadtest",
+        "PASSWORD": "loadtest",
+        "AWX_URL": awx.api_url,
+        "AWX_TOKEN": "loadtest",
+        "AWX_WEBSOCKET": "false",
+        "PROJECT_ID": "1",
+        "INVENTORY_ID": "1",
+        "CREDENTIAL_ID": "1",
+        "BRANCH": "loadtest",
+        "OUT_DIRECTORY": "wrangler_out",
+        "OLLAMA_HOST": ollama.url,
+        "SESSION_DB_PATH": str(workspace / "sessions.db"),
+        "GENERATION_CACHE_PATH": str(workspace / "generation_cache.db"),
+        "QUERY_CACHE_PATH": "",
+        "TOKENIZERS_PARALLELISM": "false",
+    })
+
+    # Engine output, including that of the git subprocesses, goes to the log; progress to the real stderr
+    sys.stderr.flush()
+    console = os.fdopen(os.dup(2), "w", buffering=1)
+    log = open(workspace / "loadtest.log", "w", encoding="utf-8")
+    os.dup2(log.fileno(), 2)
+    try:
+        with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            # Imported only now: these modules read their settings at import time
+            import http_client
+            import llama_interface
+            from embedding_service import embedding_stats
+            from incident_engine import CHOOSE_PROMPT, WELCOME_MESSAGE, IncidentEngine
+
+            has_index = os.path.exists(parent_dir / llama_interface.FAISS_INDEX_PATH)
+            if args.retrieval == "on" or (args.retrieval == "auto" and has_index):
+                os.chdir(parent_dir)
+                llama_interface.load_retrieval_system(use_gpu=False)
+            os.chdir(workspace)
+
+            timeline = Timeline()
+            users = SimulatedUsers(servicenow, timeline, args.think_time, args.generate_ratio,
+                                   WELCOME_MESSAGE, CHOOSE_PROMPT)
+            servicenow.on_update = users.on_update
+            engine = IncidentEngine(use_gpu=False)
+            print(f"Load test workspace: {workspace}", file=console)
+            elapsed = asyncio.run(drive(args, users, engine, console))
+    finally:
+        os.dup2(console.fileno(), 2)
+        console.close()
+        log.close()
+        servicenow.stop()
+        awx.stop()
+        ollama.stop()
+
+    resolved = users.resolved_count()
+    report = {
+        "config": vars(args),
+        "retrieval_loaded": llama_interface.index_cpu is not None,
+        "incidents": {
+            "opened": len(users.incidents),
+            "resolved": resolved,
+            "abandoned": users.abandoned_count(),
+            "unresolved": len(users.incidents) - resolved,
+            "deploy_failures": users.deploy_failures,
+        },
+        "elapsed_seconds": elapsed,
+        "incidents_per_minute": resolved / (elapsed / 60.0) if elapsed > 0 else 0.0,
+        "time_to_first_response": _summary([state["first_response"] - state["created"]
+                                            for state in users.incidents.values()
+                                            if state["first_response"] is not None]),
+        "stages": {stage: _summary(samples) for stage, samples in users.stages.items()},
+        "engine_http": http_client.latency_stats(),
+        "embedding": embedding_stats(),
+        "fake_requests": {"servicenow": servicenow.requests, "awx": awx.requests, "ollama": ollama.requests},
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    print(json.dumps(report, indent=1))
+
+    if args.keep_workspace:
+        print(f"Workspace kept at {workspace}", file=sys.stderr)
+    else:
+        shutil.rmtree(workspace, ignore_errors=True)
+    sys.exit(0 if resolved == len(users.incidents) == args.incidents else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+HTTP client for a local Ollama server.
+
+Generations go through a pooled keep-alive `requests` session against
+Ollama's `/api/generate` endpoint instead of spawning `ollama run` for every
+prompt. Responses are streamed token by token so callers can stop as soon as
+they have what they need, and `keep_alive` keeps the model resident between
+requests.
+"""
+
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")                     # How long Ollama keeps the model loaded
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))      # Seconds to establish a connection
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "300"))          # Seconds to wait for the next token
+OLLAMA_TOTAL_TIMEOUT = float(os.getenv("OLLAMA_TOTAL_TIMEOUT", "1800"))       # Seconds for a whole generation
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "4"))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class OllamaError(Exception):
+    pass
+
+
+def _base_url():
+    host = OLLAMA_HOST.rstrip('/')
+    return host if host.startswith(('http://', 'https://')) else f"http://{host}"
+
+
+def get_session():
+    """
+    Return the shared keep-alive session, creating it on first use.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OLLAMA_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+
+def generate(model, prompt, options=None, stop_when=None, total_timeout=OLLAMA_TOTAL_TIMEOUT):
+    """
+    Stream a completion from Ollama.
+
+    Args:
+        model (str): Ollama model name.
+        prompt (str): Prompt text.
+        options (dict): Sampling options (temperature, seed, num_predict, ...).
+        stop_when (callable): Called with the text generated so far after each
+            streamed chunk; returning True ends the generation early.
+        total_timeout (float): Seconds allowed for the whole generation.
+
+    Returns:
+        str: Generated text.
+
+    Raises:
+        OllamaError: If the server returns an error or the generation times out.
+        requests.RequestException: On connection errors.
+    """
+    payload = {"model": model, "prompt": prompt, "stream": True, "keep_alive": OLLAMA_KEEP_ALIVE}
+    if options:
+        payload["options"] = options
+
+    started = time.monotonic()
+    text = ""
+    with get_session().post(f"{_base_url()}/api/generate", json=payload, stream=True,
+                            timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT)) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            message = json.loads(line)
+            if message.get("error"):
+                raise OllamaError(message["error"])
+            text += message.get("response", "")
+            if message.get("done"):
+                break
+            if stop_when is not None and stop_when(text):
+                # Closing the stream makes Ollama cancel the rest of the generation.
+                print(f"Stopping generation early after {time.monotonic() - started:.1f}s.")
+                break
+            if time.monotonic() - started > total_timeout:
+                raise OllamaError(f"Generation exceeded {total_timeout:.0f}s.")
+    return text
+
+
+def preload_model(model):
+    """
+    Ask Ollama to load `model` and keep it resident for OLLAMA_KEEP_ALIVE.
+    """
+    response = get_session().post(f"{_base_url()}/api/generate",
+                                  json={"model": model, "keep_alive": OLLAMA_KEEP_ALIVE},
+                                  timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT))
+    response.raise_for_status()
@@ -0,0 +1,140 @@
+"""
+Split Ansible playbooks into play- and task-level chunks for embedding.
+
+Each play yields one chunk describing the play (name, hosts, roles, vars) and
+each task - including tasks nested in block/rescue/always sections, handlers
+and pre/post tasks - yields one chunk naming the play, the task and its module
+with flattened arguments. Short chunks keep every part of a long playbook
+within the embedding model's token limit.
+"""
+
+import yaml
+
+MAX_CHUNKS_PER_PLAYBOOK = 200                # Upper bound on vectors stored per playbook
+MAX_CHUNK_CHARS = 1000                       # Longer chunks would be truncated by the model anyway
+TASK_SECTIONS = ('pre_tasks', 'tasks', 'post_tasks', 'handlers')
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)  # libyaml-backed loader when PyYAML was built with it
+BLOCK_SECTIONS = ('block', 'rescue', 'always')
+TASK_KEYWORDS = {
+    'name', 'when', 'loop', 'loop_control', 'register', 'become', 'become_user', 'become_method',
+    'tags', 'notify', 'vars', 'ignore_errors', 'changed_when', 'failed_when', 'until', 'retries',
+    'delay', 'delegate_to', 'run_once', 'environment', 'no_log', 'args', 'check_mode', 'diff',
+    'async', 'poll', 'listen', 'connection', 'any_errors_fatal', 'throttle', 'timeout',
+    'local_action', 'collections', 'module_defaults', 'debugger', 'ignore_unreachable',
+    *BLOCK_SECTIONS,
+}
+
+
+def iter_tasks(tasks):
+    """
+    Yield every task in a task list, descending into block/rescue/always.
+    """
+    if not isinstance(tasks, list):
+        return
+    for task in tasks:
+        if not isinstance(task, dict):
+            continue
+        if any(section in task for section in BLOCK_SECTIONS):
+            for section in BLOCK_SECTIONS:
+                yield from iter_tasks(task.get(section))
+            continue
+        yield task
+
+
+def task_module(task):
+    """
+    Return (module name, arguments) for a task, or (None, None) if it has no module.
+    """
+    for key, value in task.items():
+        if key in TASK_KEYWORDS or key.startswith('with_'):
+            continue
+        return key, value
+    return None, None
+
+
+def _flatten_args(args):
+    if isinstance(args, dict):
+        return " ".join(f"{key}={_flatten_args(value)}" for key, value in args.items())
+    if isinstance(args, list):
+        return " ".join(_flatten_args(item) for item in args)
+    if args is None:
+        return ""
+    return " ".join(str(args).split())
+
+
+def _play_chunk(play):
+    parts = []
+    if play.get('name'):
+        parts.append(f"play: {play['name']}")
+    for key in ('import_playbook', 'ansible.builtin.import_playbook'):
+        if play.get(key):
+            parts.append(f"import playbook: {play[key]}")
+    if play.get('hosts'):
+        parts.append(f"hosts: {_flatten_args(play['hosts'])}")
+    roles = play.get('roles')
+    if isinstance(roles, list):
+        names = [role.get('role') or role.get('name', '') if isinstance(role, dict) else str(role) for role in roles]
+        parts.append(f"roles: {' '.join(name for name in names if name)}")
+    if isinstance(play.get('vars'), dict):
+        parts.append(f"vars: {' '.join(str(key) for key in play['vars'])}")
+    return " | ".join(parts)
+
+
+def _task_chunk(play_name, section, task):
+    module, args = task_module(task)
+    parts = []
+    if play_name:
+        parts.append(f"play: {play_name}")
+    label = 'handler' if section == 'handlers' else 'task'
+    if task.get('name'):
+        parts.append(f"{label}: {task['name']}")
+    if module:
+        parts.append(f"module: {module} {_flatten_args(args)}".rstrip())
+    return " | ".join(parts)
+
+
+def chunks_from_plays(plays):
+    """
+    Build chunk texts from an already parsed playbook (a list of plays).
+    """
+    chunks = []
+    for play in plays:
+        if not isinstance(play, dict):
+            continue
+        play_chunk = _play_chunk(play)
+        if play_chunk:
+            chunks.append(play_chunk)
+        play_name = play.get('name')
+        for section in TASK_SECTIONS:
+            for task in iter_tasks(play.get(section)):
+                chunk = _task_chunk(play_name, section, task)
+                if chunk:
+                    chunks.append(chunk)
+    return chunks
+
+
+def load_yaml(content):
+    """
+    Parse YAML text with the safe loader, using libyaml when available.
+    """
+    return yaml.load(content, Loader=SafeLoader)
+
+
+def chunk_playbook(content, plays=None):
+    """
+    Return the chunk texts to embed for one playbook.
+
+    Pass `plays` when the playbook has already been parsed. Playbooks that
+    cannot be parsed as a list of plays are embedded as a single chunk of their
+    flattened text.
+    """
+    if plays is None:
+        try:
+            plays = load_yaml(content)
+        except yaml.YAMLError:
+            plays = None
+
+    chunks = chunks_from_plays(plays) if isinstance(plays, list) else []
+    if not chunks:
+        chunks = [content.replace("\n", " ")]
+    return [chunk[:MAX_CHUNK_CHARS] for chunk in chunks[:MAX_CHUNKS_PER_PLAYBOOK]]
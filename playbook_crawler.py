@@ -1,48 +1,255 @@
+"""
+Crawl GitHub code search for Ansible playbooks into existing_playbooks/.
+
+The crawler pages through the search results and downloads the raw files in
+parallel under a shared rate budget. It keeps an on-disk crawl manifest so
+that an interrupted crawl resumes from the last completed page, and re-crawls
+send conditional requests (ETag / If-Modified-Since) so unchanged files are
+not downloaded again. Files whose content is identical to an already stored
+file under another name are skipped. Only new or changed files are reported,
+and with --index only those trigger an incremental index update.
+
+The API and raw-content hosts are configurable (GITHUB_API_URL,
+GITHUB_RAW_URL) so the crawler can run against a local fixture server.
+"""
+
+import argparse
+import json
 import os
-import requests
-
-def search_ansible_playbooks(git_token, query="ansible playbook", language="yaml", per_page=1000, download_folder="existing_playbooks"):
-    # GitHub API endpoint for searching repositories
-    url = "https://api.github.com/search/code"
-    
-    # Parameters for the search query
-    params = {
-        "q": f"{query} language:{language}",
-        "per_page": per_page,
-        "sort": "stars",
-        "order": "desc"
-    }
-    
-    headers = {
-        "Accept": "application/vnd.github.v3+json",
-        "Authorization": f"token {git_token}"  # Replace with your GitHub token
-    }
-    
-    # Create the download folder if it doesn't exist
-    os.makedirs(download_folder, exist_ok=True)
-    
-    # Perform the API request
-    response = requests.get(url, params=params, headers=headers)
-    
-    if response.status_code == 200:
-        results = response.json()["items"]
-        for item in results:
-            file_url = item["html_url"].replace("github.com", "raw.githubusercontent.com").replace("/blob", "")
-            file_name = f"{item['repository']['name']}_{item['path'].replace('/', '_')}"
-            file_path = os.path.join(download_folder, file_name)
-
-            # Download and save each YAML file
-            file_response = requests.get(file_url)
-            if file_response.status_code == 200:
-                with open(file_path, "w") as file:
-                    file.write(file_response.text)
-                print(f"Downloaded {file_name}")
-            else:
-                print(f"Failed to download {file_name}, Status code: {file_response.status_code}")
-    else:
-        print(f"Failed to retrieve results. Status code: {response.status_code}, Message: {response.json().get('message')}")
-
-# Run the search and download function
-print('Type you GIT TOKEN:')
-git_token = input()
-search_ansible_playbooks(git_token)
\ No newline at end of file
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from http_client import HttpClient
+from index_manifest import hash_content
+
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+GITHUB_RAW_URL = os.getenv("GITHUB_RAW_URL", "https://raw.githubusercontent.com")
+CRAWL_MANIFEST_PATH = 'crawl_manifest.json'
+CRAWL_WORKERS = int(os.getenv("CRAWL_WORKERS", "8"))                 # Parallel downloads
+CRAWL_RATE = float(os.getenv("CRAWL_RATE", "10"))                    # Downloads started per second
+SEARCH_PER_PAGE = 100                                                # GitHub's maximum page size for code search
+MANIFEST_VERSION = 1
+
+
+class RateLimiter:
+    """
+    Token bucket shared by the download threads.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def _next_link(response):
+    return response.links.get("next", {}).get("url")
+
+
+def raw_path(item):
+    """
+    Return the raw-content path of a code search result
+    (github.com/<owner>/<repo>/blob/<ref>/<path> -> /<owner>/<repo>/<ref>/<path>).
+    """
+    parts = urlparse(item["html_url"]).path.split("/")
+    if len(parts) > 3 and parts[3] == "blob":
+        del parts[3]
+    return "/".join(parts)
+
+
+def local_name(item):
+    return f"{item['repository']['name']}_{item['path'].replace('/', '_')}"
+
+
+class PlaybookCrawler:
+    """
+    Resumable, concurrent crawler of GitHub code search results.
+    """
+
+    def __init__(self, git_token, download_folder="existing_playbooks", manifest_path=CRAWL_MANIFEST_PATH,
+                 api_url=GITHUB_API_URL, raw_url=GITHUB_RAW_URL, workers=CRAWL_WORKERS, rate=CRAWL_RATE):
+        self.download_folder = download_folder
+        self.manifest_path = manifest_path
+        self.workers = workers
+        self.api = HttpClient("github", api_url, headers={
+            "Accept": "application/vnd.github.v3+json",
+            "Authorization": f"token {git_token}",
+        })
+        self.raw = HttpClient("github-raw", raw_url, pool_size=workers)
+        self.limiter = RateLimiter(rate)
+        self._lock = threading.Lock()
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                if manifest.get("version") == MANIFEST_VERSION:
+                    return manifest
+                print(f"Crawl manifest '{self.manifest_path}' has an unsupported version. Ignoring it.")
+            except (OSError, ValueError) as e:
+                print(f"Error reading crawl manifest '{self.manifest_path}': {e}")
+        return {"version": MANIFEST_VERSION, "crawl": None, "files": {}, "hashes": {}}
+
+    def _save_manifest(self):
+        with self._lock:
+            data = json.dumps(self.manifest, indent=1, sort_keys=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _search(self, url, params=None):
+        while True:
+            time.sleep(self.api.rate_limit_delay())
+            response = self.api.get(url, params=params)
+            if response.status_code == 403 and self.api.rate_limit_delay() > 0:
+                print(f"GitHub rate limit reached. Waiting {self.api.rate_limit_delay():.0f}s...")
+                continue
+            return response
+
+    def _download(self, item):
+        """
+        Download one search result. Returns (outcome, file name) where outcome is
+        "new", "changed", "unchanged", "duplicate" or "failed".
+        """
+        path = raw_path(item)
+        file_name = local_name(item)
+        file_path = os.path.join(self.download_folder, file_name)
+        with self._lock:
+            entry = self.manifest["files"].get(path)
+
+        # Duplicates are never written, so their manifest entry stands in for the file
+        headers = {}
+        if entry and (entry.get("duplicate_of") or os.path.exists(file_path)):
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        self.limiter.acquire()
+        try:
+            response = self.raw.get(path, headers=headers, label="GET /{raw}")
+        except Exception as e:
+            print(f"Failed to download {file_name}: {e}")
+            return "failed", file_name
+        if response.status_code == 304:
+            return ("duplicate" if entry.get("duplicate_of") else "unchanged"), file_name
+        if response.status_code != 200:
+            print(f"Failed to download {file_name}, Status code: {response.status_code}")
+            return "failed", file_name
+
+        content = response.text
+        content_hash = hash_content(content)
+        with self._lock:
+            record = {
+                "file": file_name,
+                "hash": content_hash,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            owner = self.manifest["hashes"].get(content_hash)
+            if owner is not None and owner != file_name:
+                record["duplicate_of"] = owner
+                self.manifest["files"][path] = record
+                return "duplicate", file_name
+            if entry and entry.get("hash") == content_hash and os.path.exists(file_path):
+                self.manifest["files"][path] = record
+                return "unchanged", file_name
+            if entry and self.manifest["hashes"].get(entry.get("hash")) == file_name:
+                del self.manifest["hashes"][entry["hash"]]
+            self.manifest["hashes"][content_hash] = file_name
+            self.manifest["files"][path] = record
+
+        with open(file_path, "w", encoding="utf-8") as file:
+            file.write(content)
+        outcome = "changed" if entry else "new"
+        print(f"Downloaded {file_name} ({outcome})")
+        return outcome, file_name
+
+    def crawl(self, query="ansible playbook", language="yaml", max_pages=None):
+        """
+        Crawl the search results for `query`, resuming an interrupted crawl of the same query.
+
+        Returns:
+            list: Names of the files that were added or changed.
+        """
+        os.makedirs(self.download_folder, exist_ok=True)
+        search = {"query": query, "language": language}
+        state = self.manifest.get("crawl")
+        if state and state.get("search") == search and state.get("next_url"):
+            print(f"Resuming crawl from {state['next_url']}")
+            url, params = state["next_url"], None
+        else:
+            url, params = "/search/code", {
+                "q": f"{query} language:{language}",
+                "per_page": SEARCH_PER_PAGE,
+                "sort": "stars",
+                "order": "desc",
+            }
+            state = self.manifest["crawl"] = {"search": search, "next_url": None, "pages": 0}
+
+        updated = []
+        counts = {}
+        pages = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while url and (max_pages is None or pages < max_pages):
+                response = self._search(url, params)
+                if response.status_code != 200:
+                    print(f"Failed to retrieve results. Status code: {response.status_code}, Message: {response.text[:200]}")
+                    break
+                items = response.json().get("items", [])
+                for outcome, file_name in pool.map(self._download, items):
+                    counts[outcome] = counts.get(outcome, 0) + 1
+                    if outcome in ("new", "changed"):
+                        updated.append(file_name)
+                url, params = _next_link(response), None
+                pages += 1
+                # Record progress after every page so an interrupted crawl can resume
+                state["next_url"] = url
+                state["pages"] += 1
+                self._save_manifest()
+
+        print(f"Crawled {pages} page(s): {counts}")
+        return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download Ansible playbooks found by GitHub code search.")
+    parser.add_argument("--query", default="ansible playbook")
+    parser.add_argument("--language", default="yaml")
+    parser.add_argument("--download-folder", default="existing_playbooks")
+    parser.add_argument("--max-pages", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=CRAWL_WORKERS, help="parallel downloads")
+    parser.add_argument("--rate", type=float, default=CRAWL_RATE, help="downloads started per second")
+    parser.add_argument("--index", action="store_true", help="update the FAISS index if any playbook changed")
+    args = parser.parse_args()
+
+    git_token = os.getenv("GITHUB_TOKEN")
+    if not git_token:
+        print('Type you GIT TOKEN:')
+        git_token = input()
+
+    crawler = PlaybookCrawler(git_token, args.download_folder, workers=args.workers, rate=args.rate)
+    updated = crawler.crawl(args.query, args.language, args.max_pages)
+    print(f"{len(updated)} new or changed playbooks.")
+    if args.index and updated:
+        from llama_interface import create_faiss_index
+        create_faiss_index(use_gpu=False)
@@ -0,0 +1,269 @@
+"""
+Shared ingestion stage for the playbook corpus.
+
+Every indexing and rebuild tool reads existing_playbooks/ through this
+module. Each file is parsed with the libyaml-backed safe loader. Files that
+are not Ansible playbooks (variable files, cloud-init data, task lists,
+unparsable YAML) are rejected, and the rest are normalized into the play/task
+chunks that get embedded, the flattened task documents and the terms of the
+lexical index.
+
+`ingest_directory` validates the whole directory and returns only hashes and
+lexical terms. `iter_ingested_batches` then streams the contents and parse
+results of the playbooks a tool actually needs. Both read files in bounded
+batches. Parsing runs on a process pool, and results are cached in SQLite
+keyed by the SHA-256 of the file content. A rebuild therefore only parses
+files whose content changed. Bump PARSER_VERSION whenever validation or
+normalization changes so that stale cache entries are ignored.
+"""
+
+import json
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+from index_manifest import hash_content
+from lexical_index import playbook_terms
+from playbook_chunker import TASK_SECTIONS, chunk_playbook, iter_tasks, load_yaml
+
+PARSE_CACHE_PATH = os.getenv("PARSE_CACHE_PATH", "parse_cache.db")  # SQLite cache of parse results
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0"))               # Parser processes (0 = one per CPU)
+INGEST_POOL_THRESHOLD = 32                   # Fewer uncached files than this are parsed in-process
+INGEST_BATCH_SIZE = 256                      # Files read and parsed at a time
+PARSER_VERSION = 2
+PLAYBOOK_EXTENSIONS = ('.yml', '.yaml')
+PLAY_KEYS = {'hosts', 'import_playbook', 'ansible.builtin.import_playbook', 'tasks', 'roles'}
+
+
+def validate_playbook(plays):
+    """
+    Return why parsed YAML is not a playbook, or None if it is one.
+    """
+    if not isinstance(plays, list) or not plays:
+        return f"top level is a {type(plays).__name__}, not a list of plays"
+    if not all(isinstance(play, dict) for play in plays):
+        return "contains items that are not plays"
+    if not any(PLAY_KEYS & set(play) for play in plays):
+        return "no play has hosts, tasks, roles or import_playbook"
+    return None
+
+
+def parse_playbook(content):
+    """
+    Parse, validate and normalize one playbook.
+
+    Returns:
+        dict: {"error": reason or None, "chunks": [...], "tasks": [...], "terms": [...]}
+        where chunks are the texts to embed, tasks the flattened task documents
+        and terms the lexical index terms.
+    """
+    try:
+        plays = load_yaml(content)
+    except yaml.YAMLError as e:
+        return {"error": f"invalid YAML: {' '.join(str(e).split())[:200]}", "chunks": [], "tasks": [], "terms": []}
+    error = validate_playbook(plays)
+    if error:
+        return {"error": error, "chunks": [], "tasks": [], "terms": []}
+    tasks = []
+    for play in plays:
+        for section in TASK_SECTIONS:
+            for task in iter_tasks(play.get(section)):
+                tasks.append(yaml.dump(task, default_flow_style=False))
+    return {"error": None, "chunks": chunk_playbook(content, plays), "tasks": tasks, "terms": playbook_terms(plays)}
+
+
+def _parse_batch(contents):
+    return [parse_playbook(content) for content in contents]
+
+
+class ParseCache:
+    """
+    SQLite store of parse results keyed by content hash.
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS parses ("
+                " hash TEXT PRIMARY KEY,"
+                " version INTEGER NOT NULL,"
+                " result TEXT NOT NULL)"
+            )
+
+    def get_many(self, hashes):
+        results = {}
+        hashes = list(hashes)
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            for content_hash, result in self._conn.execute(
+                    f"SELECT hash, result FROM parses WHERE version = ? AND hash IN ({','.join('?' * len(chunk))})",
+                    [PARSER_VERSION, *chunk]):
+                results[content_hash] = json.loads(result)
+        return results
+
+    def put_many(self, results):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO parses (hash, version, result) VALUES (?, ?, ?)",
+                [(content_hash, PARSER_VERSION, json.dumps(result)) for content_hash, result in results.items()])
+
+    def prune(self, keep):
+        """
+        Drop entries whose hash is not in `keep`.
+        """
+        keep = set(keep)
+        stale = [(row[0],) for row in self._conn.execute("SELECT hash FROM parses") if row[0] not in keep]
+        with self._conn:
+            self._conn.executemany("DELETE FROM parses WHERE hash = ?", stale)
+
+    def close(self):
+        self._conn.close()
+
+
+class _Parser:
+    """
+    Parse contents in-process or, once a run has enough uncached files, on a
+    process pool that is started once and reused for the rest of the run.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._pool = None
+
+    def parse(self, contents):
+        if self._pool is None and (self.workers <= 1 or len(contents) < INGEST_POOL_THRESHOLD):
+            return _parse_batch(contents)
+        if self._pool is None:
+            context = multiprocessing.get_context('spawn')
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        batch_size = max(1, min(64, len(contents) // (self.workers * 4)))
+        batches = [contents[start:start + batch_size] for start in range(0, len(contents), batch_size)]
+        return [result for batch in self._pool.map(_parse_batch, batches) for result in batch]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+def _playbook_files(playbooks_dir, names, rejected):
+    for filename in names:
+        if not filename.endswith(PLAYBOOK_EXTENSIONS):
+            rejected[filename] = "not a .yml or .yaml file"
+            continue
+        try:
+            with open(os.path.join(playbooks_dir, filename), 'r', encoding='utf-8') as file:
+                yield filename, file.read()
+        except Exception as e:
+            rejected[filename] = f"unreadable: {e}"
+
+
+def _ingest_batches(playbooks_dir, names, batch_size, workers, cache_path, rejected):
+    """
+    Read, hash and parse the named files `batch_size` at a time.
+
+    Yields:
+        list: (file name, content, parse result with its "hash") for each readable file.
+    """
+    cache = ParseCache(cache_path) if cache_path else None
+    parser = _Parser(workers or INGEST_WORKERS or os.cpu_count() or 1)
+    try:
+        batch = []
+        for entry in _playbook_files(playbooks_dir, names, rejected):
+            batch.append(entry)
+            if len(batch) < batch_size:
+                continue
+            yield _ingest_batch(batch, parser, cache)
+            batch = []
+        if batch:
+            yield _ingest_batch(batch, parser, cache)
+    finally:
+        parser.close()
+        if cache:
+            cache.close()
+
+
+def _ingest_batch(batch, parser, cache):
+    hashes = [hash_content(content) for _, content in batch]
+    parsed = cache.get_many(set(hashes)) if cache else {}
+    missing = {}
+    for (_, content), content_hash in zip(batch, hashes):
+        if content_hash not in parsed:
+            missing.setdefault(content_hash, content)
+    if missing:
+        fresh = dict(zip(missing, parser.parse(list(missing.values()))))
+        parsed.update(fresh)
+        if cache:
+            cache.put_many(fresh)
+    return [(filename, content, dict(parsed[content_hash], hash=content_hash))
+            for (filename, content), content_hash in zip(batch, hashes)]
+
+
+def ingest_directory(playbooks_dir, workers=None, cache_path=PARSE_CACHE_PATH, batch_size=INGEST_BATCH_SIZE):
+    """
+    Validate every playbook in a directory and return its metadata.
+
+    Files are read `batch_size` at a time and their contents are not kept, so
+    memory does not grow with the corpus. Use `iter_ingested_batches` to get
+    the contents, chunks and tasks of the playbooks that need them.
+
+    Args:
+        playbooks_dir (str): Directory containing the playbook files.
+        workers (int): Parser processes for uncached files.
+        cache_path (str): Parse cache database, or None to parse everything.
+        batch_size (int): Files read and parsed at a time.
+
+    Returns:
+        tuple: ({file name: {"hash", "terms"}} for the playbooks,
+        {file name: reason} for the rejected files).
+    """
+    playbooks = {}
+    rejected = {}
+    seen_hashes = set()
+    names = sorted(os.listdir(playbooks_dir))
+    for batch in _ingest_batches(playbooks_dir, names, batch_size, workers, cache_path, rejected):
+        for filename, _, result in batch:
+            seen_hashes.add(result["hash"])
+            if result["error"]:
+                rejected[filename] = result["error"]
+            else:
+                playbooks[filename] = {"hash": result["hash"], "terms": result["terms"]}
+    if cache_path:
+        cache = ParseCache(cache_path)
+        try:
+            cache.prune(seen_hashes)
+        finally:
+            cache.close()
+    print(f"Ingested {len(playbooks)} playbooks ({len(rejected)} files rejected).")
+    return playbooks, rejected
+
+
+def iter_ingested_batches(playbooks_dir, names, batch_size=INGEST_BATCH_SIZE, workers=None,
+                          cache_path=PARSE_CACHE_PATH):
+    """
+    Read and ingest the named playbooks, one batch at a time.
+
+    The content, hash and parse result of each playbook come from the same
+    read. A file edited since `ingest_directory` is therefore yielded as it is
+    now, and skipped if it is no longer a valid playbook. Unchanged files are
+    served from the parse cache.
+
+    Yields:
+        list: (file name, content, {"hash", "chunks", "tasks", "terms"}) for the
+        valid playbooks among up to `batch_size` files.
+    """
+    rejected = {}
+    for batch in _ingest_batches(playbooks_dir, names, batch_size, workers, cache_path, rejected):
+        valid = []
+        for filename, content, result in batch:
+            if result["error"]:
+                print(f"Skipping '{filename}': {result['error']}")
+            else:
+                valid.append((filename, content, result))
+        if valid:
+            yield valid
+    for filename, reason in rejected.items():
+        print(f"Skipping '{filename}': {reason}")
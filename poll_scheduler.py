@@ -0,0 +1,70 @@
+"""
+Adaptive scheduling of the ServiceNow poll cycle.
+
+Instead of sleeping a fixed interval, the engine asks `PollScheduler` how long
+to wait before the next cycle. Every session asks for a poll interval based
+on its state. A session whose user is choosing a playbook asks for the
+quickest polls. One that has only been sent the welcome message asks for
+slower polls, and one not yet greeted slower still. A deploying session asks
+for the maximum interval because AWX completion is tracked separately. That interval doubles for every `idle_step` seconds the session
+has been quiet. The cycle runs at the most urgent session's pace. With no
+sessions, the interval backs off exponentially after every cycle that found
+nothing new. The delay is never shorter than any rate-limit window reported
+by the HTTP clients.
+"""
+
+import os
+import time
+
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "1"))       # Seconds between polls while users are active
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "30"))      # Upper bound on the poll interval
+POLL_BACKOFF = float(os.getenv("POLL_BACKOFF", "2"))                 # Interval growth per idle step
+POLL_IDLE_STEP = float(os.getenv("POLL_IDLE_STEP", "30"))            # Seconds of session inactivity per backoff step
+
+# Base poll interval per session state, as a multiple of POLL_MIN_INTERVAL
+STATE_PRIORITIES = {
+    "choose_or_generate": 1,  # Mid-conversation: the user was just shown playbooks and is picking one
+    "waiting": 2,             # Welcome sent; the user may not have opened the incident yet
+    "new": 4,                 # Nothing sent yet, so no reply can be pending
+    "deploying": None,        # AWX completion is tracked by the job watcher; poll at the maximum interval
+    "resolved": None,         # Deployed; only the closing update is left to retry
+}
+
+
+class PollScheduler:
+    """
+    Compute the delay before the next poll cycle from session activity and rate limits.
+    """
+
+    def __init__(self, min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL, backoff=POLL_BACKOFF,
+                 idle_step=POLL_IDLE_STEP, clients=()):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.idle_step = idle_step
+        self.clients = list(clients)
+        self._idle_interval = min_interval
+
+    def session_interval(self, session, now):
+        priority = STATE_PRIORITIES.get(session.state, 1)
+        if priority is None:
+            return self.max_interval
+        idle_steps = int((now - session.last_activity) // self.idle_step)
+        return min(self.max_interval, self.min_interval * priority * self.backoff ** idle_steps)
+
+    def next_delay(self, sessions, activity):
+        """
+        Return the seconds to wait before the next cycle.
+
+        Args:
+            sessions (iterable): Active sessions, with `state` and `last_activity` (monotonic time).
+            activity (bool): Whether the cycle just finished found anything new.
+        """
+        now = time.monotonic()
+        if activity:
+            self._idle_interval = self.min_interval
+        else:
+            self._idle_interval = min(self.max_interval, self._idle_interval * self.backoff)
+        delay = min([self._idle_interval] + [self.session_interval(session, now) for session in sessions])
+        rate_limit_delay = max([client.rate_limit_delay() for client in self.clients], default=0)
+        return max(delay, rate_limit_delay)
@@ -0,0 +1,116 @@
+"""
+Batched publishing of generated playbooks to Git and AWX.
+
+Before AWX can run a playbook it must be committed, pushed and synced into
+the AWX project. Doing that per deployment serializes every launch behind a
+commit, a push and a full SCM project update. `PlaybookPublisher` instead
+collects the playbooks submitted within a short window and publishes them
+together with one commit, one push and one project update, then releases
+every waiting deployment at once.
+"""
+
+import os
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+
+PUBLISH_WINDOW = float(os.getenv("PUBLISH_WINDOW", "2"))          # Seconds to wait for more playbooks after the first
+PUBLISH_MAX_BATCH = int(os.getenv("PUBLISH_MAX_BATCH", "50"))     # Playbooks per commit
+
+
+class PlaybookPublisher:
+    """
+    Coalesce playbook publications into one commit, push and project update per batch.
+    """
+
+    def __init__(self, repo_path, branch, update_project, remote="origin", window=PUBLISH_WINDOW,
+                 max_batch=PUBLISH_MAX_BATCH):
+        """
+        Args:
+            repo_path (Path): Working tree of the repository AWX syncs from.
+            branch (str): Branch to push.
+            update_project (callable): Syncs the AWX project; raises on failure.
+            remote (str): Git remote to push to.
+            window (float): Seconds to keep collecting after the first playbook arrives.
+            max_batch (int): Maximum number of playbooks per batch.
+        """
+        self.repo_path = repo_path
+        self.branch = branch
+        self.update_project = update_project
+        self.remote = remote
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="playbook-publisher", daemon=True)
+        self._thread.start()
+
+    def submit(self, playbook_path, label):
+        """
+        Queue an already written playbook file for publishing.
+
+        Args:
+            playbook_path (Path): Playbook file inside the working tree.
+            label (str): Short description used in the commit message (e.g. the incident number).
+
+        Returns:
+            Future: Resolved once the playbook is pushed and synced into AWX.
+        """
+        future = Future()
+        self._queue.put((playbook_path, label, future))
+        return future
+
+    def publish(self, playbook_path, label, timeout=None):
+        """
+        Queue a playbook and block until its batch is published. Raises on failure.
+        """
+        return self.submit(playbook_path, label).result(timeout)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._publish_batch(batch)
+            except Exception as e:
+                print(f"Publishing {len(batch)} playbook(s) failed: {e}")
+                for _, _, future in batch:
+                    future.set_exception(e)
+            else:
+                for _, _, future in batch:
+                    future.set_result(None)
+
+    def _git(self, *args, check=True):
+        return subprocess.run(["git", *args], cwd=self.repo_path, check=check)
+
+    def _publish_batch(self, batch):
+        paths = sorted({str(path) for path, _, _ in batch})
+        labels = sorted({label for _, label, _ in batch})
+        print(f"Publishing {len(paths)} playbook(s) for: {', '.join(labels)}")
+
+        self._git("add", "--", *paths)
+        # Nothing is staged when every playbook is identical to its committed version
+        if self._git("diff", "--cached", "--quiet", "--", *paths, check=False).returncode != 0:
+            if len(labels) == 1:
+                message = ["-m", f"Add playbook for incident {labels[0]}"]
+            else:
+                message = ["-m", f"Add playbooks for {len(labels)} incidents", "-m", "\n".join(labels)]
+            self._git("commit", *message, "--", *paths)
+        self._git("push", self.remote, self.branch)
+        print("Playbooks committed and pushed successfully.")
+
+        self.update_project()
+        print("AWX project update completed.")
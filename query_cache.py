@@ -0,0 +1,204 @@
+"""
+Bounded cache of query embeddings and retrieval results.
+
+Entries are keyed by normalized query text and evicted least-recently-used
+once the cache is full. The embedding and each search configuration's results
+carry their own timestamp and expire separately after the TTL. Query embeddings
+only depend on the embedding model and survive index rebuilds; retrieval
+results are tied to the index generation they were computed against and are
+dropped as soon as a different generation is loaded.
+
+When a path is given, the cache is loaded from it at startup and saved back
+periodically and at interpreter exit, so restarts keep their warm entries.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+SAVE_INTERVAL = 60.0                         # Minimum seconds between saves to disk
+
+
+def normalize_query(query):
+    """
+    Normalize query text so trivially different incident descriptions share an entry.
+    """
+    return " ".join(query.lower().split())
+
+
+def _results_key(top_k, params):
+    return json.dumps([top_k, params], sort_keys=True)
+
+
+class QueryCache:
+    """
+    Thread-safe LRU/TTL cache from normalized query text to its embedding and
+    to the ranked (document id, score) results of each search configuration.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.generation = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_save = time.monotonic()
+        self._dirty = False
+        self.counters = {"embedding_hits": 0, "embedding_misses": 0, "result_hits": 0, "result_misses": 0}
+        if path:
+            self._load()
+            atexit.register(self.save)
+
+    def _expire(self, key, entry, now):
+        entry["results"] = {params: result for params, result in entry["results"].items()
+                            if now - result["created"] <= self.ttl_seconds}
+        if entry["embedding"] is not None and now - entry["created"] > self.ttl_seconds:
+            entry["embedding"] = None
+        if entry["embedding"] is None and not entry["results"]:
+            del self._entries[key]
+            return None
+        return entry
+
+    def _entry(self, query):
+        key = normalize_query(query)
+        entry = self._entries.get(key)
+        if entry is None:
+            return key, None
+        entry = self._expire(key, entry, time.time())
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return key, entry
+
+    def _store(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = {"created": time.time(), "embedding": None, "results": {}}
+            self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._dirty = True
+        return entry
+
+    def set_generation(self, generation):
+        """
+        Record the generation of the loaded index, dropping stale results.
+        """
+        with self._lock:
+            if generation == self.generation:
+                return
+            for entry in self._entries.values():
+                entry["results"] = {}
+            self.generation = generation
+            self._dirty = True
+
+    def get_embedding(self, query):
+        with self._lock:
+            _, entry = self._entry(query)
+            if entry is None or entry["embedding"] is None:
+                self.counters["embedding_misses"] += 1
+                return None
+            self.counters["embedding_hits"] += 1
+            return entry["embedding"]
+
+    def put_embedding(self, query, embedding):
+        with self._lock:
+            entry = self._store(normalize_query(query))
+            entry["created"] = time.time()
+            entry["embedding"] = np.asarray(embedding, dtype='float32')
+        self._maybe_save()
+
+    def get_results(self, query, top_k, params=None):
+        """
+        Return cached (document id, score) pairs for the query, or None.
+        """
+        with self._lock:
+            _, entry = self._entry(query)
+            result = entry["results"].get(_results_key(top_k, params)) if entry is not None else None
+            if result is None:
+                self.counters["result_misses"] += 1
+                return None
+            self.counters["result_hits"] += 1
+            return result["hits"]
+
+    def put_results(self, query, top_k, results, params=None):
+        with self._lock:
+            entry = self._store(normalize_query(query))
+            entry["results"][_results_key(top_k, params)] = {
+                "created": time.time(),
+                "hits": [(int(doc_id), float(score)) for doc_id, score in results],
+            }
+        self._maybe_save()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries), generation=self.generation)
+
+    def _maybe_save(self):
+        if self.path and time.monotonic() - self._last_save >= SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        """
+        Write the cache to its path, if it has one.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {
+                "generation": self.generation,
+                "entries": [
+                    {
+                        "query": key,
+                        "created": entry["created"],
+                        "embedding": entry["embedding"].tolist() if entry["embedding"] is not None else None,
+                        "results": entry["results"],
+                    }
+                    for key, entry in self._entries.items()
+                ],
+            }
+            self._dirty = False
+            self._last_save = time.monotonic()
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Error saving query cache to '{self.path}': {e}")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading query cache from '{self.path}': {e}")
+            return
+        now = time.time()
+        self.generation = data.get("generation")
+        for item in data.get("entries", []):
+            embedding = item.get("embedding")
+            results = {}
+            for params, result in item.get("results", {}).items():
+                # Files written before results carried their own timestamp hold bare hit lists
+                if isinstance(result, list):
+                    result = {"created": item["created"], "hits": result}
+                results[params] = {"created": result["created"], "hits": [tuple(hit) for hit in result["hits"]]}
+            entry = {
+                "created": item["created"],
+                "embedding": np.asarray(embedding, dtype='float32') if embedding is not None else None,
+                "results": results,
+            }
+            self._entries[item["query"]] = entry
+            self._expire(item["query"], entry, now)
+        print(f"Loaded {len(self._entries)} cached queries from '{self.path}'.")
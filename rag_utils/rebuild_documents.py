@@ -1,14 +1,25 @@
 import os
-import yaml
+import sys
+from pathlib import Path
+
+# Access parent directory
+parent_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(parent_dir))
+
+from playbook_ingest import iter_ingested_batches
+
 
 def rebuild_documents_txt(playbooks_dir, output_file):
     """
-    Rebuilds the documents.txt file by processing YAML playbooks
-    in the specified directory.
+    Writes every task of the YAML playbooks in the specified directory,
+    flattened with the same task walk the chunking indexer uses.
+
+    Playbooks are streamed through the shared ingestion stage, so only files
+    that changed since the last rebuild or indexing run are parsed again.
 
     Args:
         playbooks_dir (str): Directory containing the playbook files.
-        output_file (str): Path to the output documents.txt file.
+        output_file (str): Path to the output file.
     """
     print(f"Rebuilding {output_file} from playbooks in {playbooks_dir}...")
 
@@ -18,43 +29,25 @@ def rebuild_documents_txt(playbooks_dir, output_file):
         return
 
     # Open the output file for writing
-    with open(output_file, "w") as out_file:
-        for filename in os.listdir(playbooks_dir):
-            filepath = os.path.join(playbooks_dir, filename)
-
-            # Skip non-YAML files
-            if not filename.endswith(".yml") and not filename.endswith(".yaml"):
-                print(f"Skipping non-YAML file: {filename}")
-                continue
-
-            print(f"Processing playbook: {filename}")
-
-            # Load and validate the YAML file
-            try:
-                with open(filepath, "r") as playbook_file:
-                    playbook = yaml.safe_load(playbook_file)
-
-                # Ensure the playbook contains tasks or a valid structure
-                if not isinstance(playbook, list) or not any("tasks" in item for item in playbook):
-                    print(f"Skipping invalid playbook structure: {filename}")
-                    continue
-
-                # Extract and flatten tasks
-                for section in playbook:
-                    if "tasks" in section:
-                        for task in section["tasks"]:
-                            out_file.write(yaml.dump(task, default_flow_style=False))
-                            out_file.write("\n---\n")  # Separate tasks with YAML document markers
-
-            except yaml.YAMLError as e:
-                print(f"Error processing YAML in file {filename}: {e}")
-            except Exception as e:
-                print(f"Error processing file {filename}: {e}")
+    try:
+        with open(output_file, "w") as out_file:
+            for batch in iter_ingested_batches(playbooks_dir, sorted(os.listdir(playbooks_dir))):
+                for filename, _, playbook in batch:
+                    print(f"Processing playbook: {filename}")
+                    for task in playbook["tasks"]:
+                        out_file.write(task)
+                        out_file.write("\n---\n")  # Separate tasks with YAML document markers
+    except Exception as e:
+        print(f"Error reading playbooks: {e}")
+        return
 
     print(f"Rebuild complete. Flattened playbooks saved to {output_file}.")
 
 
-playbooks_dir = "existing_playbooks"
-output_file = "documents.txt"
+if __name__ == "__main__":
+    playbooks_dir = "existing_playbooks"
+    # documents.txt is the legacy playbook dump the retrieval system can convert,
+    # so flattened tasks go to their own file.
+    output_file = "flattened_tasks.txt"
 
-rebuild_documents_txt(playbooks_dir, output_file)
\ No newline at end of file
+    rebuild_documents_txt(playbooks_dir, output_file)
\ No newline at end of file
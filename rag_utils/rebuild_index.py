@@ -1,3 +1,4 @@
+import argparse
 import sys
 from pathlib import Path
 
@@ -8,6 +9,15 @@ sys.path.insert(0, str(parent_dir))
 from llama_interface import create_faiss_index
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update the FAISS index from existing_playbooks/.")
+    parser.add_argument("--full", action="store_true", help="re-embed every playbook instead of only changed ones")
+    parser.add_argument("--workers", type=int, default=None, help="number of embedding processes")
+    parser.add_argument("--batch-size", type=int, default=None, help="playbooks per embedding batch")
+    parser.add_argument("--index-type", default=None, choices=["auto", "flat", "ivf", "hnsw", "ivfpq"],
+                        help="FAISS index type (defaults to the INDEX_TYPE setting)")
+    args = parser.parse_args()
+
     print("Rebuilding FAISS index...")
-    create_faiss_index(use_gpu=False)
+    create_faiss_index(use_gpu=False, full_rebuild=args.full, workers=args.workers, batch_size=args.batch_size,
+                       index_type=args.index_type)
     print("FAISS index rebuilt successfully.")
@@ -0,0 +1,270 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from requests.auth import HTTPBasicAuth
+from dotenv import load_dotenv
+from http_client import HttpClient
+
+# Load environment variables from .env file
+load_dotenv()
+
+# ServiceNow API details
+instance = os.getenv("INSTANCE")
+username = os.getenv("USERNAME")
+password = os.getenv("PASSWORD")
+journal_endpoint = '/api/now/table/sys_journal_field'
+incident_endpoint = '/api/now/table/incident'
+headers = {
+    "Content-Type": "application/json",
+    "Accept": "application/json"
+}
+
+# Pooled, retrying session shared by every ServiceNow call
+client = HttpClient("servicenow", instance, headers=headers, auth=HTTPBasicAuth(username, password))
+
+JOURNAL_PAGE_SIZE = int(os.getenv("JOURNAL_PAGE_SIZE", "500"))              # Journal rows per page
+JOURNAL_IDS_PER_QUERY = int(os.getenv("JOURNAL_IDS_PER_QUERY", "100"))      # Incident ids per element_idIN query (URL length)
+JOURNAL_FIELDS = "sys_id,element_id,value,sys_created_on,sys_created_by"
+POSTED_COMMENTS_KEPT = 1000                                                  # Recent bot comments recognized in the journal
+INCIDENT_PAGE_SIZE = int(os.getenv("INCIDENT_PAGE_SIZE", "500"))            # Incident rows per page
+INCIDENT_RECONCILE_INTERVAL = float(os.getenv("INCIDENT_RECONCILE_INTERVAL", "300"))  # Seconds between full incident fetches
+INCIDENT_FIELDS = "number,sys_id,state,active,short_description,sys_updated_on"
+UNRESOLVED_QUERY = "state!=6^active=true"
+
+def _fetch_page(endpoint, query, fields, offset, limit):
+    params = {
+        "sysparm_query": query,
+        "sysparm_fields": fields,
+        "sysparm_limit": limit,
+        "sysparm_offset": offset,
+        "sysparm_exclude_reference_link": "true",
+    }
+    response = client.get(endpoint, params=params)
+    response.raise_for_status()
+    return response.json().get("result", [])
+
+def _fetch_all(endpoint, query, fields, page_size):
+    rows = []
+    offset = 0
+    while True:
+        page = _fetch_page(endpoint, query, fields, offset, page_size)
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        offset += page_size
+
+def fetch_unresolved_incidents(page_size=INCIDENT_PAGE_SIZE):
+    return _fetch_all(incident_endpoint, f"{UNRESOLVED_QUERY}^ORDERBYsys_id", INCIDENT_FIELDS, page_size)
+
+# (incident sys_id, comment text) of the comments this process posted, newest last
+_posted_comments = OrderedDict()
+_posted_lock = threading.Lock()
+
+def _remember_posted(incident_sys_id, text):
+    with _posted_lock:
+        _posted_comments[(incident_sys_id, text.strip())] = None
+        _posted_comments.move_to_end((incident_sys_id, text.strip()))
+        while len(_posted_comments) > POSTED_COMMENTS_KEPT:
+            _posted_comments.popitem(last=False)
+
+def is_own_comment(comment):
+    """
+    Return True for journal rows written by the integration user, or repeating
+    a comment this process posted, so the bot does not answer itself.
+    """
+    if username and comment.get("sys_created_by") == username:
+        return True
+    with _posted_lock:
+        return (comment.get("element_id"), comment.get("value", "").strip()) in _posted_comments
+
+def update_incident(incident_sys_id, payload):
+    response = client.patch(f"{incident_endpoint}/{incident_sys_id}", json=payload)
+    response.raise_for_status()
+    if payload.get("comments"):
+        _remember_posted(incident_sys_id, payload["comments"])
+    print(f"Updated Incident {incident_sys_id}: {payload}")
+
+def fetch_latest_comment(incident_sys_id, last_comment_id=None):
+    params = {"sysparm_query": f"element_id={incident_sys_id}^element=comments"}
+    response = client.get(journal_endpoint, params=params)
+    response.raise_for_status()
+    comments = [comment for comment in response.json().get("result", []) if not is_own_comment(comment)]
+    if comments:
+        latest_comment = sorted(comments, key=lambda x: x["sys_created_on"], reverse=True)[0]
+        if latest_comment["sys_id"] != last_comment_id:
+            return latest_comment["value"].strip().lower(), latest_comment["sys_id"]
+    return None, last_comment_id
+
+def _since(field, timestamp):
+    date, time_of_day = timestamp.split(" ")
+    return f"{field}>=javascript:gs.dateGenerate('{date}','{time_of_day}')"
+
+def fetch_newest_comment():
+    """
+    Return the journal row of the newest incident comment, or None if there are none.
+    """
+    rows = _fetch_page(journal_endpoint, "name=incident^element=comments^ORDERBYDESCsys_created_on",
+                       JOURNAL_FIELDS, 0, 1)
+    return rows[0] if rows else None
+
+def fetch_comments(incident_sys_ids, since=None, page_size=JOURNAL_PAGE_SIZE):
+    """
+    Fetch the comments of several incidents, oldest first.
+
+    Args:
+        incident_sys_ids (list): Incident sys_ids to fetch comments for.
+        since (str): Only return comments created at or after this
+            "YYYY-MM-DD HH:MM:SS" timestamp.
+        page_size (int): Journal rows requested per page.
+
+    Returns:
+        list: Journal rows with sys_id, element_id, value, sys_created_on and
+            sys_created_by.
+    """
+    comments = []
+    for start in range(0, len(incident_sys_ids), JOURNAL_IDS_PER_QUERY):
+        ids = incident_sys_ids[start:start + JOURNAL_IDS_PER_QUERY]
+        query = f"element_idIN{','.join(ids)}^element=comments"
+        if since:
+            query += f"^{_since('sys_created_on', since)}"
+        query += "^ORDERBYsys_created_on^ORDERBYsys_id"
+        comments.extend(_fetch_all(journal_endpoint, query, JOURNAL_FIELDS, page_size))
+    comments.sort(key=lambda x: x["sys_created_on"])
+    return comments
+
+class JournalPoller:
+    """
+    Fetch new comments for all tracked incidents with one journal query per cycle.
+
+    The poller keeps a high-water mark of the newest comment creation time it
+    has seen. Journal timestamps only have second resolution, so each cycle
+    asks for comments created at or after the mark and skips the ones already
+    returned at exactly that second. The mark is compared in the integration
+    user's time zone, which should be left at UTC. The bot's own comments
+    (see `is_own_comment`) move the mark but are not returned.
+    """
+
+    def __init__(self, page_size=JOURNAL_PAGE_SIZE):
+        self.page_size = page_size
+        self.watermark = None
+        self._seen_at_watermark = set()
+        self._started = False
+        self._lock = threading.Lock()
+
+    def checkpoint(self):
+        """
+        Return the poller position as a JSON-serializable dict.
+        """
+        with self._lock:
+            return {"watermark": self.watermark, "seen": sorted(self._seen_at_watermark)} if self._started else None
+
+    def restore(self, checkpoint):
+        """
+        Resume from a position returned by `checkpoint`, so comments posted while
+        the poller was down are still delivered.
+        """
+        with self._lock:
+            self.watermark = checkpoint["watermark"]
+            self._seen_at_watermark = set(checkpoint["seen"])
+            self._started = True
+
+    def poll(self, incident_sys_ids):
+        """
+        Return {incident sys_id: [(comment, comment sys_id), ...]} with the
+        comments created since the previous poll, oldest first. The first
+        poll only records the current high-water mark.
+        """
+        with self._lock:
+            if not self._started:
+                newest = fetch_newest_comment()
+                if newest is not None:
+                    self.watermark = newest["sys_created_on"]
+                    self._seen_at_watermark = {newest["sys_id"]}
+                self._started = True
+                print(f"Journal poller starting from {self.watermark or 'the first comment'}.")
+                return {}
+            if not incident_sys_ids:
+                return {}
+
+            new_comments = {}
+            for comment in fetch_comments(list(incident_sys_ids), since=self.watermark, page_size=self.page_size):
+                created = comment["sys_created_on"]
+                if created == self.watermark and comment["sys_id"] in self._seen_at_watermark:
+                    continue
+                if created != self.watermark:
+                    self.watermark = created
+                    self._seen_at_watermark = set()
+                self._seen_at_watermark.add(comment["sys_id"])
+                if is_own_comment(comment):
+                    continue
+                new_comments.setdefault(comment["element_id"], []).append(
+                    (comment["value"].strip().lower(), comment["sys_id"]))
+            return new_comments
+
+def _is_unresolved(incident):
+    return str(incident.get("state")) != "6" and str(incident.get("active")).lower() == "true"
+
+class IncidentPoller:
+    """
+    Track the set of unresolved incidents by fetching only what changed.
+
+    Each cycle asks for incidents updated at or after a `sys_updated_on`
+    high-water mark (regardless of state, so resolutions are seen too) and
+    applies them to a local copy of the unresolved set, paging by offset.
+    Incidents updated while the pages are read can push unread rows back onto
+    pages already read; the mark is then held back so the next cycle reads
+    them. Every `reconcile_interval` seconds the whole unresolved set is
+    fetched again to correct any drift, such as deleted incidents. As with the
+    journal poller, the mark is compared in the integration user's time zone.
+    """
+
+    def __init__(self, page_size=INCIDENT_PAGE_SIZE, reconcile_interval=INCIDENT_RECONCILE_INTERVAL):
+        self.page_size = page_size
+        self.reconcile_interval = reconcile_interval
+        self.watermark = None
+        self.incidents = {}
+        self._last_reconcile = None
+        self._lock = threading.Lock()
+
+    def _reconcile(self):
+        # Take the mark before the full fetch so nothing updated during it is missed.
+        newest = _fetch_page(incident_endpoint, "ORDERBYDESCsys_updated_on", "sys_updated_on", 0, 1)
+        incidents = fetch_unresolved_incidents(self.page_size)
+        self.incidents = {incident["sys_id"]: incident for incident in incidents}
+        self.watermark = newest[0]["sys_updated_on"] if newest else None
+        self._last_reconcile = time.monotonic()
+        print(f"Reconciled {len(self.incidents)} unresolved incidents.")
+
+    def _apply_changes(self):
+        if self.watermark is None:
+            self._reconcile()
+            return
+        query = f"{_since('sys_updated_on', self.watermark)}^ORDERBYsys_updated_on^ORDERBYsys_id"
+        watermark = self.watermark
+        first_seen = {}
+        moved = []
+        for incident in _fetch_all(incident_endpoint, query, INCIDENT_FIELDS, self.page_size):
+            if _is_unresolved(incident):
+                self.incidents[incident["sys_id"]] = incident
+            else:
+                self.incidents.pop(incident["sys_id"], None)
+            if incident["sys_id"] in first_seen:
+                moved.append(first_seen[incident["sys_id"]])
+            first_seen.setdefault(incident["sys_id"], incident["sys_updated_on"])
+            watermark = max(watermark, incident["sys_updated_on"])
+        # An incident updated while we paged moved to the end and shifted the
+        # rows behind it back onto pages already read. None of the skipped rows
+        # is older than where it was, so the next poll starts from there.
+        self.watermark = min([watermark] + moved)
+
+    def poll(self):
+        """
+        Return the currently unresolved incidents.
+        """
+        with self._lock:
+            if self._last_reconcile is None or time.monotonic() - self._last_reconcile >= self.reconcile_interval:
+                self._reconcile()
+            else:
+                self._apply_changes()
+            return list(self.incidents.values())
@@ -0,0 +1,216 @@
+"""
+Durable state for incident sessions.
+
+Sessions live in a SQLite database in WAL mode so the engine can restart
+without greeting every open incident again or recomputing its candidate
+playbooks. Candidates are stored once in a content-addressed `playbooks`
+table and referenced from each session by hash.
+
+Changes are buffered in memory and written in one transaction per `flush`,
+which the engine calls once per poll cycle. Each incident belongs to the shard
+`crc32(sys_id) % shard_count`, so several worker processes can share one
+database and split the incident stream between them statically.
+
+Alternatively, workers claim incidents dynamically through leases with an
+expiry time. A worker keeps renewing its leases while it runs; when it dies,
+its leases expire and other workers take its incidents over along with their
+stored sessions.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+
+def shard_of(sys_id, shard_count):
+    """
+    Return the shard an incident belongs to.
+    """
+    return zlib.crc32(sys_id.encode('utf-8')) % shard_count
+
+
+def playbook_hash(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class SessionStore:
+    """
+    SQLite-backed store of incident sessions with batched writes.
+    """
+
+    def __init__(self, path, shard_count=1):
+        self.path = path
+        self.shard_count = shard_count
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pending_playbooks = {}
+        self._pending_meta = {}
+        self._pending_releases = set()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " sys_id TEXT PRIMARY KEY,"
+                " shard INTEGER NOT NULL,"
+                " number TEXT NOT NULL,"
+                " short_description TEXT NOT NULL,"
+                " state TEXT NOT NULL,"
+                " last_comment_id TEXT,"
+                " candidates TEXT NOT NULL,"
+                " updated REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_shard ON sessions (shard)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS playbooks (hash TEXT PRIMARY KEY, content TEXT NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                " sys_id TEXT PRIMARY KEY,"
+                " owner TEXT NOT NULL,"
+                " expires REAL NOT NULL)"
+            )
+
+    def owns(self, sys_id, shard_index):
+        return shard_of(sys_id, self.shard_count) == shard_index
+
+    def save(self, sys_id, number, short_description, state, last_comment_id, playbooks):
+        """
+        Buffer the current state of a session until the next flush.
+        """
+        hashes = []
+        with self._lock:
+            for content in playbooks:
+                content_hash = playbook_hash(content)
+                self._pending_playbooks[content_hash] = content
+                hashes.append(content_hash)
+            self._pending[sys_id] = (
+                sys_id, shard_of(sys_id, self.shard_count), number, short_description, state,
+                last_comment_id, json.dumps(hashes), time.time(),
+            )
+
+    def delete(self, sys_id):
+        with self._lock:
+            self._pending[sys_id] = None
+
+    def release(self, sys_id, owner):
+        """
+        Give up `owner`'s lease on an incident at the next flush, in the same
+        transaction that writes or deletes its session.
+        """
+        with self._lock:
+            self._pending_releases.add((sys_id, owner))
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._pending_meta[key] = value
+
+    def get_meta(self, key):
+        with self._lock:
+            if key in self._pending_meta:
+                return self._pending_meta[key]
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def flush(self):
+        """
+        Write all buffered changes in a single transaction.
+        """
+        with self._lock:
+            if not (self._pending or self._pending_meta or self._pending_releases):
+                return
+            pending, self._pending = self._pending, {}
+            releases, self._pending_releases = self._pending_releases, set()
+            playbooks, self._pending_playbooks = self._pending_playbooks, {}
+            meta, self._pending_meta = self._pending_meta, {}
+            deleted = [(sys_id,) for sys_id, row in pending.items() if row is None]
+            rows = [row for row in pending.values() if row is not None]
+            with self._conn:
+                self._conn.executemany("INSERT OR IGNORE INTO playbooks (hash, content) VALUES (?, ?)",
+                                       playbooks.items())
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO sessions (sys_id, shard, number, short_description, state,"
+                    " last_comment_id, candidates, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._conn.executemany("DELETE FROM sessions WHERE sys_id = ?", deleted)
+                if deleted:
+                    self._conn.execute(
+                        "DELETE FROM playbooks WHERE hash NOT IN"
+                        " (SELECT value FROM sessions, json_each(sessions.candidates))")
+                self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", meta.items())
+                self._conn.executemany("DELETE FROM leases WHERE sys_id = ? AND owner = ?", releases)
+
+    def claim(self, sys_ids, owner, ttl, ttls=None):
+        """
+        Take or renew leases on incidents for `owner`.
+
+        Leases are held for `ttl` seconds, or for `ttls[sys_id]` seconds where
+        given. Leases held by other owners are only taken over once they have
+        expired. Changes are written immediately rather than buffered.
+
+        Returns:
+            set: The sys_ids among `sys_ids` that `owner` now holds.
+        """
+        sys_ids = list(sys_ids)
+        if not sys_ids:
+            return set()
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO leases (sys_id, owner, expires) VALUES (?, ?, ?)"
+                " ON CONFLICT (sys_id) DO UPDATE SET owner = excluded.owner, expires = excluded.expires"
+                " WHERE leases.owner = excluded.owner OR leases.expires < ?",
+                [(sys_id, owner, now + (ttls or {}).get(sys_id, ttl), now) for sys_id in sys_ids])
+            held = set()
+            for start in range(0, len(sys_ids), 500):
+                chunk = sys_ids[start:start + 500]
+                held.update(row[0] for row in self._conn.execute(
+                    f"SELECT sys_id FROM leases WHERE owner = ? AND sys_id IN ({','.join('?' * len(chunk))})",
+                    [owner, *chunk]))
+        return held
+
+    def release_all(self, owner):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM leases WHERE owner = ?", (owner,))
+
+    def load_session(self, sys_id):
+        """
+        Return one stored session (see `load_sessions`), or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sys_id, number, short_description, state, last_comment_id, candidates"
+                " FROM sessions WHERE sys_id = ?", (sys_id,)).fetchone()
+            return self._session_record(row) if row else None
+
+    def _session_record(self, row):
+        sys_id, number, short_description, state, last_comment_id, candidates = row
+        hashes = json.loads(candidates)
+        contents = dict(self._conn.execute(
+            f"SELECT hash, content FROM playbooks WHERE hash IN ({','.join('?' * len(hashes))})",
+            hashes).fetchall()) if hashes else {}
+        return {
+            "sys_id": sys_id,
+            "number": number,
+            "short_description": short_description,
+            "state": state,
+            "last_comment_id": last_comment_id,
+            "playbooks": [contents[h] for h in hashes if h in contents],
+        }
+
+    def load_sessions(self, shard_index=0):
+        """
+        Return the stored sessions of one shard as dicts with their candidate playbooks.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sys_id, number, short_description, state, last_comment_id, candidates"
+                " FROM sessions WHERE shard = ?", (shard_index,)).fetchall()
+            return [self._session_record(row) for row in rows]
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
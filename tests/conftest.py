@@ -0,0 +1,47 @@
+"""
+Shared test setup.
+
+Several modules read their settings from the environment at import time, so
+the caches they open on import are pointed at a throwaway directory, and the
+service settings at placeholders, before any test module is collected. Tests
+point the shared HTTP clients at the fake services from loadtest/, which are
+importable as `fake_services`.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "loadtest"))
+
+_cache_dir = tempfile.mkdtemp(prefix="wrangler-tests-")
+os.environ["QUERY_CACHE_PATH"] = ""
+os.environ["GENERATION_CACHE_PATH"] = os.path.join(_cache_dir, "generation_cache.db")
+os.environ["PARSE_CACHE_PATH"] = os.path.join(_cache_dir, "parse_cache.db")
+os.environ.update({
+    "INSTANCE": "http://127.0.0.1:9",
+    "USERNAME": "wrangler",
+    "PASSWORD": "wrangler",
+    "AWX_URL": "http://127.0.0.1:9/api/v2",
+    "AWX_TOKEN": "wrangler",
+    "AWX_WEBSOCKET": "false",
+    "PROJECT_ID": "1",
+    "INVENTORY_ID": "1",
+    "CREDENTIAL_ID": "1",
+})
+
+
+@pytest.fixture
+def servicenow_fake(monkeypatch):
+    import servicenow
+    from fake_services import FakeServiceNow
+
+    server = FakeServiceNow(api_user=servicenow.username).start()
+    monkeypatch.setattr(servicenow.client, "base_url", server.url)
+    yield server
+    server.stop()
@@ -0,0 +1,68 @@
+import pytest
+import requests
+
+import awx
+from fake_services import FakeAWX
+
+
+@pytest.fixture
+def awx_fake(monkeypatch):
+    server = FakeAWX().start()
+    monkeypatch.setattr(awx.client, "base_url", server.api_url)
+    monkeypatch.setattr(awx, "_template_ids", {})
+    monkeypatch.setattr(awx, "_template_credentials", {})
+    yield server
+    server.stop()
+
+
+def runner_templates(server):
+    return [t for t in server.templates.values() if t["name"] == awx.RUNNER_TEMPLATE_NAME]
+
+
+def test_runner_template_is_created_once_and_cached(awx_fake):
+    first = awx.launch_playbook("wrangler_out/INC1.yml", 1)
+    second = awx.launch_playbook("wrangler_out/INC2.yml", 1, limit="web01")
+
+    assert first != second
+    [template] = runner_templates(awx_fake)
+    assert all(template[prompt] is True for prompt in awx.RUNNER_LAUNCH_PROMPTS)
+    assert awx_fake.requests["GET /api/v2/job_templates/"] == 1
+    assert awx_fake.requests["POST /api/v2/job_templates/{id}/launch/"] == 2
+
+
+def test_existing_runner_template_gets_launch_prompts(awx_fake):
+    awx_fake.templates[7] = {"id": 7, "name": awx.RUNNER_TEMPLATE_NAME, "playbook": awx.RUNNER_PLAYBOOK}
+
+    awx.launch_playbook("wrangler_out/INC1.yml", 1)
+
+    assert all(awx_fake.templates[7][prompt] is True for prompt in awx.RUNNER_LAUNCH_PROMPTS)
+    assert len(runner_templates(awx_fake)) == 1
+
+
+def test_stale_template_is_looked_up_again_once(awx_fake):
+    awx.launch_playbook("wrangler_out/INC1.yml", 1)
+    [stale] = runner_templates(awx_fake)
+    awx._template_credentials[stale["id"]] = {1}
+    # Someone deletes the template in AWX
+    del awx_fake.templates[stale["id"]]
+
+    job_id = awx.launch_playbook("wrangler_out/INC2.yml", 1)
+
+    [fresh] = runner_templates(awx_fake)
+    assert fresh["id"] != stale["id"]
+    assert job_id in awx_fake.units["job"]
+    assert awx._template_ids[awx.RUNNER_TEMPLATE_NAME] == fresh["id"]
+    assert stale["id"] not in awx._template_credentials
+    assert awx_fake.requests["POST /api/v2/job_templates/{id}/launch/"] == 3
+
+
+def test_template_still_stale_after_the_retry_raises(awx_fake, monkeypatch):
+    awx.launch_playbook("wrangler_out/INC1.yml", 1)
+    [template] = runner_templates(awx_fake)
+    # The lookup keeps returning a template that can no longer be launched
+    del awx_fake.templates[template["id"]]
+    monkeypatch.setattr(awx, "_find_job_template", lambda name: dict(template))
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        awx.launch_playbook("wrangler_out/INC2.yml", 1)
+    assert awx_fake.requests["POST /api/v2/job_templates/{id}/launch/"] == 3
@@ -0,0 +1,136 @@
+import functools
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import awx_events
+from awx_events import JobStatusWatcher
+from fake_services import FakeAWX, FakeAWXWebSocket, Latency
+from http_client import HttpClient
+
+TOKEN = "s3cret"
+
+
+@pytest.fixture
+def awx():
+    server = FakeAWX(project_update_duration=Latency(60)).start()
+    yield server
+    server.stop()
+
+
+def start_watcher(awx, webhook_token):
+    client = HttpClient("awx", awx.api_url)
+    watcher = JobStatusWatcher(client, awx.api_url, use_websocket=False, webhook_host="127.0.0.1",
+                               webhook_port=0, webhook_token=webhook_token, poll_min=0.05, poll_max=0.2)
+    return client, watcher.start()
+
+
+def notify(watcher, update_id, token=None, ui_path="project"):
+    headers = {} if token is None else {"X-Wrangler-Token": token}
+    # What AWX's webhook notification type posts for a project update
+    body = {
+        "id": update_id,
+        "name": "Wrangler Playbooks",
+        "url": f"https://awx.example.com/#/jobs/{ui_path}/{update_id}",
+        "created_by": "admin",
+        "started": "2024-05-02T09:14:03.114927Z",
+        "finished": "2024-05-02T09:14:11.542210Z",
+        "status": "successful",
+        "traceback": "",
+        "project": "Wrangler Playbooks",
+        "playbook": "",
+        "credential": None,
+        "limit": "",
+        "extra_vars": "{}",
+        "hosts": {},
+    }
+    return requests.post(f"http://127.0.0.1:{watcher.webhook_port}/", json=body, headers=headers, timeout=5)
+
+
+def test_webhook_rejects_missing_or_wrong_token(awx):
+    client, watcher = start_watcher(awx, TOKEN)
+    try:
+        update_id = client.post("/projects/1/update/").json()["id"]
+        future = watcher.watch("project_update", update_id)
+
+        assert notify(watcher, update_id).status_code == 403
+        assert notify(watcher, update_id, token="wrong").status_code == 403
+        assert notify(watcher, update_id, token=TOKEN[:-1]).status_code == 403
+        assert not future.done()
+    finally:
+        watcher.stop()
+
+
+def test_webhook_with_token_resolves_the_job(awx):
+    client, watcher = start_watcher(awx, TOKEN)
+    try:
+        update_id = client.post("/projects/1/update/").json()["id"]
+        future = watcher.watch("project_update", update_id)
+
+        assert notify(watcher, update_id, token=TOKEN).status_code == 204
+        assert future.result(timeout=5) == "successful"
+    finally:
+        watcher.stop()
+
+
+def test_webhook_resolves_playbook_jobs(awx):
+    client, watcher = start_watcher(awx, TOKEN)
+    try:
+        awx.job_duration = Latency(60)
+        template_id = client.post("/job_templates/", json={"name": "Runner"}).json()["id"]
+        job_id = client.post(f"/job_templates/{template_id}/launch/").json()["id"]
+        future = watcher.watch("job", job_id)
+
+        assert notify(watcher, job_id, token=TOKEN, ui_path="playbook").status_code == 204
+        assert future.result(timeout=5) == "successful"
+    finally:
+        watcher.stop()
+
+
+def test_webhook_listener_needs_a_token(awx):
+    _, watcher = start_watcher(awx, None)
+    try:
+        assert watcher._webhook_server is None
+        assert watcher.webhook_port == 0
+    finally:
+        watcher.stop()
+
+
+def start_websocket_watcher(awx, monkeypatch, password="password"):
+    monkeypatch.setattr(awx_events, "websocket",
+                        SimpleNamespace(WebSocketApp=functools.partial(FakeAWXWebSocket, awx)))
+    client = HttpClient("awx", awx.api_url)
+    # Polling only runs when a job is first watched, so later completions must come over the websocket
+    watcher = JobStatusWatcher(client, awx.api_url, use_websocket=True, username="admin", password=password,
+                               webhook_port=None, poll_min=30, poll_max=30)
+    return client, watcher.start()
+
+
+def test_websocket_subscribes_with_session_and_xrftoken(awx, monkeypatch):
+    awx.project_update_duration = Latency(0.3)
+    client, watcher = start_websocket_watcher(awx, monkeypatch)
+    try:
+        deadline = time.monotonic() + 5
+        while not watcher.websocket_connected and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert watcher.websocket_connected
+        app = watcher._websocket_app
+        [csrftoken] = awx.sessions.values()
+        assert app.received == [{"xrftoken": csrftoken, "groups": {"jobs": ["status_changed"]}}]
+
+        update_id = client.post("/projects/1/update/").json()["id"]
+        assert watcher.wait("project_update", update_id, timeout=5) == "successful"
+    finally:
+        watcher.stop()
+
+
+def test_websocket_is_not_connected_without_a_session(awx, monkeypatch):
+    _, watcher = start_websocket_watcher(awx, monkeypatch, password="wrong")
+    try:
+        time.sleep(0.3)
+        assert not watcher.websocket_connected
+        assert awx.sessions == {}
+    finally:
+        watcher.stop()
@@ -0,0 +1,94 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from generation_cache import GenerationCache, make_key
+
+KEY = make_key("model", "Restart nginx")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return GenerationCache(str(tmp_path / "generation_cache.db"))
+
+
+def counting(results):
+    calls = []
+    lock = threading.Lock()
+
+    def generate():
+        with lock:
+            calls.append(None)
+            result = results[len(calls) - 1]
+        time.sleep(0.2)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return generate, calls
+
+
+def test_concurrent_callers_share_one_generation(cache):
+    generate, calls = counting(["---\n- hosts: all\n"])
+    barrier = threading.Barrier(8)
+
+    def call():
+        barrier.wait()
+        return cache.get_or_generate(KEY, generate)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: call(), range(8)))
+
+    assert len(calls) == 1
+    assert results == ["---\n- hosts: all\n"] * 8
+    assert cache.candidates(KEY) == ["---\n- hosts: all\n"]
+
+
+def test_cached_candidate_is_reused_unless_excluded(cache):
+    generate, calls = counting(["first", "second"])
+
+    assert cache.get_or_generate(KEY, generate) == "first"
+    assert cache.get_or_generate(KEY, generate) == "first"
+    assert cache.get_or_generate(KEY, generate, exclude=["first"]) == "second"
+    assert len(calls) == 2
+    assert cache.candidates(KEY) == ["first", "second"]
+
+
+def test_failed_and_uncacheable_results_are_not_stored(cache):
+    generate, calls = counting([None, RuntimeError("Ollama is down"), "not a playbook", "---\n- hosts: all\n"])
+    is_playbook = lambda content: content.startswith("---")
+
+    assert cache.get_or_generate(KEY, generate, cacheable=is_playbook) is None
+    with pytest.raises(RuntimeError):
+        cache.get_or_generate(KEY, generate, cacheable=is_playbook)
+    assert cache.get_or_generate(KEY, generate, cacheable=is_playbook) == "not a playbook"
+    assert cache.candidates(KEY) == []
+
+    assert cache.get_or_generate(KEY, generate, cacheable=is_playbook) == "---\n- hosts: all\n"
+    assert len(calls) == 4
+    assert cache.candidates(KEY) == ["---\n- hosts: all\n"]
+
+
+def test_waiters_of_a_failed_generation_get_none(cache):
+    generate, calls = counting([RuntimeError("Ollama is down")])
+    barrier = threading.Barrier(4)
+    outcomes = []
+
+    def call():
+        barrier.wait()
+        try:
+            outcomes.append(cache.get_or_generate(KEY, generate))
+        except RuntimeError:
+            outcomes.append("raised")
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(outcomes, key=str) == [None, None, None, "raised"]
+    assert cache.candidates(KEY) == []
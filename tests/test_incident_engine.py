@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import pytest
+
+import incident_engine
+from incident_engine import CHOOSE_PROMPT, DEPLOY_UNCONFIRMED_MESSAGE, WELCOME_MESSAGE, IncidentEngine
+from poll_scheduler import PollScheduler
+from session_store import SessionStore
+
+PLAYBOOK = "---\n- name: Restart nginx\n  hosts: web\n"
+
+
+@pytest.fixture(autouse=True)
+def quick_retries(monkeypatch):
+    monkeypatch.setattr(incident_engine, "SESSION_RETRY_MIN", 0.1)
+
+
+def make_engine(path):
+    return IncidentEngine(use_gpu=False, scheduler=PollScheduler(min_interval=0.05, max_interval=0.2),
+                          store=SessionStore(str(path)))
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached in time")
+        await asyncio.sleep(0.02)
+
+
+def posted(servicenow, text):
+    return sum(1 for row in servicenow.journal if row["value"].startswith(text))
+
+
+def run_scenario(path, scenario):
+    async def main():
+        engine = make_engine(path)
+        task = asyncio.create_task(engine.run())
+        try:
+            await scenario(engine)
+        finally:
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    asyncio.run(main())
+
+
+def test_transient_error_retries_the_comment_without_restarting_the_conversation(servicenow_fake, tmp_path,
+                                                                                 monkeypatch):
+    incident = servicenow_fake.create_incident("Nginx is down on web01")
+    searches = []
+
+    def flaky_search(queries, top_k, use_gpu):
+        searches.append(queries)
+        if len(searches) == 1:
+            raise ConnectionError("Index server unavailable")
+        return [[PLAYBOOK] for _ in queries]
+
+    monkeypatch.setattr(incident_engine, "retrieve_playbooks_batch", flaky_search)
+
+    async def scenario(engine):
+        await wait_for(lambda: posted(servicenow_fake, WELCOME_MESSAGE) == 1)
+        session = engine.sessions[incident["sys_id"]]
+        servicenow_fake.add_comment(incident["sys_id"], "Search")
+        await wait_for(lambda: session.failures == 1)
+        assert engine.sessions[incident["sys_id"]] is session
+        await wait_for(lambda: session.state == "choose_or_generate")
+        assert session.playbooks == [PLAYBOOK]
+        assert session.failures == 0
+
+    run_scenario(tmp_path / "sessions.db", scenario)
+
+    assert len(searches) == 2
+    assert posted(servicenow_fake, WELCOME_MESSAGE) == 1
+    record = SessionStore(str(tmp_path / "sessions.db")).load_session(incident["sys_id"])
+    assert record["state"] == "choose_or_generate"
+    assert record["playbooks"] == [PLAYBOOK]
+
+
+def test_failed_deployment_is_not_repeated(servicenow_fake, tmp_path, monkeypatch):
+    incident = servicenow_fake.create_incident("Nginx is down on web01")
+    deployments = []
+
+    def broken_deploy(number, playbook):
+        deployments.append(number)
+        raise TimeoutError("AWX job status unknown")
+
+    monkeypatch.setattr(incident_engine, "retrieve_playbooks_batch", lambda queries, **_: [[PLAYBOOK] for _ in queries])
+    monkeypatch.setattr(incident_engine, "execute_playbook_on_awx", broken_deploy)
+
+    async def scenario(engine):
+        await wait_for(lambda: posted(servicenow_fake, WELCOME_MESSAGE) == 1)
+        servicenow_fake.add_comment(incident["sys_id"], "Search")
+        session = engine.sessions[incident["sys_id"]]
+        await wait_for(lambda: session.state == "choose_or_generate")
+        servicenow_fake.add_comment(incident["sys_id"], "1")
+        await wait_for(lambda: posted(servicenow_fake, DEPLOY_UNCONFIRMED_MESSAGE) == 1)
+        await asyncio.sleep(0.5)
+        assert session.state == "choose_or_generate"
+
+    run_scenario(tmp_path / "sessions.db", scenario)
+
+    assert deployments == [incident["number"]]
+    assert servicenow_fake.journal[-1]["value"].endswith(CHOOSE_PROMPT)
+
+
+def test_failed_resolution_update_is_retried(servicenow_fake, tmp_path, monkeypatch):
+    incident = servicenow_fake.create_incident("Nginx is down on web01")
+    deployments = []
+    update_incident = incident_engine.update_incident
+    failed = []
+
+    def flaky_update(sys_id, payload):
+        if payload.get("state") == 6 and not failed:
+            failed.append(payload)
+            raise ConnectionError("ServiceNow is unavailable")
+        update_incident(sys_id, payload)
+
+    def deploy(number, playbook):
+        deployments.append(number)
+        return "successful"
+
+    monkeypatch.setattr(incident_engine, "retrieve_playbooks_batch", lambda queries, **_: [[PLAYBOOK] for _ in queries])
+    monkeypatch.setattr(incident_engine, "execute_playbook_on_awx", deploy)
+    monkeypatch.setattr(incident_engine, "update_incident", flaky_update)
+
+    async def scenario(engine):
+        await wait_for(lambda: posted(servicenow_fake, WELCOME_MESSAGE) == 1)
+        servicenow_fake.add_comment(incident["sys_id"], "Search")
+        session = engine.sessions[incident["sys_id"]]
+        await wait_for(lambda: session.state == "choose_or_generate")
+        servicenow_fake.add_comment(incident["sys_id"], "1")
+        await wait_for(lambda: servicenow_fake.incidents[incident["sys_id"]]["state"] == "6")
+        await wait_for(lambda: incident["sys_id"] not in engine.sessions)
+
+    run_scenario(tmp_path / "sessions.db", scenario)
+
+    assert deployments == [incident["number"]]
+    assert len(failed) == 1
+    assert posted(servicenow_fake, DEPLOY_UNCONFIRMED_MESSAGE) == 0
+    assert SessionStore(str(tmp_path / "sessions.db")).load_session(incident["sys_id"]) is None
@@ -0,0 +1,92 @@
+import json
+
+import numpy as np
+import pytest
+
+import embedding_service
+import llama_interface
+from document_store import DocumentStore
+from fake_services import HashingEncoder
+
+PLAYBOOK = """---
+- name: {name}
+  hosts: all
+  tasks:
+    - name: Install {package}
+      ansible.builtin.package:
+        name: {package}
+    - name: Start {package}
+      ansible.builtin.service:
+        name: {package}
+        state: started
+"""
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(embedding_service, "_embedding_model", HashingEncoder())
+    (tmp_path / "existing_playbooks").mkdir()
+    return tmp_path
+
+
+def write_playbook(workspace, name, package):
+    (workspace / "existing_playbooks" / name).write_text(PLAYBOOK.format(name=f"Set up {package}", package=package))
+
+
+def build():
+    llama_interface.create_faiss_index(use_gpu=False, workers=1, index_type="flat")
+    with open(llama_interface.INDEX_MANIFEST_PATH, encoding='utf-8') as f:
+        manifest = json.load(f)
+    index = llama_interface.faiss.read_index(llama_interface.FAISS_INDEX_PATH)
+    return manifest, index
+
+
+def stored(manifest):
+    store = DocumentStore(llama_interface.DOCUMENTS_PATH, llama_interface.DOCUMENTS_INDEX_PATH)
+    try:
+        return {name: store.get(entry["id"]) for name, entry in manifest["files"].items()}
+    finally:
+        store.close()
+
+
+def test_update_embeds_only_added_and_changed_playbooks(workspace):
+    for name, package in (("nginx.yml", "nginx"), ("redis.yml", "redis"), ("ntp.yml", "chrony")):
+        write_playbook(workspace, name, package)
+    manifest, index = build()
+
+    assert sorted(manifest["files"]) == ["nginx.yml", "ntp.yml", "redis.yml"]
+    assert index.ntotal == sum(entry["chunk_count"] for entry in manifest["files"].values())
+    kept = manifest["files"]["nginx.yml"]
+
+    write_playbook(workspace, "redis.yml", "valkey")
+    (workspace / "existing_playbooks" / "ntp.yml").unlink()
+    write_playbook(workspace, "postgres.yml", "postgresql")
+    embedded = embedding_service.embedding_stats()["encoded_texts"]
+    manifest, index = build()
+
+    assert sorted(manifest["files"]) == ["nginx.yml", "postgres.yml", "redis.yml"]
+    assert manifest["files"]["nginx.yml"] == kept
+    assert embedding_service.embedding_stats()["encoded_texts"] - embedded == (
+        manifest["files"]["redis.yml"]["chunk_count"] + manifest["files"]["postgres.yml"]["chunk_count"])
+    live_chunks = [chunk for entry in manifest["files"].values()
+                   for chunk in range(entry["chunk_start"], entry["chunk_start"] + entry["chunk_count"])]
+    assert index.ntotal == len(live_chunks)
+    parents = np.load(llama_interface.CHUNK_MAP_PATH)
+    assert all(parents[chunk] >= 0 for chunk in live_chunks)
+    assert (parents >= 0).sum() == len(live_chunks)
+
+    documents = stored(manifest)
+    assert "valkey" in documents["redis.yml"]
+    assert "postgresql" in documents["postgres.yml"]
+    assert documents["nginx.yml"].startswith("---\n- name: Set up nginx")
+
+
+def test_update_without_changes_keeps_the_index(workspace):
+    write_playbook(workspace, "nginx.yml", "nginx")
+    build()
+    meta = llama_interface.read_index_meta(llama_interface.FAISS_INDEX_PATH)
+
+    build()
+
+    assert llama_interface.read_index_meta(llama_interface.FAISS_INDEX_PATH)["generation"] == meta["generation"]
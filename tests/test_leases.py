@@ -0,0 +1,136 @@
+import asyncio
+import time
+
+import pytest
+
+from incident_engine import WELCOME_MESSAGE, IncidentEngine
+from poll_scheduler import PollScheduler
+from session_store import SessionStore
+
+TTL = 0.6
+
+
+def make_engine(path, worker_id, lease_ttl=TTL):
+    return IncidentEngine(use_gpu=False, scheduler=PollScheduler(min_interval=0.05, max_interval=0.2),
+                          store=SessionStore(str(path)), leases=True, worker_id=worker_id,
+                          lease_ttl=lease_ttl, lease_batch=10)
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached in time")
+        await asyncio.sleep(0.02)
+
+
+async def stop(task):
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+def welcomes(servicenow):
+    return sum(1 for row in servicenow.journal if row["value"] == WELCOME_MESSAGE)
+
+
+def test_claim_renews_own_leases_and_respects_others(tmp_path):
+    a = SessionStore(str(tmp_path / "sessions.db"))
+    b = SessionStore(str(tmp_path / "sessions.db"))
+
+    assert a.claim(["x", "y"], "a", TTL) == {"x", "y"}
+    assert b.claim(["x", "y", "z"], "b", TTL) == {"z"}
+    assert a.claim(["x", "y", "z"], "a", TTL) == {"x", "y"}
+
+    time.sleep(TTL + 0.1)
+    assert b.claim(["x"], "b", TTL) == {"x"}
+    assert a.claim(["x", "y"], "a", TTL) == {"y"}
+
+    a.release_all("a")
+    assert b.claim(["y"], "b", TTL) == {"y"}
+
+
+def test_longer_lease_is_not_taken_over_at_the_normal_ttl(tmp_path):
+    a = SessionStore(str(tmp_path / "sessions.db"))
+    b = SessionStore(str(tmp_path / "sessions.db"))
+
+    assert a.claim(["x", "y"], "a", 0.05, {"x": 60}) == {"x", "y"}
+    time.sleep(0.1)
+
+    assert b.claim(["x", "y"], "b", TTL) == {"y"}
+
+
+def test_release_is_written_with_the_session_delete(tmp_path):
+    a = SessionStore(str(tmp_path / "sessions.db"))
+    b = SessionStore(str(tmp_path / "sessions.db"))
+    a.claim(["x"], "a", 60)
+    a.save("x", "INC1", "Disk full", "waiting", None, ["---\n- hosts: all\n"])
+    a.flush()
+
+    a.delete("x")
+    a.release("x", "a")
+    assert b.claim(["x"], "b", 60) == set()
+
+    a.flush()
+    assert b.claim(["x"], "b", 60) == {"x"}
+    assert b.load_session("x") is None
+
+
+def test_expired_leases_are_taken_over_with_their_sessions(servicenow_fake, tmp_path):
+    path = tmp_path / "sessions.db"
+    incident = servicenow_fake.create_incident("Disk full on web01")
+    dead = SessionStore(str(path))
+    dead.claim([incident["sys_id"]], "dead-worker", TTL)
+    dead.save(incident["sys_id"], incident["number"], incident["short_description"], "waiting", None, [])
+    dead.flush()
+    # Posted after the dead worker's last poll
+    servicenow_fake.add_comment(incident["sys_id"], "Hello?")
+    comment_id = servicenow_fake.journal[-1]["sys_id"]
+
+    async def scenario():
+        engine = make_engine(path, "live-worker")
+        task = asyncio.create_task(engine.run())
+        await asyncio.sleep(TTL / 2)
+        assert engine.sessions == {}
+        await wait_for(lambda: incident["sys_id"] in engine.sessions)
+        session = engine.sessions[incident["sys_id"]]
+        await wait_for(lambda: session.last_comment_id == comment_id)
+        assert session.state == "waiting"
+        await stop(task)
+
+    asyncio.run(scenario())
+
+    assert welcomes(servicenow_fake) == 0
+    assert SessionStore(str(path)).load_session(incident["sys_id"])["last_comment_id"] == comment_id
+
+
+def test_live_holder_keeps_its_leases_through_a_failing_poll(servicenow_fake, tmp_path):
+    path = tmp_path / "sessions.db"
+    incidents = [servicenow_fake.create_incident(f"Service {n} is down") for n in range(3)]
+
+    def failing_poll():
+        time.sleep(3 * TTL)
+        raise ConnectionError("ServiceNow is unavailable")
+
+    async def scenario():
+        holder = make_engine(path, "holder")
+        holder_task = asyncio.create_task(holder.run())
+        await wait_for(lambda: len(holder.sessions) == 3
+                       and all(s.state == "waiting" for s in holder.sessions.values()))
+        holder.incident_poller.poll = failing_poll
+
+        other = make_engine(path, "other")
+        other_task = asyncio.create_task(other.run())
+        await asyncio.sleep(4 * TTL)
+        assert other.sessions == {}
+        assert set(holder.sessions) == {incident["sys_id"] for incident in incidents}
+
+        # A clean shutdown hands the incidents over right away
+        await stop(holder_task)
+        await wait_for(lambda: len(other.sessions) == 3, timeout=TTL)
+        assert all(s.state == "waiting" for s in other.sessions.values())
+        await stop(other_task)
+
+    asyncio.run(scenario())
+
+    assert welcomes(servicenow_fake) == 3
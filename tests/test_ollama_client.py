@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+import ollama_client
+from fake_services import FakeOllama, Latency
+from llama_interface import CompletePlaybookCheck, prune_ansible_playbook
+
+EPILOGUE = "This playbook applies the fix to every host in the inventory. " * 40
+TOKEN_DELAY = 0.005
+
+
+@pytest.fixture
+def ollama(monkeypatch):
+    server = FakeOllama(first_token_latency=Latency(0), token_delay=TOKEN_DELAY, epilogue=EPILOGUE).start()
+    monkeypatch.setattr(ollama_client, "OLLAMA_HOST", server.url)
+    yield server
+    server.stop()
+
+
+def test_generate_streams_until_done(ollama):
+    text = ollama_client.generate("model", "Restart nginx")
+
+    assert text.startswith("Here is the playbook:")
+    assert text.endswith(EPILOGUE.split()[-1] + " ")
+    assert ollama.completed == 1
+
+
+def test_generate_stops_once_playbook_is_complete(ollama):
+    full_stream_seconds = len(EPILOGUE.split()) * TOKEN_DELAY
+    started = time.monotonic()
+    text = ollama_client.generate("model", "Restart nginx", stop_when=CompletePlaybookCheck())
+    elapsed = time.monotonic() - started
+
+    assert text.rstrip().endswith("```")
+    assert "inventory" not in text
+    assert elapsed < full_stream_seconds / 2
+    assert ollama.completed == 0
+    assert prune_ansible_playbook({"content": text}).startswith("---\n- name: Generated fix")
+
+
+def test_stop_check_handles_fences_split_across_chunks():
+    check = CompletePlaybookCheck()
+    chunks = ["Sure:\n`", "``yaml\n---\n- hosts: all\n", "  tasks: []\n`", "`", "`\nDone"]
+    text = ""
+    results = []
+    for chunk in chunks:
+        text += chunk
+        results.append(check(text))
+
+    assert results == [False, False, False, False, True]
+    assert check.fences == 2
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from fake_services import FakeGitHub
+from playbook_crawler import PlaybookCrawler
+
+PLAYBOOK = "---\n- name: {name}\n  hosts: all\n  tasks: []\n"
+
+
+@pytest.fixture
+def github():
+    server = FakeGitHub(per_page=2).start()
+    for n in range(5):
+        server.add_file("acme", f"repo{n}", "site.yml", PLAYBOOK.format(name=f"play {n}"))
+    yield server
+    server.stop()
+
+
+def make_crawler(github, tmp_path):
+    return PlaybookCrawler("token", str(tmp_path / "playbooks"), str(tmp_path / "crawl_manifest.json"),
+                           api_url=github.url, raw_url=github.url, workers=2, rate=1000)
+
+
+def test_interrupted_crawl_resumes_from_next_page(github, tmp_path):
+    first = make_crawler(github, tmp_path).crawl(max_pages=1)
+
+    assert first == ["repo0_site.yml", "repo1_site.yml"]
+    manifest = json.loads((tmp_path / "crawl_manifest.json").read_text())
+    assert "page=2" in manifest["crawl"]["next_url"]
+
+    rest = make_crawler(github, tmp_path).crawl()
+
+    assert github.search_pages == [1, 2, 3]
+    assert rest == ["repo2_site.yml", "repo3_site.yml", "repo4_site.yml"]
+    assert sorted(p.name for p in (tmp_path / "playbooks").iterdir()) == [f"repo{n}_site.yml" for n in range(5)]
+    manifest = json.loads((tmp_path / "crawl_manifest.json").read_text())
+    assert manifest["crawl"]["next_url"] is None
+
+
+def test_recrawl_downloads_only_changed_files(github, tmp_path):
+    make_crawler(github, tmp_path).crawl()
+    github.add_file("acme", "repo1", "site.yml", PLAYBOOK.format(name="play 1, fixed"))
+    before = github.requests.get("GET /acme/repo0/main/site.yml")
+
+    updated = make_crawler(github, tmp_path).crawl()
+
+    assert updated == ["repo1_site.yml"]
+    assert "fixed" in (tmp_path / "playbooks" / "repo1_site.yml").read_text()
+    assert github.requests["GET /acme/repo0/main/site.yml"] == before + 1
+
+
+def test_duplicate_content_is_not_stored_twice(github, tmp_path):
+    github.add_file("other", "fork", "site.yml", PLAYBOOK.format(name="play 0"))
+
+    updated = make_crawler(github, tmp_path).crawl()
+    again = make_crawler(github, tmp_path).crawl()
+
+    assert "fork_site.yml" not in updated
+    assert not (tmp_path / "playbooks" / "fork_site.yml").exists()
+    assert again == []
+    manifest = json.loads((tmp_path / "crawl_manifest.json").read_text())
+    assert manifest["files"]["/other/fork/main/site.yml"]["duplicate_of"] == "repo0_site.yml"
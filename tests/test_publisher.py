@@ -0,0 +1,88 @@
+import subprocess
+
+import pytest
+
+from publisher import PlaybookPublisher
+
+PLAYBOOK = "---\n- name: Restart {0}\n  hosts: web\n"
+
+
+def git(cwd, *args):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout
+
+
+@pytest.fixture
+def repos(tmp_path, monkeypatch):
+    for var in ("GIT_AUTHOR_NAME", "GIT_COMMITTER_NAME"):
+        monkeypatch.setenv(var, "wrangler")
+    for var in ("GIT_AUTHOR_EMAIL", "GIT_COMMITTER_EMAIL"):
+        monkeypatch.setenv(var, "wrangler@example.com")
+    remote = tmp_path / "remote.git"
+    work = tmp_path / "work"
+    git(tmp_path, "init", "--bare", "-b", "main", str(remote))
+    git(tmp_path, "init", "-b", "main", str(work))
+    git(work, "remote", "add", "origin", str(remote))
+    (work / "README.md").write_text("playbooks\n")
+    git(work, "add", "README.md")
+    git(work, "commit", "-m", "Initial commit")
+    git(work, "push", "origin", "main")
+    return remote, work
+
+
+def write_playbooks(work, names):
+    paths = []
+    for name in names:
+        path = work / "playbooks" / f"{name}.yml"
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(PLAYBOOK.format(name))
+        paths.append(path)
+    return paths
+
+
+def test_playbooks_submitted_together_share_one_commit_push_and_update(repos):
+    remote, work = repos
+    updates = []
+    publisher = PlaybookPublisher(work, "main", lambda: updates.append(1), window=0.5)
+    # A local edit outside the batch must stay out of the commit
+    (work / "README.md").write_text("work in progress\n")
+
+    paths = write_playbooks(work, ["nginx", "redis", "postgres"])
+    futures = [publisher.submit(path, f"INC001000{i}") for i, path in enumerate(paths, 1)]
+    for future in futures:
+        assert future.result(timeout=30) is None
+
+    log = git(remote, "log", "--format=%s", "main").splitlines()
+    assert log == ["Add playbooks for 3 incidents", "Initial commit"]
+    assert git(remote, "log", "-1", "--format=%b", "main").split() == ["INC0010001", "INC0010002", "INC0010003"]
+    changed = git(remote, "show", "--name-only", "--format=", "main").split()
+    assert changed == ["playbooks/nginx.yml", "playbooks/postgres.yml", "playbooks/redis.yml"]
+    assert git(remote, "show", "main:README.md") == "playbooks\n"
+    assert updates == [1]
+
+    # Republishing unchanged playbooks pushes nothing new but still syncs the project
+    assert publisher.publish(paths[0], "INC0010001", timeout=30) is None
+    assert len(git(remote, "log", "--format=%s", "main").splitlines()) == 2
+    assert updates == [1, 1]
+
+
+def test_rejected_push_fails_every_playbook_in_the_batch(repos):
+    remote, work = repos
+    hook = remote / "hooks" / "pre-receive"
+    hook.write_text("#!/bin/sh\necho 'pushes are frozen' >&2\nexit 1\n")
+    hook.chmod(0o755)
+    updates = []
+    publisher = PlaybookPublisher(work, "main", lambda: updates.append(1), window=0.5)
+
+    paths = write_playbooks(work, ["nginx", "redis"])
+    futures = [publisher.submit(path, f"INC001000{i}") for i, path in enumerate(paths, 1)]
+    for future in futures:
+        with pytest.raises(subprocess.CalledProcessError):
+            future.result(timeout=30)
+
+    assert git(remote, "log", "--format=%s", "main").splitlines() == ["Initial commit"]
+    assert updates == []
+    # The commit is kept locally, so the next batch pushes it once pushes are accepted again
+    hook.unlink()
+    assert publisher.publish(write_playbooks(work, ["mysql"])[0], "INC0010003", timeout=30) is None
+    assert len(git(remote, "log", "--format=%s", "main").splitlines()) == 3
+    assert updates == [1]
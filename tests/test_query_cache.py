@@ -0,0 +1,80 @@
+import json
+
+import numpy as np
+import pytest
+
+import query_cache
+from query_cache import QueryCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(query_cache.time, "time", clock)
+    return clock
+
+
+def test_results_added_later_expire_on_their_own_clock(clock):
+    cache = QueryCache(ttl_seconds=100)
+    cache.put_embedding("Nginx is down", [0.1, 0.2])
+    cache.put_results("Nginx is down", 3, [(1, 0.9)])
+
+    clock.now += 80
+    cache.put_results("nginx  IS down", 3, [(2, 0.8)], params={"nprobe": 16})
+
+    clock.now += 40
+    assert cache.get_embedding("Nginx is down") is None
+    assert cache.get_results("Nginx is down", 3) is None
+    assert cache.get_results("Nginx is down", 3, {"nprobe": 16}) == [(2, 0.8)]
+
+    clock.now += 61
+    assert cache.get_results("Nginx is down", 3, {"nprobe": 16}) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_query_is_evicted_first(clock):
+    cache = QueryCache(max_entries=2)
+    cache.put_embedding("nginx is down", [0.1])
+    cache.put_embedding("disk is full", [0.2])
+    assert cache.get_embedding("nginx is down") is not None
+
+    cache.put_results("cpu is pegged", 3, [(7, 0.5)])
+
+    assert cache.get_embedding("disk is full") is None
+    assert cache.get_embedding("nginx is down") is not None
+    assert cache.get_results("cpu is pegged", 3) == [(7, 0.5)]
+    assert cache.stats()["entries"] == 2
+
+
+def test_saved_cache_keeps_per_result_timestamps(clock, tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = QueryCache(ttl_seconds=100, path=path)
+    cache.put_results("nginx is down", 3, [(1, 0.9)])
+    clock.now += 80
+    cache.put_results("nginx is down", 5, [(1, 0.9), (4, 0.7)])
+    cache.save()
+
+    clock.now += 40
+    reloaded = QueryCache(ttl_seconds=100, path=path)
+    assert reloaded.get_results("nginx is down", 3) is None
+    assert reloaded.get_results("nginx is down", 5) == [(1, 0.9), (4, 0.7)]
+
+
+def test_cache_files_without_per_result_timestamps_still_load(clock, tmp_path):
+    path = tmp_path / "cache.json"
+    path.write_text(json.dumps({"generation": "g1", "entries": [{
+        "query": "nginx is down", "created": clock.now - 10, "embedding": [0.5, 0.5],
+        "results": {json.dumps([3, None], sort_keys=True): [[1, 0.9]]},
+    }]}))
+
+    cache = QueryCache(ttl_seconds=100, path=str(path))
+    assert cache.get_results("nginx is down", 3) == [(1, 0.9)]
+    assert np.allclose(cache.get_embedding("nginx is down"), [0.5, 0.5])
@@ -0,0 +1,68 @@
+import pytest
+
+import embedding_service
+import llama_interface
+from playbook_chunker import chunk_playbook
+from fake_services import HashingEncoder
+from query_cache import QueryCache
+
+SHORT_PLAYBOOK = """---
+- name: Set up {package}
+  hosts: all
+  tasks:
+    - name: Install {package}
+      ansible.builtin.package:
+        name: {package}
+"""
+
+
+def long_playbook(tasks):
+    steps = "".join(f"""
+    - name: Restart nginx service step {step}
+      ansible.builtin.service:
+        name: nginx
+        state: restarted
+""" for step in range(tasks))
+    return f"---\n- name: Restart nginx everywhere\n  hosts: web\n  tasks:{steps}"
+
+
+@pytest.fixture
+def retrieval(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(embedding_service, "_embedding_model", HashingEncoder())
+    for name in ("index_cpu", "index_gpu", "index_meta", "documents", "chunk_parents", "lexical_index"):
+        monkeypatch.setattr(llama_interface, name, getattr(llama_interface, name))
+    monkeypatch.setattr(llama_interface, "query_cache", QueryCache())
+    monkeypatch.setattr(llama_interface, "LEXICAL_WEIGHT", 0)
+    playbooks = tmp_path / "existing_playbooks"
+    playbooks.mkdir()
+    yield playbooks
+    if llama_interface.documents is not None:
+        llama_interface.documents.close()
+
+
+def test_long_playbook_does_not_crowd_out_other_results(retrieval, monkeypatch):
+    (retrieval / "nginx.yml").write_text(long_playbook(40))
+    (retrieval / "redis.yml").write_text(SHORT_PLAYBOOK.format(package="redis"))
+    (retrieval / "ntp.yml").write_text(SHORT_PLAYBOOK.format(package="chrony"))
+    llama_interface.create_faiss_index(use_gpu=False, workers=1, index_type="flat")
+    llama_interface.load_retrieval_system(use_gpu=False)
+    assert llama_interface.index_cpu.ntotal > 2 * llama_interface.CHUNK_OVERSAMPLE
+
+    searches = []
+    search = llama_interface._search_index
+    def counting_search(index, query_embeddings, top_k, *args):
+        searches.append(top_k)
+        return search(index, query_embeddings, top_k, *args)
+    monkeypatch.setattr(llama_interface, "_search_index", counting_search)
+
+    # Every task chunk of the long playbook is nearer to this query than any other chunk
+    query = chunk_playbook(long_playbook(40))[1]
+    retrieved = llama_interface.retrieve_playbooks(query, top_k=2, use_gpu=False)
+
+    assert len(retrieved) == 2
+    assert retrieved[0].startswith("---\n- name: Restart nginx everywhere")
+    assert retrieved[1].startswith("---\n- name: Set up")
+    assert searches[0] == 2 * llama_interface.CHUNK_OVERSAMPLE
+    assert searches[-1] > searches[0]
+    assert searches[-1] <= llama_interface.index_cpu.ntotal
@@ -0,0 +1,128 @@
+import json
+
+import servicenow
+from servicenow import IncidentPoller, JournalPoller, fetch_latest_comment, update_incident
+
+T0 = "2024-05-02 09:00:00"
+T1 = "2024-05-02 09:00:01"
+T2 = "2024-05-02 09:00:02"
+
+
+def texts(new_comments, sys_id):
+    return [comment for comment, _ in new_comments.get(sys_id, [])]
+
+
+def test_comments_at_the_watermark_second_are_delivered_once(servicenow_fake):
+    incident = servicenow_fake.create_incident("Disk full on web01")
+    sys_id = incident["sys_id"]
+    servicenow_fake.add_comment(sys_id, "Before start", created=T0)
+    poller = JournalPoller()
+    assert poller.poll([sys_id]) == {}
+
+    servicenow_fake.add_comment(sys_id, "Search", created=T1)
+    servicenow_fake.add_comment(sys_id, "1", created=T1)
+    assert texts(poller.poll([sys_id]), sys_id) == ["search", "1"]
+
+    servicenow_fake.add_comment(sys_id, "Generate", created=T1)
+    assert texts(poller.poll([sys_id]), sys_id) == ["generate"]
+    assert poller.poll([sys_id]) == {}
+
+
+def test_restart_from_checkpoint_delivers_comments_posted_while_down(servicenow_fake):
+    incident = servicenow_fake.create_incident("Disk full on web01")
+    sys_id = incident["sys_id"]
+    poller = JournalPoller()
+    poller.poll([sys_id])
+    servicenow_fake.add_comment(sys_id, "Search", created=T1)
+    poller.poll([sys_id])
+    checkpoint = json.loads(json.dumps(poller.checkpoint()))
+
+    servicenow_fake.add_comment(sys_id, "1", created=T1)
+    servicenow_fake.add_comment(sys_id, "Generate", created=T2)
+    restarted = JournalPoller()
+    restarted.restore(checkpoint)
+
+    assert texts(restarted.poll([sys_id]), sys_id) == ["1", "generate"]
+    assert restarted.checkpoint()["watermark"] == T2
+
+
+def test_own_comments_are_not_delivered(servicenow_fake, monkeypatch):
+    incident = servicenow_fake.create_incident("Disk full on web01")
+    sys_id = incident["sys_id"]
+    poller = JournalPoller()
+    poller.poll([sys_id])
+
+    servicenow_fake.add_comment(sys_id, "Search")
+    update_incident(sys_id, {"comments": "The following playbooks have been retrieved"})
+    assert texts(poller.poll([sys_id]), sys_id) == ["search"]
+    assert fetch_latest_comment(sys_id)[0] == "search"
+
+    # A copy of a bot message written under another account, e.g. by a business rule
+    monkeypatch.setattr(servicenow, "username", "someone-else")
+    update_incident(sys_id, {"comments": "Playbook deployment failed."})
+    servicenow_fake.journal[-1]["sys_created_by"] = "system"
+    servicenow_fake.add_comment(sys_id, "2", created="2099-01-01 00:00:00")
+    assert texts(poller.poll([sys_id]), sys_id) == ["2"]
+    assert fetch_latest_comment(sys_id)[0] == "2"
+
+
+def stamp(second):
+    return f"2024-05-02 10:00:{second:02d}"
+
+
+def touch(servicenow_fake, incident, second, **fields):
+    servicenow_fake.incidents[incident["sys_id"]].update(fields, sys_updated_on=stamp(second))
+
+
+def open_ids(poller):
+    return {incident["sys_id"] for incident in poller.poll()}
+
+
+def test_incident_updated_during_paging_does_not_hide_others(servicenow_fake, monkeypatch):
+    incidents = [servicenow_fake.create_incident(f"Service {n} is down") for n in range(5)]
+    for second, incident in enumerate(incidents):
+        touch(servicenow_fake, incident, second)
+    poller = IncidentPoller(page_size=2, reconcile_interval=3600)
+    assert open_ids(poller) == {incident["sys_id"] for incident in incidents}
+
+    # Paged two at a time; moving the first incident to the end while paging
+    # shifts the third one back onto the page already read
+    first, _, resolved, _, _ = incidents
+    for second, incident in enumerate(incidents, 10):
+        touch(servicenow_fake, incident, second)
+    touch(servicenow_fake, resolved, 12, state="6")
+    fetch_page = servicenow._fetch_page
+
+    def fetch_page_while_updating(endpoint, query, fields, offset, limit):
+        page = fetch_page(endpoint, query, fields, offset, limit)
+        if offset == 0 and "sys_updated_on>=" in query:
+            # Someone edits the first incident between the two page requests
+            touch(servicenow_fake, first, 20, short_description="Service 0 is down again")
+        return page
+
+    monkeypatch.setattr(servicenow, "_fetch_page", fetch_page_while_updating)
+    open_ids(poller)
+    monkeypatch.setattr(servicenow, "_fetch_page", fetch_page)
+    remaining = open_ids(poller)
+
+    assert resolved["sys_id"] not in remaining
+    assert len(remaining) == 4
+    assert poller.incidents[first["sys_id"]]["short_description"] == "Service 0 is down again"
+
+
+def test_reconcile_drops_incidents_the_delta_cannot_see(servicenow_fake):
+    incidents = [servicenow_fake.create_incident(f"Service {n} is down") for n in range(3)]
+    for second, incident in enumerate(incidents):
+        touch(servicenow_fake, incident, second)
+    poller = IncidentPoller(page_size=2, reconcile_interval=3600)
+    assert len(open_ids(poller)) == 3
+
+    resolved, deleted, _ = incidents
+    touch(servicenow_fake, resolved, 30, state="6", active="false")
+    del servicenow_fake.incidents[deleted["sys_id"]]
+    remaining = open_ids(poller)
+    assert resolved["sys_id"] not in remaining
+    assert deleted["sys_id"] in remaining
+
+    poller.reconcile_interval = 0
+    assert open_ids(poller) == {incidents[2]["sys_id"]}
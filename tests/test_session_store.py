@@ -0,0 +1,85 @@
+import sqlite3
+
+from session_store import SessionStore, shard_of
+
+NGINX = "---\n- name: Restart nginx\n  hosts: web\n"
+DISK = "---\n- name: Clean /var/log\n  hosts: all\n"
+SHARED = "---\n- name: Reboot\n  hosts: all\n"
+
+
+def stored_playbooks(path):
+    with sqlite3.connect(path) as conn:
+        return {row[0] for row in conn.execute("SELECT content FROM playbooks")}
+
+
+def test_sessions_round_trip_through_a_new_store(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(path)
+    store.save("a" * 32, "INC0010001", "Nginx is down", "choose_or_generate", "c1", [NGINX, SHARED])
+    store.save("b" * 32, "INC0010002", "Disk full", "waiting", None, [])
+    store.set_meta("journal:0", '{"watermark": "2024-05-02 09:00:00", "seen": ["c1"]}')
+    store.close()
+
+    reopened = SessionStore(path)
+    records = {record["sys_id"]: record for record in reopened.load_sessions(0)}
+
+    assert records["a" * 32] == {
+        "sys_id": "a" * 32, "number": "INC0010001", "short_description": "Nginx is down",
+        "state": "choose_or_generate", "last_comment_id": "c1", "playbooks": [NGINX, SHARED],
+    }
+    assert records["b" * 32]["playbooks"] == []
+    assert reopened.load_session("b" * 32)["state"] == "waiting"
+    assert reopened.load_session("c" * 32) is None
+    assert reopened.get_meta("journal:0").startswith('{"watermark"')
+    assert reopened._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_writes_are_buffered_until_flush(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(path)
+    store.save("a" * 32, "INC0010001", "Nginx is down", "waiting", None, [NGINX])
+
+    assert SessionStore(path).load_session("a" * 32) is None
+    store.flush()
+    assert SessionStore(path).load_session("a" * 32)["playbooks"] == [NGINX]
+
+
+def test_shards_split_the_sessions(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(path, shard_count=4)
+    sys_ids = [f"{n:032x}" for n in range(40)]
+    for sys_id in sys_ids:
+        store.save(sys_id, sys_id, "Incident", "waiting", None, [])
+    store.flush()
+
+    by_shard = [{record["sys_id"] for record in store.load_sessions(shard)} for shard in range(4)]
+
+    assert set().union(*by_shard) == set(sys_ids)
+    assert sum(len(shard) for shard in by_shard) == len(sys_ids)
+    for shard, owned in enumerate(by_shard):
+        assert all(store.owns(sys_id, shard) and shard_of(sys_id, 4) == shard for sys_id in owned)
+
+
+def test_deleting_sessions_collects_only_unreferenced_playbooks(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(path)
+    store.save("a" * 32, "INC0010001", "Nginx is down", "choose_or_generate", None, [NGINX, SHARED])
+    store.save("b" * 32, "INC0010002", "Disk full", "choose_or_generate", None, [DISK, SHARED])
+    store.save("c" * 32, "INC0010003", "New incident", "waiting", None, [])
+    store.flush()
+    assert stored_playbooks(path) == {NGINX, DISK, SHARED}
+
+    store.delete("a" * 32)
+    store.flush()
+    assert stored_playbooks(path) == {DISK, SHARED}
+    assert store.load_session("b" * 32)["playbooks"] == [DISK, SHARED]
+
+    # A playbook added in the same flush as a delete is kept
+    store.delete("b" * 32)
+    store.save("c" * 32, "INC0010003", "New incident", "choose_or_generate", None, [SHARED])
+    store.flush()
+    assert stored_playbooks(path) == {SHARED}
+
+    store.delete("c" * 32)
+    store.flush()
+    assert stored_playbooks(path) == set()
@@ -0,0 +1,249 @@
+"""
+FAISS index types for playbook retrieval and the metadata persisted with them.
+
+Supported index types:
+    flat   - exact search (IndexFlatL2 behind an ID map); best for small corpora.
+    ivf    - inverted lists over a trained coarse quantizer; `nprobe` trades
+             recall for latency.
+    hnsw   - graph search; `efSearch` trades recall for latency. Does not
+             support removing vectors, so updates that delete playbooks
+             trigger a full rebuild.
+    ivfpq  - IVF with product-quantized vectors for a much smaller memory
+             footprint at some cost in recall.
+
+Build metadata is written next to the index as JSON so that the retrieval side
+knows which kind of index it is opening and which search defaults to apply.
+"""
+
+import json
+import math
+import os
+import uuid
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ('flat', 'ivf', 'hnsw', 'ivfpq')
+PREFERENCES = ('recall', 'balanced', 'latency', 'memory')
+FLAT_MAX_VECTORS = 10000                     # Below this, exact search is fast enough
+HNSW_M = 32                                  # Graph neighbours per node
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+PQ_BITS = 8
+MIN_POINTS_PER_CENTROID = 39                 # FAISS warns when training with fewer
+MIN_TRAIN_VECTORS = 256                      # Fewer vectors than this are indexed flat instead of trained
+
+
+def meta_path_for(index_path):
+    return f"{index_path}.json"
+
+
+def choose_index_type(n_vectors, preference='balanced'):
+    """
+    Pick an index type for a corpus of `n_vectors` given a recall/latency preference.
+
+    Args:
+        n_vectors (int): Number of vectors that will be indexed.
+        preference (str): One of 'recall', 'balanced', 'latency' or 'memory'.
+
+    Returns:
+        str: One of INDEX_TYPES.
+    """
+    if preference not in PREFERENCES:
+        raise ValueError(f"Unknown index preference '{preference}'. Expected one of {PREFERENCES}.")
+    if n_vectors < FLAT_MAX_VECTORS and preference != 'memory':
+        return 'flat'
+    if preference == 'memory':
+        return 'ivfpq'
+    if preference in ('recall', 'latency'):
+        return 'hnsw'
+    return 'ivf'
+
+
+def build_params(index_type, n_vectors, dimension):
+    """
+    Return construction and default search parameters for an index type sized
+    for `n_vectors` vectors of `dimension` floats.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+    n_vectors = max(n_vectors, 1)
+    params = {}
+    if index_type in ('ivf', 'ivfpq'):
+        nlist = int(4 * math.sqrt(n_vectors))
+        nlist = max(1, min(nlist, 65536, n_vectors // MIN_POINTS_PER_CENTROID or 1))
+        params["nlist"] = nlist
+        params["nprobe"] = max(1, min(nlist, nlist // 16 or 1))
+        params["train_size"] = min(n_vectors, max(nlist * MIN_POINTS_PER_CENTROID, 2 ** 14))
+    if index_type == 'ivfpq':
+        m = next(m for m in (dimension // 8, dimension // 4, dimension // 2, dimension, 1)
+                 if m and dimension % m == 0)
+        params["pq_m"] = m
+        params["pq_bits"] = max(1, min(PQ_BITS, int(math.log2(params["train_size"]))))
+    if index_type == 'hnsw':
+        params["hnsw_m"] = HNSW_M
+        params["ef_construction"] = HNSW_EF_CONSTRUCTION
+        params["ef_search"] = HNSW_EF_SEARCH
+    return params
+
+
+def fit_training_params(index_type, params, n_train):
+    """
+    Shrink IVF and PQ parameters sized from an estimated corpus to what
+    `n_train` training vectors can support.
+    """
+    params = dict(params)
+    if index_type in ('ivf', 'ivfpq'):
+        nlist = max(1, min(params["nlist"], n_train // MIN_POINTS_PER_CENTROID))
+        params["nlist"] = nlist
+        params["nprobe"] = max(1, min(nlist, nlist // 16 or 1))
+        params["train_size"] = n_train
+    if index_type == 'ivfpq':
+        params["pq_bits"] = max(1, min(params["pq_bits"], int(math.log2(n_train))))
+    return params
+
+
+def needs_training(index_type):
+    return index_type in ('ivf', 'ivfpq')
+
+
+def supports_removal(index_type):
+    return index_type != 'hnsw'
+
+
+def new_index(index_type, dimension, params):
+    """
+    Create an empty (possibly untrained) index that accepts explicit ids.
+    """
+    if index_type == 'flat':
+        return faiss.index_factory(dimension, "IDMap2,Flat")
+    if index_type == 'ivf':
+        return faiss.index_factory(dimension, f"IVF{params['nlist']},Flat")
+    if index_type == 'ivfpq':
+        return faiss.index_factory(dimension, f"IVF{params['nlist']},PQ{params['pq_m']}x{params['pq_bits']}")
+    if index_type == 'hnsw':
+        index = faiss.index_factory(dimension, f"IDMap2,HNSW{params['hnsw_m']}")
+        faiss.ParameterSpace().set_index_parameter(index, "efConstruction", params["ef_construction"])
+        return index
+    raise ValueError(f"Unknown index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+
+
+def apply_search_params(index, index_type, nprobe=None, ef_search=None):
+    """
+    Set query-time knobs on a CPU or GPU index. Knobs that do not apply to
+    `index_type` are ignored.
+    """
+    if index_type in ('ivf', 'ivfpq') and nprobe is not None:
+        space = faiss.ParameterSpace() if _is_cpu(index) else faiss.GpuParameterSpace()
+        space.set_index_parameter(index, "nprobe", int(nprobe))
+    if index_type == 'hnsw' and ef_search is not None:
+        faiss.ParameterSpace().set_index_parameter(index, "efSearch", int(ef_search))
+
+
+def _is_cpu(index):
+    return not type(index).__name__.startswith('Gpu')
+
+
+def gpu_compatible(index_type):
+    return index_type != 'hnsw'
+
+
+class VectorIndexBuilder:
+    """
+    Add and remove vectors on an index, training it first when required.
+
+    A new index is sized for `expected_total` vectors, which is only an
+    estimate. Index types that need training buffer the first `train_size`
+    vectors and create the index when training starts, with parameters
+    clamped to the vectors actually buffered. When fewer than
+    MIN_TRAIN_VECTORS arrive, a flat index is built instead, and
+    `index_type` and `params` reflect that.
+    """
+
+    def __init__(self, index_type, expected_total=0, index=None, params=None):
+        self.index_type = index_type
+        self.expected_total = expected_total
+        self.index = index
+        self.params = params or {}
+        self._buffer = []
+        self._buffered = 0
+
+    def add(self, vectors, ids):
+        if self.index is None and not self.params:
+            self.params = build_params(self.index_type, self.expected_total, vectors.shape[1])
+        if self.index is None and not needs_training(self.index_type):
+            self.index = new_index(self.index_type, vectors.shape[1], self.params)
+        if self.index is not None and self.index.is_trained:
+            self.index.add_with_ids(vectors, ids)
+            return
+        self._buffer.append((vectors, ids))
+        self._buffered += vectors.shape[0]
+        if self._buffered >= self.params.get("train_size", 0):
+            self._train_and_flush()
+
+    def remove(self, ids):
+        if self.index is not None and len(ids):
+            self.index.remove_ids(np.asarray(ids, dtype='int64'))
+
+    def _train_and_flush(self):
+        vectors = np.vstack([v for v, _ in self._buffer])
+        ids = np.concatenate([i for _, i in self._buffer])
+        if self.index is None:
+            if vectors.shape[0] < MIN_TRAIN_VECTORS:
+                print(f"Only {vectors.shape[0]} vectors to train on. Building a 'flat' index "
+                      f"instead of '{self.index_type}'.")
+                self.index_type = 'flat'
+                self.params = {}
+            else:
+                self.params = fit_training_params(self.index_type, self.params, vectors.shape[0])
+            self.index = new_index(self.index_type, vectors.shape[1], self.params)
+        if not self.index.is_trained:
+            print(f"Training {self.index_type} index on {vectors.shape[0]} vectors...")
+            self.index.train(vectors)
+        self.index.add_with_ids(vectors, ids)
+        self._buffer = []
+        self._buffered = 0
+
+    def finish(self):
+        """
+        Train on whatever is buffered (for small corpora) and return the index.
+        """
+        if self._buffer:
+            self._train_and_flush()
+        return self.index
+
+
+def write_index_meta(index_path, index_type, params, dimension, ntotal, built_for):
+    """
+    Persist build metadata next to the index.
+
+    `built_for` is the corpus size the index was originally built and trained
+    for; incremental updates carry it forward unchanged. Every write gets a new
+    `generation` token so caches of search results can tell indexes apart.
+    """
+    meta = {
+        "generation": uuid.uuid4().hex,
+        "index_type": index_type,
+        "params": params,
+        "dimension": int(dimension),
+        "ntotal": int(ntotal),
+        "built_for": int(built_for),
+    }
+    tmp_path = f"{meta_path_for(index_path)}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, meta_path_for(index_path))
+    return meta
+
+
+def read_index_meta(index_path):
+    """
+    Read the build metadata of an index. Indexes written before metadata was
+    recorded are reported as exact ('flat') indexes.
+    """
+    path = meta_path_for(index_path)
+    if not os.path.exists(path):
+        stat = os.stat(index_path)
+        return {"index_type": "flat", "params": {}, "generation": f"legacy-{stat.st_mtime_ns}-{stat.st_size}"}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)